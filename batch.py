@@ -0,0 +1,208 @@
+"""
+Headless batch processing of images and projects: flattens layers, rescales and converts them
+into another format. Doesn't import PyQt5 or OpenGL, so it runs on servers without display.
+
+Examples:
+    python3 batch.py "sprites/**/*.png" -o out --scale 4
+    python3 batch.py "*.mgpx" -o out --format png --trim
+    python3 batch.py "photos/*.jpg" -o thumbnails --size 256x --resampling box --jobs 8
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Union
+import magicautils
+from constants import blending as AlphaBlendingModes
+from utils.image_export import export_image
+from utils.image_import import open_image
+from utils.project_file import ProjectFile, PROJECT_EXTENSION
+from utils.rect import unite_rects
+
+RESAMPLING_MODES = ["nearest", "bilinear", "box"]
+
+
+def parse_size(text: str) -> tuple[Union[int, None], Union[int, None]]:
+    """
+    Parses "WIDTHxHEIGHT", where one of sides may be omitted ( f.e. "256x" ) to keep aspect ratio
+    """
+
+    width, separator, height = text.lower().partition("x")
+
+    try:
+        size = (int(width) if width else None, int(height) if height else None)
+    except ValueError:
+        size = None
+
+    if not separator or size is None or size == (None, None) or any(side is not None and side <= 0 for side in size):
+        raise argparse.ArgumentTypeError(f"Expected size as WIDTHxHEIGHT, WIDTHx or xHEIGHT, but got \"{text}\".")
+
+    return size
+
+
+def get_target_size(width: int, height: int, options: argparse.Namespace) -> tuple[int, int]:
+    if options.scale is not None:
+        return max(1, round(width * options.scale)), max(1, round(height * options.scale))
+
+    if options.size is not None:
+        target_width, target_height = options.size
+
+        if target_width is None:
+            target_width = max(1, round(width * target_height / height))
+
+        if target_height is None:
+            target_height = max(1, round(height * target_width / width))
+
+        return target_width, target_height
+
+    return width, height
+
+
+def load_layers(path: str) -> tuple[int, int, list[magicautils.Canvas], list[int]]:
+    if path.lower().endswith(PROJECT_EXTENSION):
+        project = ProjectFile.open(path)
+
+        try:
+            # Project is converted as it looks in its current frame
+            canvases = [project.load_cel(project.current_frame, index)[0] for index in range(len(project.layers))]
+            alpha_blendings = [layer.alpha_blending for layer in project.layers]
+
+            return project.width, project.height, canvases, alpha_blendings
+        finally:
+            project.close()
+
+    canvas = open_image(path)
+
+    return canvas.width, canvas.height, [canvas], [AlphaBlendingModes.OVER]
+
+
+def process_file(path: str, output_path: str, options: argparse.Namespace) -> int:
+    """
+    Converts one file, returns count of processed source pixels. Runs in worker process
+    """
+
+    width, height, canvases, alpha_blendings = load_layers(path)
+    target_width, target_height = get_target_size(width, height, options)
+
+    if (target_width, target_height) != (width, height):
+        for canvas in canvases:
+            canvas.resize(target_width, target_height, True, options.resampling)
+
+    rect = None
+
+    if options.trim:
+        for canvas in canvases:
+            rect = unite_rects(rect, canvas.get_content_rect())
+
+    export_image(output_path, target_width, target_height, canvases, alpha_blendings, rect)
+
+    return width * height
+
+
+def init_worker():
+    # Files are processed in parallel by processes, so each of them renders with one thread
+    magicautils.set_render_threads(1)
+
+
+def find_files(patterns: list[str]) -> list[str]:
+    files = list()
+    found = set()
+
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            if os.path.isfile(path) and path not in found:
+                found.add(path)
+                files.append(path)
+
+    return files
+
+
+def main(arguments: Union[list[str], None] = None) -> int:
+    parser = argparse.ArgumentParser(description="Flatten, rescale and convert images and Magica Pixel projects.")
+    parser.add_argument("patterns", nargs="+", help="input files or glob patterns ( \"**\" matches subdirectories )")
+    parser.add_argument("-o", "--output-dir", required=True, help="directory for converted files")
+    parser.add_argument("-f", "--format", default=None,
+                        help="output extension ( f.e. png ), extension of input image by default, png for projects")
+    sizing = parser.add_mutually_exclusive_group()
+    sizing.add_argument("--size", type=parse_size, default=None, help="output size: WIDTHxHEIGHT, WIDTHx or xHEIGHT")
+    sizing.add_argument("--scale", type=float, default=None, help="output size as multiple of input size")
+    parser.add_argument("--resampling", choices=RESAMPLING_MODES, default="nearest", help="filter used for resizing")
+    parser.add_argument("--trim", action="store_true", help="cut off transparent edges")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+
+    options = parser.parse_args(arguments)
+
+    if options.scale is not None and options.scale <= 0:
+        parser.error("--scale must be positive")
+
+    files = find_files(options.patterns)
+
+    if not files:
+        print("No files found.", file=sys.stderr)
+        return 1
+
+    os.makedirs(options.output_dir, exist_ok=True)
+
+    # Plan output names first, so files with the same name from different directories don't overwrite each other
+    tasks = list()
+    outputs = dict()
+
+    for path in files:
+        name, extension = os.path.splitext(os.path.basename(path))
+
+        if options.format is not None:
+            extension = "." + options.format.lstrip(".").lower()
+        elif extension.lower() == PROJECT_EXTENSION:
+            extension = ".png"
+
+        output_path = os.path.join(options.output_dir, name + extension)
+
+        if output_path in outputs:
+            print(f"{path}: Output {output_path} is also written for {outputs[output_path]}.", file=sys.stderr)
+            return 1
+
+        outputs[output_path] = path
+        tasks.append((path, output_path))
+
+    jobs = max(1, options.jobs)
+    processed = 0
+    failed = 0
+    pixels = 0
+    start_time = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker) as executor:
+        # Only a few files per worker are submitted at once, so memory doesn't grow with count of files
+        pending = dict()
+        next_task = 0
+
+        while next_task < len(tasks) or pending:
+            while next_task < len(tasks) and len(pending) < jobs * 2:
+                path, output_path = tasks[next_task]
+                pending[executor.submit(process_file, path, output_path, options)] = path
+                next_task += 1
+
+            done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                path = pending.pop(future)
+
+                try:
+                    pixels += future.result()
+                    processed += 1
+                except Exception as error:
+                    failed += 1
+                    print(f"{path}: {error}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - start_time
+
+    print(f"Processed {processed} of {len(tasks)} files ( {failed} failed ) in {elapsed:.2f} s: "
+          f"{processed / elapsed:.1f} files/s, {pixels / elapsed / 1e6:.1f} Mpx/s, {jobs} workers.")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
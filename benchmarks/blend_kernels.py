@@ -0,0 +1,77 @@
+"""
+Renders the same random layers with every blend kernel supported by CPU, checks that all
+kernels give identical output and prints rendering time of each one.
+
+Run from the repository root after building magicautils:
+    python benchmarks/blend_kernels.py [width] [height] [layers]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import magicautils
+from magicautils import Canvas
+from constants import blending as AlphaBlendingModes
+
+
+def random_canvas(width: int, height: int) -> Canvas:
+    canvas = Canvas(width, height)
+
+    # Mix fully transparent, opaque and semi-transparent pixels
+    for y in range(height):
+        for x in range(width):
+            alpha = random.choice((0, 255, random.randint(0, 255)))
+            canvas.set_pixel(x, y, (random.randint(0, 255), random.randint(0, 255),
+                                    random.randint(0, 255), alpha))
+
+    return canvas
+
+
+def main():
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    layers = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    random.seed(0)
+
+    # Random pixels are slow to generate from Python, so smoothly scale small random canvases
+    canvases = list()
+
+    for i in range(layers):
+        canvas = random_canvas(64, 64)
+        canvas.resize(width, height, True, "bilinear")
+        canvases.append(canvas)
+
+    alpha_blendings = [random.choice((AlphaBlendingModes.ADD, AlphaBlendingModes.OVER))
+                       for i in range(layers)]
+
+    default_kernel = magicautils.get_blend_kernel()
+    results = dict()
+
+    for kernel in magicautils.get_blend_kernels():
+        magicautils.set_blend_kernel(kernel)
+
+        start = time.perf_counter()
+        results[kernel] = magicautils.render_canvases(width, height, canvases, alpha_blendings)
+        elapsed = time.perf_counter() - start
+
+        print(f"{kernel:>8}: {elapsed * 1000:.2f} ms")
+
+    magicautils.set_blend_kernel(default_kernel)
+
+    reference = results["scalar"]
+
+    for kernel, result in results.items():
+        if result != reference:
+            print(f"{kernel} output differs from scalar one")
+            sys.exit(1)
+
+    print("All kernels give identical output")
+
+
+if __name__ == "__main__":
+    main()
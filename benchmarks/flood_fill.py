@@ -0,0 +1,53 @@
+"""
+Times Canvas.fill() on large open regions and on a region made of thin stripes
+( many short runs ) with different fill modes.
+
+Run from the repository root after building magicautils:
+    python benchmarks/flood_fill.py [size]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from magicautils import Canvas
+
+
+def stripes(size: int) -> Canvas:
+    # Vertical walls with gaps at alternating ends make one long winding region
+    canvas = Canvas(size, size)
+
+    for x in range(1, size, 2):
+        gap = 0 if x % 4 == 1 else size - 1
+        canvas.draw_line(x, 0, x, size - 1, (255, 255, 255, 255))
+        canvas.set_pixel(x, gap, (0, 0, 0, 0))
+
+    return canvas
+
+
+def measure(name: str, canvas: Canvas, *args):
+    start = time.perf_counter()
+    bounds = canvas.fill(0, 0, *args)
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:>28}: {elapsed * 1000:8.2f} ms, bounds {bounds}")
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2048
+    color = (255, 0, 0, 255)
+
+    print(f"{size}x{size} canvas")
+
+    measure("open region", Canvas(size, size), color)
+    measure("open region, 8-connected", Canvas(size, size), color, 0, 8)
+    measure("open region, tolerance 16", Canvas(size, size), color, 16)
+    measure("open region, global", Canvas(size, size), color, 0, 4, True)
+    measure("stripes", stripes(size), color)
+    measure("stripes, 8-connected", stripes(size), color, 0, 8)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Compares loading image pixels into canvas pixel by pixel ( how images were opened before )
+with Canvas.load_bytes() and checks that both ways give the same canvas.
+
+Run from the repository root after building magicautils:
+    python benchmarks/image_import.py [width] [height]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from PIL import Image
+from magicautils import Canvas
+from utils.color_converters import convert
+
+
+def load_per_pixel(canvas: Canvas, im: Image.Image):
+    data = im.load()
+
+    for x in range(im.width):
+        for y in range(im.height):
+            canvas.set_pixel(x, y, convert(data[x, y], im.mode))
+
+
+def load_bulk(canvas: Canvas, im: Image.Image):
+    canvas.load_bytes(im.tobytes(), im.mode, im.getpalette())
+
+
+def main():
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+
+    random.seed(0)
+    im = Image.frombytes("RGBA", (width, height), random.randbytes(width * height * 4))
+
+    # Per-pixel loading supports only these modes
+    for mode in ("RGBA", "RGB"):
+        converted = im.convert(mode)
+
+        per_pixel = Canvas(width, height)
+        bulk = Canvas(width, height)
+
+        start = time.perf_counter()
+        load_per_pixel(per_pixel, converted)
+        per_pixel_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        load_bulk(bulk, converted)
+        bulk_time = time.perf_counter() - start
+
+        if bytes(per_pixel) != bytes(bulk):
+            print(f"{mode}: canvases differ")
+            sys.exit(1)
+
+        print(f"{mode:>5}: per pixel {per_pixel_time * 1000:.1f} ms, "
+              f"load_bytes {bulk_time * 1000:.1f} ms ({per_pixel_time / bulk_time:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Times Canvas.draw_line() on many short lines ( like pen strokes ) and on long lines across
+the canvas, partly outside of it, with different widths and with anti-aliasing.
+Compares one-pixel lines with float stepping, how lines were drawn before.
+Checks that one-pixel lines are continuous and have one pixel per step of the major axis,
+also for lines between very far points, which cross the whole canvas.
+
+Run from the repository root after building magicautils:
+    python benchmarks/line_raster.py [size]
+"""
+
+import functools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from magicautils import Canvas
+
+COLOR = (255, 0, 0, 255)
+
+
+def random_lines(size: int, count: int, length: int, margin: int) -> list[tuple[int, int, int, int]]:
+    lines = list()
+
+    for _ in range(count):
+        x0 = random.randint(-margin, size + margin)
+        y0 = random.randint(-margin, size + margin)
+        lines.append((x0, y0,
+                      x0 + random.randint(-length, length),
+                      y0 + random.randint(-length, length)))
+
+    return lines
+
+
+def draw_line_float(canvas: Canvas, x0: int, y0: int, x1: int, y1: int, color: tuple[int, int, int, int]):
+    # How lines were drawn before: one float pass per axis with bounds check of every pixel. The loop
+    # isn't built into magicautils anymore, so it's ported here and sets pixels one by one
+    if 0 <= x0 < canvas.width and 0 <= y0 < canvas.height:
+        canvas.set_pixel(x0, y0, color)
+
+    if 0 <= x1 < canvas.width and 0 <= y1 < canvas.height:
+        canvas.set_pixel(x1, y1, color)
+
+    for x in range(min(x0, x1), max(x0, x1)):
+        y = round((y1 - y0) * (x - x0) / (x1 - x0) + y0)
+
+        if 0 <= x < canvas.width and 0 <= y < canvas.height:
+            canvas.set_pixel(x, y, color)
+
+    for y in range(min(y0, y1), max(y0, y1)):
+        x = round((x1 - x0) * (y - y0) / (y1 - y0) + x0)
+
+        if 0 <= x < canvas.width and 0 <= y < canvas.height:
+            canvas.set_pixel(x, y, color)
+
+
+def measure(name: str, canvas: Canvas, lines: list[tuple[int, int, int, int]], *args, draw_line=None) -> float:
+    draw_line = canvas.draw_line if draw_line is None else functools.partial(draw_line, canvas)
+    start = time.perf_counter()
+
+    for line in lines:
+        draw_line(*line, COLOR, *args)
+
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:>32}: {elapsed * 1000:8.2f} ms, {elapsed / len(lines) * 1e6:8.3f} us per line")
+
+    return elapsed / len(lines)
+
+
+def check_line(size: int, x0: int, y0: int, x1: int, y1: int) -> bool:
+    canvas = Canvas(size, size)
+    canvas.draw_line(x0, y0, x1, y1, COLOR)
+    pixels = [(x, y) for y in range(size) for x in range(size) if canvas.get_pixel(x, y)[3] != 0]
+
+    # Exactly one pixel per step of the major axis, neighbours touch each other
+    steps = max(abs(x1 - x0), abs(y1 - y0)) + 1
+    major = 0 if abs(x1 - x0) >= abs(y1 - y0) else 1
+    coordinates = sorted(pixel[major] for pixel in pixels)
+
+    return len(pixels) == steps and coordinates == list(range(min(coordinates), min(coordinates) + steps))
+
+
+def check_crossing_line(size: int, x0: int, y0: int, x1: int, y1: int) -> bool:
+    canvas = Canvas(size, size)
+    canvas.draw_line(x0, y0, x1, y1, COLOR)
+    pixels = [(x, y) for y in range(size) for x in range(size) if canvas.get_pixel(x, y)[3] != 0]
+
+    # Line crosses the whole canvas along major axis: one pixel per row or column, neighbours touch each other
+    major = 0 if abs(x1 - x0) >= abs(y1 - y0) else 1
+    pixels.sort(key=lambda pixel: pixel[major])
+
+    return ([pixel[major] for pixel in pixels] == list(range(size)) and
+            all(abs(a[1 - major] - b[1 - major]) <= 1 for a, b in zip(pixels, pixels[1:])))
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2048
+
+    random.seed(0)
+
+    short_lines = random_lines(size, 100000, 4, 0)
+    long_lines = random_lines(size, 2000, size, size // 4)
+
+    print(f"{size}x{size} canvas")
+
+    # Ported float stepping sets pixels one by one from Python, so it gets fewer lines and its time includes
+    # calls of set_pixel(), that the old C++ loop didn't have
+    short_float = measure("short lines, float stepping", Canvas(size, size), short_lines[:10000], draw_line=draw_line_float)
+    long_float = measure("long lines, float stepping", Canvas(size, size), long_lines[:100], draw_line=draw_line_float)
+    short = measure("short lines", Canvas(size, size), short_lines)
+    long = measure("long lines", Canvas(size, size), long_lines)
+
+    print(f"short lines {short_float / short:.0f}x faster, long lines {long_float / long:.0f}x faster")
+
+    try:
+        measure("short lines, width 3", Canvas(size, size), short_lines, 3)
+        measure("long lines, width 3", Canvas(size, size), long_lines, 3)
+        measure("short lines, anti-aliased", Canvas(size, size), short_lines, 1, True)
+        measure("long lines, anti-aliased", Canvas(size, size), long_lines, 1, True)
+    except TypeError:
+        print("draw_line() doesn't support width and anti-aliasing")
+
+    random.seed(1)
+    lines = [tuple(random.randint(0, 31) for _ in range(4)) for _ in range(200)]
+
+    # Far end points, deltas between them don't fit into 32-bit int
+    far_lines = [(-2 ** 30, 5, 2 ** 30, 5), (5, -2 ** 30, 5, 2 ** 30),
+                 (-2 ** 31, 5, 2 ** 31 - 1, 5), (-2 ** 31, -2 ** 31, 2 ** 31 - 1, 2 ** 31 - 1),
+                 (-2 ** 30, 0, 2 ** 30, 31), (0, -2 ** 31, 31, 2 ** 31 - 1),
+                 (2 ** 30 + 15, -2 ** 30 + 16, -2 ** 30 + 15, 2 ** 30 + 16), (2 ** 31 - 1, -2 ** 31 + 32, -2 ** 31 + 32, 2 ** 31 - 1)]
+
+    print(f"one pixel per step: {all(check_line(32, *line) for line in lines)}")
+    print(f"far end points: {all(check_crossing_line(32, *line) for line in far_lines)}")
+
+
+if __name__ == "__main__":
+    main()
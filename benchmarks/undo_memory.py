@@ -0,0 +1,94 @@
+"""
+Compares memory taken by undo history of strokes on one layer when every stroke saves
+full snapshot of layer and when it saves patch of changed region only. Checks that undoing
+and redoing all patches gives the same canvases as snapshots.
+
+Run from the repository root after building magicautils:
+    python benchmarks/undo_memory.py [size] [strokes]
+
+Snapshots keep size * size * 4 bytes per stroke, so large values need a lot of memory.
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from magicautils import Canvas
+from constants import blending as AlphaBlendingModes
+from utils.state_manager import StateManager, StatePatch
+
+
+def random_stroke(size: int) -> list[tuple[int, int]]:
+    x = random.randrange(size)
+    y = random.randrange(size)
+    points = [(x, y)]
+
+    for _ in range(random.randint(2, 10)):
+        x = max(0, min(size - 1, x + random.randint(-32, 32)))
+        y = max(0, min(size - 1, y + random.randint(-32, 32)))
+        points.append((x, y))
+
+    return points
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    strokes = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    random.seed(0)
+
+    canvas = Canvas(size, size)
+    preview = canvas.clone()
+    snapshots = [canvas.clone()]
+    state_manager = StateManager()
+    state_manager.push_state({"canvases": [(canvas.clone(), "Layer", AlphaBlendingModes.OVER)]})
+
+    snapshots_time = 0.0
+    patches_time = 0.0
+
+    for _ in range(strokes):
+        color = tuple(random.randrange(256) for _ in range(3)) + (255,)
+        # Changed region is collected from drawing calls, the way CanvasView.take_changed_rect() does
+        rect = preview.draw_polyline(random_stroke(size), color)
+
+        # Patch, the way MainWidget.draw_to_canvas() saves it
+        start = time.perf_counter()
+        before = canvas.read_region(*rect)
+        preview.copy_content(canvas)
+        state_manager.push_patch(StatePatch(0, rect, before, canvas.read_region(*rect)))
+        patches_time += time.perf_counter() - start
+
+        # Full snapshot
+        start = time.perf_counter()
+        snapshots.append(canvas.clone())
+        snapshots_time += time.perf_counter() - start
+
+    # Snapshots share data with layer, so count every storage once
+    snapshots_memory = len({snapshot.buffer_id for snapshot in snapshots}) * size * size * 4
+    patches_memory = sum(len(patch.before) + len(patch.after) for patch in state_manager.states[1:])
+
+    print(f"{size}x{size} canvas, {strokes} strokes")
+    print(f"   snapshots: {snapshots_memory / 2 ** 20:10.2f} MiB, {snapshots_time * 1000:8.2f} ms")
+    print(f"     patches: {patches_memory / 2 ** 20:10.2f} MiB, {patches_time * 1000:8.2f} ms")
+
+    # Undo everything, then redo everything, comparing with snapshots on the way
+    matches = True
+
+    for index in range(strokes, 0, -1):
+        patch = state_manager.pop_state()
+        canvas.write_region(*patch.rect, patch.after)
+        matches = matches and canvas.get_difference_rect(snapshots[index - 1]) is None
+
+    for index in range(1, strokes + 1):
+        patch = state_manager.recover_last_state()
+        canvas.write_region(*patch.rect, patch.after)
+        matches = matches and canvas.get_difference_rect(snapshots[index]) is None
+
+    print(f"undo and redo match snapshots: {matches}")
+
+
+if __name__ == "__main__":
+    main()
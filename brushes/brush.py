@@ -22,5 +22,13 @@ class Brush:
         :param mouse_state: a dictionary, containing mouse press state, mouse old coordinates,
             current mouse coordinates and start mouse coordinates
         :param current_color: current drawing color
+        :return: changed region of preview canvas. Brushes, that don't draw directly, must return it, so
+            preview can be cleared by restoring this region only
+        """
+        pass
+
+    def end_stroke(self):
+        """
+        Called when mouse is released, so brushes, that keep state between uses, can reset it
         """
         pass
@@ -3,3 +3,4 @@ from brushes.pen_brush import PenBrush
 from brushes.stroke_brush import StrokeBrush
 from brushes.picker_brush import PickerBrush
 from brushes.fill_brush import FillBrush
+from brushes.stamp_brush import StampBrush
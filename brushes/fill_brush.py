@@ -6,6 +6,13 @@ class FillBrush(Brush):
     def __init__(self):
         super().__init__(True)
 
+        # Max difference of every channel from clicked pixel color, that is still filled
+        self.tolerance = 0
+        # 4 - fill through pixel sides only, 8 - through corners too
+        self.connectivity = 4
+        # Replace similar pixels in whole canvas instead of connected area only
+        self.global_fill = False
+
     def use(self, canvas_view, mouse_state, current_color):
         # Keep it here in case we want to add extra functionality to base class
         super().use(canvas_view, mouse_state, current_color)
@@ -13,5 +20,8 @@ class FillBrush(Brush):
         canvas_view.fill(
             mouse_state["current_pos"],
             current_color,
-            0
+            0,
+            self.tolerance,
+            self.connectivity,
+            self.global_fill
         )
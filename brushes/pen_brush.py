@@ -5,6 +5,11 @@ class PenBrush(Brush):
     def __init__(self):
         super().__init__(True)
 
+        # Line width in pixels
+        self.width = 1
+        # Blend edges of line by coverage instead of replacing pixels
+        self.antialiased = False
+
     def use(self, canvas_view, mouse_state, current_color):
         # Keep it here in case we want to add extra functionality to base class
         super().use(canvas_view, mouse_state, current_color)
@@ -12,15 +17,10 @@ class PenBrush(Brush):
         # To prevent "bubbles" we need to draw the line from mouse previous
         # position to mouse current position
         # Otherwise, you'll see "holes"
-        canvas_view.draw_pixel(
-            mouse_state["current_pos"],
-            current_color,
-            0
-        )
-
-        canvas_view.draw_line(
-            mouse_state["prev_pos"],
-            mouse_state["current_pos"],
+        canvas_view.draw_stroke(
+            [mouse_state["prev_pos"], mouse_state["current_pos"]],
             current_color,
-            0
+            0,
+            width=self.width,
+            antialiased=self.antialiased
         )
@@ -0,0 +1,53 @@
+import math
+from brushes.brush import Brush
+
+
+class StampBrush(Brush):
+    def __init__(self):
+        super().__init__(True)
+
+        # Stamp settings, see Canvas.draw_stamps()
+        self.size = 8
+        self.shape = "round"
+        self.opacity = 255
+        self.hardness = 255
+        # Distance between stamps as part of size. Stamps overlap, so stroke looks continuous
+        self.spacing = 0.25
+
+        # Position of mouse at previous use and distance passed since the last stamp, so spacing
+        # is kept between mouse events. None if stroke isn't started
+        self.last_pos = None
+        self.distance = 0.0
+
+    def use(self, canvas_view, mouse_state, current_color):
+        # Keep it here in case we want to add extra functionality to base class
+        super().use(canvas_view, mouse_state, current_color)
+
+        pos = canvas_view.get_canvas_point(mouse_state["current_pos"])
+        points = list()
+
+        if self.last_pos is None:
+            points.append((pos.x(), pos.y()))
+        else:
+            # Place stamps along segment from previous mouse position every "step" pixels.
+            # Only positions are computed here, pixels are blended by native code in one call
+            step = max(1.0, self.size * self.spacing)
+            x0, y0 = self.last_pos.x(), self.last_pos.y()
+            length = math.hypot(pos.x() - x0, pos.y() - y0)
+            offset = step - self.distance
+
+            while offset <= length:
+                points.append((round(x0 + (pos.x() - x0) * offset / length),
+                               round(y0 + (pos.y() - y0) * offset / length)))
+                offset += step
+
+            self.distance = length - (offset - step)
+
+        self.last_pos = pos
+
+        if len(points) > 0:
+            canvas_view.draw_stamps(points, current_color, self.size, self.shape, self.opacity, self.hardness)
+
+    def end_stroke(self):
+        self.last_pos = None
+        self.distance = 0.0
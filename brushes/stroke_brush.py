@@ -5,11 +5,16 @@ class StrokeBrush(Brush):
     def __init__(self):
         super().__init__(False)
 
+        # Line width in pixels
+        self.width = 1
+        # Blend edges of line by coverage instead of replacing pixels
+        self.antialiased = False
+
     def use(self, canvas_view, mouse_state, current_color):
         # Keep it here in case we want to add extra functionality to base class
         super().use(canvas_view, mouse_state, current_color)
 
-        canvas_view.draw_line(
+        return canvas_view.draw_line(
             mouse_state["canvas_start_pos"],
             canvas_view.get_canvas_point(
                 mouse_state["current_pos"]
@@ -17,5 +22,7 @@ class StrokeBrush(Brush):
             current_color,
             0,
             # Do not transform to canvas relative coordinates as they've already been transformed
-            transform_to_canvas_relative_coordinates=False
+            transform_to_canvas_relative_coordinates=False,
+            width=self.width,
+            antialiased=self.antialiased
         )
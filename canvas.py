@@ -29,32 +29,38 @@ class Canvas:
         for i in range(self.width * self.height):
             self.canvas[i] = canvas.canvas[i]
 
-    def draw_line(self, x0: int, y0: int, x1: int, y1: int, color: tuple[int, int, int, int]):
-        # Bresenham's algorithm
-        # If you remove these 2 rows you can get minor bug: sometimes first and last point may not be rendered
-        if x0 >= 0 and x0 < self.width and y0 >= 0 and y0 < self.height:
-            self.set_pixel(x0, y0, color)
+    def draw_line(self, x0: int, y0: int, x1: int, y1: int, color: tuple[int, int, int, int], width: int = 1):
+        # Integer Bresenham's algorithm: line steps by one pixel along the longer axis, and error term
+        # decides when to step along the shorter one, so every step draws exactly one pixel ( or span of "width" pixels )
+        steep = abs(y1 - y0) > abs(x1 - x0)
 
-        if x1 >= 0 and x1 < self.width and y1 >= 0 and y1 < self.height:
-            self.set_pixel(x1, y1, color)
+        if steep:
+            x0, y0, x1, y1 = y0, x0, y1, x1
 
-        for x in range(min(x0, x1), max(x0, x1)):
-            y = round((y1 - y0) / (x1 - x0) * (x - x0) + y0)
+        major_delta = abs(x1 - x0)
+        minor_delta = abs(y1 - y0)
+        major_step = 1 if x1 >= x0 else -1
+        minor_step = 1 if y1 >= y0 else -1
+        major_size, minor_size = (self.height, self.width) if steep else (self.width, self.height)
 
-            if round(x) < 0 or round(x) >= self.width or y < 0 or y >= self.height:
-                continue
+        error = major_delta
+        minor = y0
 
-            # Round coordinates to avoid line thickening in some places
-            self.set_pixel(round(x), round(y), color)
+        for i in range(major_delta + 1):
+            major = x0 + major_step * i
 
-        for y in range(min(y0, y1), max(y0, y1)):
-            x = round((x1 - x0) / (y1 - y0) * (y - y0) + x0)
+            if 0 <= major < major_size:
+                for span_minor in range(max(0, minor - (width - 1) // 2), min(minor_size, minor + width // 2 + 1)):
+                    if steep:
+                        self.set_pixel(span_minor, major, color)
+                    else:
+                        self.set_pixel(major, span_minor, color)
 
-            if x < 0 or x >= self.width or round(y) < 0 or round(y) >= self.height:
-                continue
+            error += 2 * minor_delta
 
-            # Round coordinates to avoid line thickening in some places
-            self.set_pixel(round(x), round(y), color)
+            if error >= 2 * major_delta and major_delta > 0:
+                error -= 2 * major_delta
+                minor += minor_step
 
     def fill(self, x: int, y: int, color: tuple[int, int, int, int]):
         start_color = self.get_pixel(x, y)
@@ -67,7 +73,8 @@ class Canvas:
         self.set_pixel(x, y, color)
 
         while len(pixels) > 0:
-            pixel = pixels.pop(0)
+            # Order of filling doesn't matter, and popping from the end doesn't shift the list
+            pixel = pixels.pop()
 
             if pixel[0] - 1 >= 0:
                 left = (pixel[0] - 1, pixel[1])
@@ -1,14 +1,44 @@
 class Canvas:
+    width: int
+    height: int
+    generation: int
+    buffer_id: int
+    __array_interface__: dict
+
     def __init__(self: Canvas, width: int, height: int) -> None: ...
+    def __buffer__(self: Canvas, flags: int) -> memoryview: ...
 
     def set_pixel(self: Canvas, x: int, y: int, color: tuple[int, int, int, int]) -> None: ...
     def get_pixel(self: Canvas, x: int, y: int) -> tuple[int, int, int, int]: ...
-    def resize(self: Canvas, width: int, height: int, resize_canvas_contents: bool = False, smooth_resize: bool = False) -> None: ...
+    def resize(self: Canvas, width: int, height: int, resize_canvas_contents: bool = False, resampling: str = "nearest") -> None: ...
     def copy_content(self: Canvas, target: Canvas) -> None: ...
-    def draw_line(self: Canvas, x0: int, y0: int, x1: int, y1: int, color: tuple[int, int, int, int]) -> None: ...
-    def fill(self: Canvas, x: int, y: int, color: tuple[int, int, int, int]) -> None: ...
+    def copy_region(self: Canvas, target: Canvas, x: int, y: int, width: int, height: int) -> None: ...
+    def draw_line(self: Canvas, x0: int, y0: int, x1: int, y1: int, color: tuple[int, int, int, int], width: int = 1, antialiased: bool = False) -> tuple[int, int, int, int] | None: ...
+    def draw_polyline(self: Canvas, points: list[tuple[int, int]], color: tuple[int, int, int, int], width: int = 1, antialiased: bool = False) -> tuple[int, int, int, int] | None: ...
+    def draw_stamps(self: Canvas, points: list[tuple[int, int]], color: tuple[int, int, int, int], size: int, shape: str = "round", opacity: int = 255, hardness: int = 255) -> tuple[int, int, int, int] | None: ...
+    def fill(self: Canvas, x: int, y: int, color: tuple[int, int, int, int], tolerance: int = 0, connectivity: int = 4, global_fill: bool = False) -> tuple[int, int, int, int] | None: ...
     def clear(self: Canvas) -> None: ...
+    def load_bytes(self: Canvas, data: bytes, mode: str = "RGBA", palette: bytes | list[int] | None = None) -> None: ...
+    @classmethod
+    def from_bytes(cls, width: int, height: int, data: bytes, mode: str = "RGBA", palette: bytes | list[int] | None = None) -> Canvas: ...
     def clone(self: Canvas) -> Canvas: ...
+    def read_region(self: Canvas, x: int, y: int, width: int, height: int) -> bytes: ...
+    def write_region(self: Canvas, x: int, y: int, width: int, height: int, data: bytes) -> None: ...
+    def get_difference_rect(self: Canvas, other: Canvas) -> tuple[int, int, int, int] | None: ...
+    def get_different_tiles(self: Canvas, other: Canvas) -> list[tuple[int, int, int, int]]: ...
+    def get_content_rect(self: Canvas) -> tuple[int, int, int, int] | None: ...
+    def get_used_tiles(self: Canvas) -> list[tuple[int, int, int, int]]: ...
+    def get_dirty_rect(self: Canvas) -> tuple[int, int, int, int] | None: ...
+    def mark_dirty(self: Canvas, x: int, y: int, width: int, height: int) -> None: ...
+    def reset_dirty_rect(self: Canvas) -> None: ...
 
 
-def render_canvases(width: int, height: int, canvases: list[Canvas], alpha_blendings: list[int], highlight_x: int = -1, highlight_y: int = -1) -> bytes: ...
+def render_canvases(width: int, height: int, canvases: list[Canvas], alpha_blendings: list[int]) -> bytes: ...
+def render_canvases_rect(width: int, height: int, canvases: list[Canvas], alpha_blendings: list[int], x: int, y: int, rect_width: int, rect_height: int) -> bytes: ...
+def render_canvases_into(out: bytearray | memoryview, width: int, height: int, canvases: list[Canvas], alpha_blendings: list[int], x: int = 0, y: int = 0, rect_width: int = -1, rect_height: int = -1) -> None: ...
+def flatten_canvases(target: Canvas, canvases: list[Canvas], alpha_blendings: list[int]) -> None: ...
+def set_render_threads(count: int) -> None: ...
+def get_render_threads() -> int: ...
+def set_blend_kernel(name: str) -> None: ...
+def get_blend_kernel() -> str: ...
+def get_blend_kernels() -> list[str]: ...
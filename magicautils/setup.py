@@ -7,7 +7,7 @@ def main():
           description="MagicaPixel's utils lib",
           author="DungyBug",
           author_email="",
-          ext_modules=[Extension("magicautils", sources=["src/clamp.cpp", "src/lerp.cpp", "src/pixelutils.cpp", "src/canvas.cpp", "src/rendercanvases.cpp", "src/main.cpp"], extra_compile_args=["/std:c++20"])])
+          ext_modules=[Extension("magicautils", sources=["src/clamp.cpp", "src/rect.cpp", "src/lerp.cpp", "src/pixelutils.cpp", "src/pixelformats.cpp", "src/sharedbuffer.cpp", "src/rasterizer.cpp", "src/stamp.cpp", "src/resampler.cpp", "src/canvas.cpp", "src/rendercanvases.cpp", "src/blendkernels.cpp", "src/blendkernels_sse2.cpp", "src/blendkernels_avx2.cpp", "src/blendkernels_neon.cpp", "src/threadpool.cpp", "src/main.cpp"], extra_compile_args=["/std:c++20"])])
 
 
 if __name__ == "__main__":
@@ -1,10 +1,42 @@
 #ifndef ALPHABLENDING_H
 #define ALPHABLENDING_H
 
+#include <string.h>
+
 enum AlphaBlendingMode
 {
     ADD,
     OVER
 };
 
+/*
+Blends "color" with "alpha" ( 0-255, replaces alpha of color ) over straight alpha "pixel".
+*/
+inline void blendPixelOver(unsigned char *pixel, const unsigned char *color, int alpha)
+{
+    if(alpha == 0)
+    {
+        return;
+    }
+
+    if(alpha == 255)
+    {
+        memcpy(pixel, color, 3);
+        pixel[3] = 255;
+        return;
+    }
+
+    // Alphas are multiplied by 255 to keep precision
+    int sourceAlpha = alpha * 255;
+    int destinationAlpha = pixel[3] * (255 - alpha);
+    int outAlpha = sourceAlpha + destinationAlpha;
+
+    for(int i = 0; i < 3; i++)
+    {
+        pixel[i] = (color[i] * sourceAlpha + pixel[i] * destinationAlpha) / outAlpha;
+    }
+
+    pixel[3] = (outAlpha + 127) / 255;
+}
+
 #endif // ALPHABLENDING_H
@@ -0,0 +1,227 @@
+#include <string.h>
+#include "blendkernels.h"
+
+#ifdef BLENDKERNELS_X86
+#if defined(_MSC_VER) && !defined(__clang__)
+#include <intrin.h>
+#include <immintrin.h>
+#endif
+#endif
+
+static void blendRowAddScalar(unsigned short *accumulator, const unsigned char *source, int count)
+{
+    for(int i = 0; i < count * 4; i += 4)
+    {
+        unsigned int a = source[i + 3];
+
+        for(int c = 0; c < 3; c++)
+        {
+            unsigned int value = accumulator[i + c] + source[i + c] * a;
+            accumulator[i + c] = value > ACCUMULATOR_ONE ? ACCUMULATOR_ONE : value;
+        }
+
+        unsigned int value = accumulator[i + 3] + 255 * a;
+        accumulator[i + 3] = value > ACCUMULATOR_ONE ? ACCUMULATOR_ONE : value;
+    }
+}
+
+static void blendRowOverScalar(unsigned short *accumulator, const unsigned char *source, int count)
+{
+    for(int i = 0; i < count * 4; i += 4)
+    {
+        unsigned int a = source[i + 3];
+        unsigned int inverted = 255 - a;
+
+        for(int c = 0; c < 3; c++)
+        {
+            accumulator[i + c] = source[i + c] * a + div255(accumulator[i + c] * inverted);
+        }
+
+        accumulator[i + 3] = 255 * a + div255(accumulator[i + 3] * inverted);
+    }
+}
+
+extern const blendkernels_t scalarBlendKernels = {"scalar", blendRowAddScalar, blendRowOverScalar};
+
+static bool isCPUSupportsAVX2()
+{
+#ifdef BLENDKERNELS_X86
+#if defined(_MSC_VER) && !defined(__clang__)
+    int info[4];
+
+    __cpuid(info, 0);
+
+    if(info[0] < 7)
+        return false;
+
+    __cpuid(info, 1);
+
+    // Check that OS saves AVX registers
+    if(!(info[2] & (1 << 27)) || (_xgetbv(0) & 6) != 6)
+        return false;
+
+    __cpuidex(info, 7, 0);
+
+    return (info[1] & (1 << 5)) != 0;
+#else
+    return __builtin_cpu_supports("avx2");
+#endif
+#else
+    return false;
+#endif
+}
+
+static bool isCPUSupportsSSE2()
+{
+#if defined(__x86_64__) || defined(_M_X64)
+    // SSE2 is a part of x86-64
+    return true;
+#elif defined(BLENDKERNELS_X86)
+#if defined(_MSC_VER) && !defined(__clang__)
+    int info[4];
+
+    __cpuid(info, 1);
+
+    return (info[3] & (1 << 26)) != 0;
+#else
+    return __builtin_cpu_supports("sse2");
+#endif
+#else
+    return false;
+#endif
+}
+
+const blendkernels_t **getSupportedBlendKernels()
+{
+    // Scalar kernels + all SIMD ones + terminating NULL
+    static const blendkernels_t *supported[5] = {NULL};
+
+    if(supported[0] == NULL)
+    {
+        int count = 0;
+
+        supported[count++] = &scalarBlendKernels;
+
+#ifdef BLENDKERNELS_X86
+        if(isCPUSupportsSSE2())
+        {
+            supported[count++] = &sse2BlendKernels;
+        }
+
+        if(isCPUSupportsAVX2())
+        {
+            supported[count++] = &avx2BlendKernels;
+        }
+#endif
+
+#ifdef BLENDKERNELS_NEON
+        supported[count++] = &neonBlendKernels;
+#endif
+    }
+
+    return supported;
+}
+
+static const blendkernels_t *currentBlendKernels = NULL;
+
+const blendkernels_t *getBlendKernels()
+{
+    if(currentBlendKernels == NULL)
+    {
+        const blendkernels_t **supported = getSupportedBlendKernels();
+
+        // The last supported kernels are the fastest
+        for(int i = 0; supported[i] != NULL; i++)
+        {
+            currentBlendKernels = supported[i];
+        }
+    }
+
+    return currentBlendKernels;
+}
+
+bool setBlendKernels(const char *name)
+{
+    const blendkernels_t **supported = getSupportedBlendKernels();
+
+    for(int i = 0; supported[i] != NULL; i++)
+    {
+        if(strcmp(supported[i]->name, name) == 0)
+        {
+            currentBlendKernels = supported[i];
+            return true;
+        }
+    }
+
+    return false;
+}
+
+void premultiplyRow(unsigned short *accumulator, int count)
+{
+    for(int i = 0; i < count * 4; i += 4)
+    {
+        unsigned int a = accumulator[i + 3];
+
+        // Additive color doesn't exceed 1.0, so premultiplied one doesn't exceed alpha
+        for(int c = 0; c < 3; c++)
+        {
+            accumulator[i + c] = (accumulator[i + c] * a + ACCUMULATOR_ONE / 2) / ACCUMULATOR_ONE;
+        }
+    }
+}
+
+void unpremultiplyRow(unsigned short *accumulator, int count)
+{
+    for(int i = 0; i < count * 4; i += 4)
+    {
+        unsigned int a = accumulator[i + 3];
+
+        if(a == 0)
+        {
+            continue;
+        }
+
+        // One division per pixel instead of one per channel. Premultiplied color doesn't exceed alpha,
+        // so result doesn't exceed 1.0
+        unsigned long long scale = ((unsigned long long)ACCUMULATOR_ONE << 32) / a;
+
+        for(int c = 0; c < 3; c++)
+        {
+            accumulator[i + c] = (accumulator[i + c] * scale + (1ull << 31)) >> 32;
+        }
+    }
+}
+
+void finishAdditiveRow(const unsigned short *accumulator, unsigned char *out, int count)
+{
+    // Values are truncated as by the float renderer, that was used before kernels
+    for(int i = 0; i < count * 4; i++)
+    {
+        out[i] = accumulator[i] / 255;
+    }
+}
+
+void finishRow(const unsigned short *accumulator, unsigned char *out, int count)
+{
+    for(int i = 0; i < count * 4; i += 4)
+    {
+        unsigned int a = accumulator[i + 3];
+
+        if(a == 0)
+        {
+            out[i] = 0;
+            out[i + 1] = 0;
+            out[i + 2] = 0;
+            out[i + 3] = 0;
+            continue;
+        }
+
+        // Unpremultiply color. Color channels can't be greater than alpha channel, so result fits into byte
+        for(int c = 0; c < 3; c++)
+        {
+            out[i + c] = (accumulator[i + c] * 255 + a / 2) / a;
+        }
+
+        out[i + 3] = div255(a);
+    }
+}
@@ -0,0 +1,84 @@
+#ifndef BLENDKERNELS_H
+#define BLENDKERNELS_H
+/*
+Row blending kernels used by canvases rendering.
+
+Blending is done into an accumulator row, which keeps 4 unsigned shorts per pixel, where 65025 means 1.0.
+Alpha channel keeps ( alpha * 255 ), color channels keep color in one of two forms:
+    premultiplied   ( color * alpha ), used by OVER
+    additive        ( color * 255 ), that isn't divided by alpha. ADD sums ( color * alpha ) of layers into it,
+                    so additive layers are shown with their color multiplied by their alpha ( f.e. ADD pixel
+                    (255, 0, 0, 128) on empty canvas gives (128, 0, 0, 128) )
+Accumulator is converted between forms when blending mode changes.
+All kernels use the same integer arithmetic and conversions are shared, so they produce identical output.
+*/
+
+#if defined(__x86_64__) || defined(_M_X64) || defined(__i386__) || defined(_M_IX86)
+#define BLENDKERNELS_X86
+#endif
+
+#if defined(__aarch64__) || defined(_M_ARM64) || defined(__ARM_NEON)
+#define BLENDKERNELS_NEON
+#endif
+
+#if defined(_MSC_VER) && !defined(__clang__)
+#define BLENDKERNELS_AVX2_TARGET
+#else
+#define BLENDKERNELS_AVX2_TARGET __attribute__((target("avx2")))
+#endif
+
+// Value of 1.0 in accumulator
+#define ACCUMULATOR_ONE 65025
+
+// Blends "count" pixels of RGBA "source" row into "accumulator" row. ADD expects additive form, OVER expects premultiplied one
+typedef void (*blendrowfunc_t)(unsigned short *accumulator, const unsigned char *source, int count);
+
+struct blendkernels_t {
+    const char *name;
+    blendrowfunc_t add;
+    blendrowfunc_t over;
+};
+
+extern const blendkernels_t scalarBlendKernels;
+
+#ifdef BLENDKERNELS_X86
+extern const blendkernels_t sse2BlendKernels;
+extern const blendkernels_t avx2BlendKernels;
+#endif
+
+#ifdef BLENDKERNELS_NEON
+extern const blendkernels_t neonBlendKernels;
+#endif
+
+// Rounded division by 255, that is used by all kernels
+static inline unsigned int div255(unsigned int x)
+{
+    x += 128;
+    return (x + (x >> 8)) >> 8;
+}
+
+// Returns kernels used for rendering. By default the fastest kernels supported by CPU are used
+const blendkernels_t *getBlendKernels();
+
+/*
+Sets kernels used for rendering by name ( "scalar", "sse2", "avx2" or "neon" ).
+Returns false if kernels with that name are not supported by CPU.
+*/
+bool setBlendKernels(const char *name);
+
+// Returns null-terminated list of kernels supported by CPU, from the slowest to the fastest
+const blendkernels_t **getSupportedBlendKernels();
+
+// Converts "count" pixels of accumulator row in additive form into premultiplied form
+void premultiplyRow(unsigned short *accumulator, int count);
+
+// Converts "count" pixels of accumulator row in premultiplied form into additive form
+void unpremultiplyRow(unsigned short *accumulator, int count);
+
+// Converts "count" pixels of accumulator row in premultiplied form into RGBA row
+void finishRow(const unsigned short *accumulator, unsigned char *out, int count);
+
+// Converts "count" pixels of accumulator row in additive form into RGBA row
+void finishAdditiveRow(const unsigned short *accumulator, unsigned char *out, int count);
+
+#endif // BLENDKERNELS_H
@@ -0,0 +1,84 @@
+#include "blendkernels.h"
+
+#ifdef BLENDKERNELS_X86
+#include <immintrin.h>
+
+/*
+AVX2 version of SSE2 kernels, that blends four pixels at once.
+Functions are compiled for AVX2 without global compiler flags and called only if CPU supports AVX2.
+*/
+
+// Same as premultiply of SSE2 kernels, but for four pixels
+BLENDKERNELS_AVX2_TARGET static inline void premultiply(__m256i source, __m256i *premultiplied, __m256i *inverted)
+{
+    const __m256i colorMask = _mm256_set_epi16(0, -1, -1, -1, 0, -1, -1, -1, 0, -1, -1, -1, 0, -1, -1, -1);
+    const __m256i alphaColor = _mm256_set_epi16(255, 0, 0, 0, 255, 0, 0, 0, 255, 0, 0, 0, 255, 0, 0, 0);
+
+    __m256i alpha = _mm256_shufflehi_epi16(_mm256_shufflelo_epi16(source, _MM_SHUFFLE(3, 3, 3, 3)), _MM_SHUFFLE(3, 3, 3, 3));
+
+    // Alpha channel is premultiplied as 255 * alpha
+    __m256i color = _mm256_or_si256(_mm256_and_si256(source, colorMask), alphaColor);
+
+    *premultiplied = _mm256_mullo_epi16(color, alpha);
+    *inverted = _mm256_sub_epi16(_mm256_set1_epi16(255), alpha);
+}
+
+BLENDKERNELS_AVX2_TARGET static inline __m256i multiplyDiv255(__m256i a, __m256i b)
+{
+    __m256i low = _mm256_mullo_epi16(a, b);
+    __m256i high = _mm256_mulhi_epu16(a, b);
+
+    // Unpacking and packing work inside 128-bit lanes, so channels order is kept
+    __m256i products[2] = {_mm256_unpacklo_epi16(low, high), _mm256_unpackhi_epi16(low, high)};
+
+    for(int i = 0; i < 2; i++)
+    {
+        __m256i x = _mm256_add_epi32(products[i], _mm256_set1_epi32(128));
+        products[i] = _mm256_srli_epi32(_mm256_add_epi32(x, _mm256_srli_epi32(x, 8)), 8);
+    }
+
+    return _mm256_packus_epi32(products[0], products[1]);
+}
+
+BLENDKERNELS_AVX2_TARGET static void blendRowAddAVX2(unsigned short *accumulator, const unsigned char *source, int count)
+{
+    const __m256i one = _mm256_set1_epi16((short)ACCUMULATOR_ONE);
+    int i = 0;
+
+    for(; i + 4 <= count; i += 4)
+    {
+        __m256i premultiplied, inverted;
+
+        premultiply(_mm256_cvtepu8_epi16(_mm_loadu_si128((const __m128i*)(source + i * 4))), &premultiplied, &inverted);
+
+        __m256i value = _mm256_adds_epu16(_mm256_loadu_si256((const __m256i*)(accumulator + i * 4)), premultiplied);
+        value = _mm256_min_epu16(value, one);
+
+        _mm256_storeu_si256((__m256i*)(accumulator + i * 4), value);
+    }
+
+    scalarBlendKernels.add(accumulator + i * 4, source + i * 4, count - i);
+}
+
+BLENDKERNELS_AVX2_TARGET static void blendRowOverAVX2(unsigned short *accumulator, const unsigned char *source, int count)
+{
+    int i = 0;
+
+    for(; i + 4 <= count; i += 4)
+    {
+        __m256i premultiplied, inverted;
+
+        premultiply(_mm256_cvtepu8_epi16(_mm_loadu_si128((const __m128i*)(source + i * 4))), &premultiplied, &inverted);
+
+        __m256i value = _mm256_loadu_si256((const __m256i*)(accumulator + i * 4));
+        value = _mm256_add_epi16(premultiplied, multiplyDiv255(value, inverted));
+
+        _mm256_storeu_si256((__m256i*)(accumulator + i * 4), value);
+    }
+
+    scalarBlendKernels.over(accumulator + i * 4, source + i * 4, count - i);
+}
+
+extern const blendkernels_t avx2BlendKernels = {"avx2", blendRowAddAVX2, blendRowOverAVX2};
+
+#endif
@@ -0,0 +1,81 @@
+#include "blendkernels.h"
+
+#ifdef BLENDKERNELS_NEON
+#include <arm_neon.h>
+
+/*
+Prepares two pixels for blending. "source" keeps two RGBA pixels in 8 shorts.
+Sets "premultiplied" to premultiplied source color and "inverted" to ( 255 - source alpha ) in every channel.
+*/
+static inline void premultiply(uint16x8_t source, uint16x8_t *premultiplied, uint16x8_t *inverted)
+{
+    static const uint16_t colorMaskValues[8] = {0xffff, 0xffff, 0xffff, 0, 0xffff, 0xffff, 0xffff, 0};
+    const uint16x8_t colorMask = vld1q_u16(colorMaskValues);
+    const uint16x8_t maximum = vdupq_n_u16(255);
+
+    uint16x8_t alpha = vcombine_u16(vdup_lane_u16(vget_low_u16(source), 3), vdup_lane_u16(vget_high_u16(source), 3));
+
+    // Alpha channel is premultiplied as 255 * alpha
+    uint16x8_t color = vbslq_u16(colorMask, source, maximum);
+
+    *premultiplied = vmulq_u16(color, alpha);
+    *inverted = vsubq_u16(maximum, alpha);
+}
+
+static inline uint32x4_t div255x4(uint32x4_t x)
+{
+    x = vaddq_u32(x, vdupq_n_u32(128));
+    return vshrq_n_u32(vaddq_u32(x, vshrq_n_u32(x, 8)), 8);
+}
+
+// Returns div255(a * b) for every channel
+static inline uint16x8_t multiplyDiv255(uint16x8_t a, uint16x8_t b)
+{
+    uint32x4_t low = div255x4(vmull_u16(vget_low_u16(a), vget_low_u16(b)));
+    uint32x4_t high = div255x4(vmull_u16(vget_high_u16(a), vget_high_u16(b)));
+
+    return vcombine_u16(vmovn_u32(low), vmovn_u32(high));
+}
+
+static void blendRowAddNEON(unsigned short *accumulator, const unsigned char *source, int count)
+{
+    const uint16x8_t one = vdupq_n_u16(ACCUMULATOR_ONE);
+    int i = 0;
+
+    for(; i + 2 <= count; i += 2)
+    {
+        uint16x8_t premultiplied, inverted;
+
+        premultiply(vmovl_u8(vld1_u8(source + i * 4)), &premultiplied, &inverted);
+
+        uint16x8_t value = vqaddq_u16(vld1q_u16(accumulator + i * 4), premultiplied);
+        value = vminq_u16(value, one);
+
+        vst1q_u16(accumulator + i * 4, value);
+    }
+
+    scalarBlendKernels.add(accumulator + i * 4, source + i * 4, count - i);
+}
+
+static void blendRowOverNEON(unsigned short *accumulator, const unsigned char *source, int count)
+{
+    int i = 0;
+
+    for(; i + 2 <= count; i += 2)
+    {
+        uint16x8_t premultiplied, inverted;
+
+        premultiply(vmovl_u8(vld1_u8(source + i * 4)), &premultiplied, &inverted);
+
+        uint16x8_t value = vld1q_u16(accumulator + i * 4);
+        value = vaddq_u16(premultiplied, multiplyDiv255(value, inverted));
+
+        vst1q_u16(accumulator + i * 4, value);
+    }
+
+    scalarBlendKernels.over(accumulator + i * 4, source + i * 4, count - i);
+}
+
+extern const blendkernels_t neonBlendKernels = {"neon", blendRowAddNEON, blendRowOverNEON};
+
+#endif
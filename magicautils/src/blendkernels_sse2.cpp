@@ -0,0 +1,89 @@
+#include "blendkernels.h"
+
+#ifdef BLENDKERNELS_X86
+#include <emmintrin.h>
+
+/*
+Prepares two pixels for blending. "source" keeps two RGBA pixels in 8 shorts.
+Sets "premultiplied" to premultiplied source color and "inverted" to ( 255 - source alpha ) in every channel.
+*/
+static inline void premultiply(__m128i source, __m128i *premultiplied, __m128i *inverted)
+{
+    const __m128i colorMask = _mm_set_epi16(0, -1, -1, -1, 0, -1, -1, -1);
+    const __m128i alphaColor = _mm_set_epi16(255, 0, 0, 0, 255, 0, 0, 0);
+
+    __m128i alpha = _mm_shufflehi_epi16(_mm_shufflelo_epi16(source, _MM_SHUFFLE(3, 3, 3, 3)), _MM_SHUFFLE(3, 3, 3, 3));
+
+    // Alpha channel is premultiplied as 255 * alpha
+    __m128i color = _mm_or_si128(_mm_and_si128(source, colorMask), alphaColor);
+
+    *premultiplied = _mm_mullo_epi16(color, alpha);
+    *inverted = _mm_sub_epi16(_mm_set1_epi16(255), alpha);
+}
+
+// Returns div255(a * b) for every channel
+static inline __m128i multiplyDiv255(__m128i a, __m128i b)
+{
+    __m128i low = _mm_mullo_epi16(a, b);
+    __m128i high = _mm_mulhi_epu16(a, b);
+
+    __m128i products[2] = {_mm_unpacklo_epi16(low, high), _mm_unpackhi_epi16(low, high)};
+
+    for(int i = 0; i < 2; i++)
+    {
+        __m128i x = _mm_add_epi32(products[i], _mm_set1_epi32(128));
+        x = _mm_srli_epi32(_mm_add_epi32(x, _mm_srli_epi32(x, 8)), 8);
+
+        // SSE2 packs only with signed saturation, so shift range to signed shorts and back
+        products[i] = _mm_sub_epi32(x, _mm_set1_epi32(32768));
+    }
+
+    return _mm_add_epi16(_mm_packs_epi32(products[0], products[1]), _mm_set1_epi16(-32768));
+}
+
+static void blendRowAddSSE2(unsigned short *accumulator, const unsigned char *source, int count)
+{
+    const __m128i zero = _mm_setzero_si128();
+    const __m128i one = _mm_set1_epi16((short)ACCUMULATOR_ONE);
+    int i = 0;
+
+    for(; i + 2 <= count; i += 2)
+    {
+        __m128i premultiplied, inverted;
+
+        premultiply(_mm_unpacklo_epi8(_mm_loadl_epi64((const __m128i*)(source + i * 4)), zero), &premultiplied, &inverted);
+
+        __m128i value = _mm_adds_epu16(_mm_loadu_si128((const __m128i*)(accumulator + i * 4)), premultiplied);
+
+        // min(value, ACCUMULATOR_ONE)
+        value = _mm_sub_epi16(value, _mm_subs_epu16(value, one));
+
+        _mm_storeu_si128((__m128i*)(accumulator + i * 4), value);
+    }
+
+    scalarBlendKernels.add(accumulator + i * 4, source + i * 4, count - i);
+}
+
+static void blendRowOverSSE2(unsigned short *accumulator, const unsigned char *source, int count)
+{
+    const __m128i zero = _mm_setzero_si128();
+    int i = 0;
+
+    for(; i + 2 <= count; i += 2)
+    {
+        __m128i premultiplied, inverted;
+
+        premultiply(_mm_unpacklo_epi8(_mm_loadl_epi64((const __m128i*)(source + i * 4)), zero), &premultiplied, &inverted);
+
+        __m128i value = _mm_loadu_si128((const __m128i*)(accumulator + i * 4));
+        value = _mm_add_epi16(premultiplied, multiplyDiv255(value, inverted));
+
+        _mm_storeu_si128((__m128i*)(accumulator + i * 4), value);
+    }
+
+    scalarBlendKernels.over(accumulator + i * 4, source + i * 4, count - i);
+}
+
+extern const blendkernels_t sse2BlendKernels = {"sse2", blendRowAddSSE2, blendRowOverSSE2};
+
+#endif
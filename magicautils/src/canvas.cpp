@@ -1,11 +1,17 @@
 #include <math.h>
 #include <vector>
 #include <stdlib.h>
+#include <string.h>
 #include "canvas.h"
 #include "vec2.h"
 #include "clamp.h"
 #include "pixelutils.h"
 #include "color.h"
+#include "rect.h"
+#include "pixelformats.h"
+#include "rasterizer.h"
+#include "stamp.h"
+#include "resampler.h"
 
 extern "C"
 {
@@ -17,9 +23,15 @@ PyObject *canvas_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
 
     if (self != NULL)
     {
-        self->data = NULL;
+        // Empty storage, so canvas always has one, even if __init__() wasn't called
+        self->buffer = createSharedBuffer(0, 0);
+        self->data = self->buffer->data;
         self->width = 0;
         self->height = 0;
+        self->dirtyRect = emptyRect();
+        self->generation = 0;
+        self->exports = 0;
+        self->renderLocks = 0;
     }
 
     return (PyObject *)self;
@@ -27,7 +39,7 @@ PyObject *canvas_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
 
 void canvas_dealloc(canvasobject *self)
 {
-    delete[] self->data;
+    releaseSharedBuffer(self->buffer);
 
     Py_TYPE(self)->tp_free((PyObject *)self);
 }
@@ -43,6 +55,12 @@ int canvas_init(canvasobject *self, PyObject *args, PyObject *kwds)
         return -1;
     }
 
+    if(self->exports > 0 || self->renderLocks > 0)
+    {
+        PyErr_SetString(PyExc_BufferError, "Canvas(width: int, height: int): Canvas data is in use ( f.e. by memoryview ), so canvas can't be reinitialized.");
+        return -1;
+    }
+
     // Get variables by keywords if they weren't provided by args
 
     if(width == NULL && PyMapping_HasKeyString(kwds, "width"))
@@ -101,12 +119,9 @@ int canvas_init(canvasobject *self, PyObject *args, PyObject *kwds)
         return -1;
     }
 
-    self->data = new unsigned char [self->width * self->height * 4];
+    setCanvasBuffer(self, createSharedBuffer(self->width, self->height));
 
-    for(unsigned int i = 0; i < self->width * self->height * 4; i++)
-    {
-        self->data[i] = 0;
-    }
+    markCanvasRedraw(self, {0, 0, (int)self->width, (int)self->height});
 
     return 0;
 }
@@ -221,7 +236,9 @@ PyObject *canvas_setPixel(canvasobject *self, PyObject *args)
         return Py_None;
     }
 
+    prepareCanvasWrite(self);
     setPixel(self->data, x, y, self->width, r, g, b, a);
+    markCanvasDirty(self, {x, y, x + 1, y + 1});
 
     Py_INCREF(Py_None);
     return Py_None;
@@ -261,136 +278,93 @@ PyObject *canvas_getPixel(canvasobject *self, PyObject *args)
 
 PyObject *canvas_resize(canvasobject *self, PyObject *args)
 {
+    const char *signature = "Canvas.resize(width: int, height: int, resize_canvas_contents: bool = False, resampling: str = \"nearest\")";
     int width, height;
     bool resizeCanvasContents = false;
-    bool smoothResize = false;
+    const char *resamplingName = "nearest";
 
-    if(!PyArg_ParseTuple(args, "ii|bb", &width, &height, &resizeCanvasContents, &smoothResize))
+    if(!PyArg_ParseTuple(args, "ii|bs", &width, &height, &resizeCanvasContents, &resamplingName))
     {
-        PyErr_SetString(PyExc_TypeError, "Canvas.resize(width: int, height: int, resize_canvas_contents: bool = False, smooth_resize: bool = False): Expected two ints and one boolean.");
+        PyErr_SetString(PyExc_TypeError, "Canvas.resize(width: int, height: int, resize_canvas_contents: bool = False, resampling: str = \"nearest\"): Expected two ints, one boolean and one str.");
         return NULL;
     }
 
-    unsigned char* oldData = self->data;
+    ResampleFilter filter;
+
+    if(strcmp(resamplingName, "nearest") == 0)
+    {
+        filter = ResampleFilter::NEAREST;
+    }
+    else if(strcmp(resamplingName, "bilinear") == 0)
+    {
+        filter = ResampleFilter::BILINEAR;
+    }
+    else if(strcmp(resamplingName, "box") == 0)
+    {
+        filter = ResampleFilter::BOX;
+    }
+    else
+    {
+        char errorMessageBuffer[1024];
 
-    // TODO: Add canvas scaling
+        sprintf(errorMessageBuffer, "%s: \"resampling\" must be \"nearest\", \"bilinear\" or \"box\", but got \"%.100s\".", signature, resamplingName);
 
-    self->data = new unsigned char[width * height * 4];
+        PyErr_SetString(PyExc_ValueError, errorMessageBuffer);
+        return NULL;
+    }
 
-    for(unsigned int i = 0; i < width * height * 4; i++)
+    if(self->exports > 0 || self->renderLocks > 0)
     {
-        self->data[i] = 0;
+        PyErr_SetString(PyExc_BufferError, "Canvas.resize(width: int, height: int, resize_canvas_contents: bool = False, resampling: str = \"nearest\"): Canvas data is in use ( f.e. by rendering in other thread ), so canvas can't be resized.");
+        return NULL;
     }
 
+    // Keep old buffer alive until its content is copied
+    sharedbuffer_t *oldBuffer = retainSharedBuffer(self->buffer);
+    int oldWidth = oldBuffer->width;
+    int oldHeight = oldBuffer->height;
+
+    setCanvasBuffer(self, createSharedBuffer(width, height));
+    self->width = width;
+    self->height = height;
+
     if(resizeCanvasContents)
     {
-        float xScaleFactor = float(self->width) / float(width);
-        float yScaleFactor = float(self->height) / float(height);
+        // Scaling of large images takes a while, so let other Python threads work meanwhile.
+        // Canvas may get other buffer meanwhile ( f.e. by copy_content ), so keep the one we write to alive
+        sharedbuffer_t *newBuffer = retainSharedBuffer(self->buffer);
 
-        // Scale image
-        for(unsigned int x = 0; x < width; x++)
-        {
-            for(unsigned int y = 0; y < height; y++)
-            {
-                // Relative to old canvas coordinates
-                if(smoothResize)
-                {
-                    float scaledX = float(x) * xScaleFactor;
-                    float scaledY = float(y) * yScaleFactor;
-
-                    unsigned int r = 0, g = 0, b = 0, a = 0;
-
-                    // If we scale image down, get average color of pixels
-                    if(xScaleFactor > 1)
-                    {
-                        for(float sx = scaledX; sx < scaledX + xScaleFactor; sx++)
-                        {
-                            color4_t row = {0, 0, 0, 0};
-
-                            if(yScaleFactor > 1)
-                            {
-                                for(float sy = scaledY; sy < scaledY + yScaleFactor; sy++)
-                                {
-                                    color4_t column;
-
-                                    // We can use here usual "getPixel", which would be faster, than getPixelSmoothColor, but for
-                                    // qualitative image scaling we use "getPixelSmoothColor"
-                                    getPixelSmoothColor(oldData, sx, sy, self->width, self->height, &column.r, &column.g, &column.b, &column.a);
-
-                                    row.r += column.r;
-                                    row.g += column.g;
-                                    row.b += column.b;
-                                    row.a += column.a;
-                                }
-
-                                row.r /= ceilf(yScaleFactor);
-                                row.g /= ceilf(yScaleFactor);
-                                row.b /= ceilf(yScaleFactor);
-                                row.a /= ceilf(yScaleFactor);
-                            }
-                            else
-                            {
-                                // We can use here usual "getPixel", which would be faster, than getPixelSmoothColor, but for
-                                // qualitative image scaling we use "getPixelSmoothColor"
-                                getPixelSmoothColor(oldData, sx, scaledY, self->width, self->height, &row.r, &row.g, &row.b, &row.a);
-                            }
-
-                            r += row.r;
-                            g += row.g;
-                            b += row.b;
-                            a += row.a;
-                        }
-
-                        r /= ceilf(xScaleFactor);
-                        g /= ceilf(xScaleFactor);
-                        b /= ceilf(xScaleFactor);
-                        a /= ceilf(xScaleFactor);
-                    }
-                    else
-                    {
-                        // We scale image up, get linearly interpolated color
-                        getPixelSmoothColor(oldData, scaledX, scaledY, self->width, self->height, &r, &g, &b, &a);
-                    }
-
-                    setPixel(self->data, x, y, width, r, g, b, a);
-                }
-                else
-                {
-                    unsigned int scaledX = (unsigned int)(float(x) * xScaleFactor);
-                    unsigned int scaledY = (unsigned int)(float(y) * yScaleFactor);
+        lockCanvas(self);
 
-                    unsigned int r, g, b, a;
+        Py_BEGIN_ALLOW_THREADS
 
-                    getPixel(oldData, (unsigned int)scaledX, (unsigned int)scaledY, self->width, &r, &g, &b, &a);
+        resampleImage(oldBuffer->data, oldWidth, oldHeight, newBuffer->data, width, height, filter);
 
-                    setPixel(self->data, x, y, width, r, g, b, a);
-                }
-            }
-        }
+        Py_END_ALLOW_THREADS
+
+        unlockCanvas(self);
+
+        releaseSharedBuffer(newBuffer);
     }
     else
     {
         // Keep original image in left-top corner
 
         // Clamp content width to avoid writing in out of bounds
-        unsigned int contentWidth = min(self->width, width);
-        unsigned int contentHeight = min(self->height, height);
+        int contentWidth = min(oldWidth, width);
+        int contentHeight = min(oldHeight, height);
 
-        for(unsigned int x = 0; x < contentWidth; x++)
+        for(int y = 0; y < contentHeight; y++)
         {
-            for(unsigned int y = 0; y < contentHeight; y++)
-            {
-                unsigned int r, g, b, a;
-                getPixel(oldData, x, y, self->width, &r, &g, &b, &a);
-                setPixel(self->data, x, y, width, r, g, b, a);
-            }
+            memcpy(self->data + (size_t)y * width * 4, oldBuffer->data + (size_t)y * oldWidth * 4, contentWidth * 4);
         }
     }
 
-    self->width = width;
-    self->height = height;
+    releaseSharedBuffer(oldBuffer);
 
-    delete[] oldData;
+    // Content may be moved or scaled, so find used tiles again
+    updateSharedBufferTiles(self->buffer);
+    markCanvasRedraw(self, {0, 0, width, height});
 
     Py_INCREF(Py_None);
     return Py_None;
@@ -411,16 +385,29 @@ PyObject *canvas_copyContent(canvasobject *self, PyObject *args)
         canvasobject* targetCanvas = (canvasobject*)target;
 
         // Check that width and height are identical to avoid segmentation fault
-        if(targetCanvas->width == self->width && targetCanvas->height == self->height)
+        if(targetCanvas != self && targetCanvas->width == self->width && targetCanvas->height == self->height)
         {
-            // FIXME: Think about effective copying method
-            unsigned int *target = (unsigned int*)targetCanvas->data;
-            unsigned int *data = (unsigned int*)self->data;
-            for(unsigned int i = 0; i < self->width * self->height; i++)
+            if(self->exports == 0 && targetCanvas->exports == 0)
+            {
+                // Share data until one of canvases is changed
+                setCanvasBuffer(targetCanvas, retainSharedBuffer(self->buffer));
+            }
+            else
             {
-                target[i] = data[i];
+                // Data may be changed without the GIL ( f.e. through memoryview ), so it can't be shared
+                prepareCanvasWrite(targetCanvas);
+                memcpy(targetCanvas->data, self->data, self->width * self->height * 4);
+
+                // Tiles of exported target must stay used
+                if(targetCanvas->exports == 0)
+                {
+                    memcpy(targetCanvas->buffer->tiles, self->buffer->tiles, self->buffer->tilesX * self->buffer->tilesY);
+                    targetCanvas->buffer->contentRect = self->buffer->contentRect;
+                    targetCanvas->buffer->contentRectExact = self->buffer->contentRectExact;
+                }
             }
-            // memcpy(targetCanvas->data, self->data, self->width * self->height * 4);
+
+            markCanvasRedraw(targetCanvas, {0, 0, (int)self->width, (int)self->height});
         }
     }
     else
@@ -438,353 +425,1416 @@ PyObject *canvas_copyContent(canvasobject *self, PyObject *args)
     return Py_None;
 }
 
-PyObject *canvas_drawLine(canvasobject *self, PyObject *args)
+PyObject *canvas_copyRegion(canvasobject *self, PyObject *args)
 {
-    int x0 = 0, y0 = 0, x1 = 0, y1 = 0;
-    PyObject *color;
+    PyObject* target;
+    int x, y, width, height;
 
-    if(!PyArg_ParseTuple(args, "iiiiO", &x0, &y0, &x1, &y1, &color))
+    if(!PyArg_ParseTuple(args, "Oiiii", &target, &x, &y, &width, &height))
     {
-        PyErr_SetString(PyExc_TypeError, "Canvas.draw_line(x0: int, y0: int, x1: int, y1: int, color: tuple[int, int, int, int]): Expected four ints and one tuple.");
+        PyErr_SetString(PyExc_TypeError, "Canvas.copy_region(target: Canvas, x: int, y: int, width: int, height: int): Expected canvas and four ints.");
         return NULL;
     }
 
-    unsigned int r = 0, g = 0, b = 0, a = 0;
-
-    if(PyTuple_Check(color))
+    if(!PyCanvas_Check(target))
     {
-        if(PyTuple_GET_SIZE(color) == 4)
-        {
-            PyObject *rObject = PyTuple_GetItem(color, 0);
-            PyObject *gObject = PyTuple_GetItem(color, 1);
-            PyObject *bObject = PyTuple_GetItem(color, 2);
-            PyObject *aObject = PyTuple_GetItem(color, 3);
-
-            if(PyLong_Check(rObject))
-            {
-                r = PyLong_AsLong(rObject);
-            }
-            else
-            {
-                PyTypeObject *type = (PyTypeObject*)PyObject_Type(rObject);
-                char errorMessageBuffer[1024];
-
-                sprintf(errorMessageBuffer, "Canvas.draw_line(x0: int, y0: int, x1: int, y1: int, color: tuple[int, int, int, int]): Expected type \"int\", but got \"%s\".", type->tp_name);
+        PyTypeObject *type = (PyTypeObject*)PyObject_Type(target);
+        char errorMessageBuffer[1024];
 
-                PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
-            }
+        sprintf(errorMessageBuffer, "Canvas.copy_region(target: Canvas, x: int, y: int, width: int, height: int): Expected \"Canvas\", but got \"%s\".", type->tp_name);
 
-            if(PyLong_Check(gObject))
-            {
-                g = PyLong_AsLong(gObject);
-            }
-            else
-            {
-                PyTypeObject *type = (PyTypeObject*)PyObject_Type(gObject);
-                char errorMessageBuffer[1024];
+        PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
+        return NULL;
+    }
 
-                sprintf(errorMessageBuffer, "Canvas.draw_line(x0: int, y0: int, x1: int, y1: int, color: tuple[int, int, int, int]): Expected type \"int\", but got \"%s\".", type->tp_name);
+    canvasobject* targetCanvas = (canvasobject*)target;
 
-                PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
-            }
+    // Copy only part of region, that lies inside both canvases
+    rect_t region = intersectRects({x, y, x + width, y + height}, {0, 0, (int)self->width, (int)self->height});
+    region = intersectRects(region, {0, 0, (int)targetCanvas->width, (int)targetCanvas->height});
 
-            if(PyLong_Check(bObject))
-            {
-                b = PyLong_AsLong(bObject);
-            }
-            else
-            {
-                PyTypeObject *type = (PyTypeObject*)PyObject_Type(bObject);
-                char errorMessageBuffer[1024];
+    if(isRectEmpty(region) || targetCanvas->buffer == self->buffer)
+    {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
 
-                sprintf(errorMessageBuffer, "Canvas.draw_line(x0: int, y0: int, x1: int, y1: int, color: tuple[int, int, int, int]): Expected type \"int\", but got \"%s\".", type->tp_name);
+    prepareCanvasWrite(targetCanvas);
 
-                PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
-            }
+    size_t rowSize = (size_t)(region.x1 - region.x0) * 4;
 
-            if(PyLong_Check(aObject))
-            {
-                a = PyLong_AsLong(aObject);
-            }
-            else
-            {
-                PyTypeObject *type = (PyTypeObject*)PyObject_Type(aObject);
-                char errorMessageBuffer[1024];
+    for(int row = region.y0; row < region.y1; row++)
+    {
+        memcpy(targetCanvas->data + ((size_t)row * targetCanvas->width + region.x0) * 4, self->data + ((size_t)row * self->width + region.x0) * 4, rowSize);
+    }
 
-                sprintf(errorMessageBuffer, "draw_line(x0: int, y0: int, x1: int, y1: int, color: tuple[int, int, int, int]): Expected type \"int\", but got \"%s\".", type->tp_name);
+    markCanvasDirty(targetCanvas, region);
 
-                PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
-            }
-        }
-        else
-        {
-            char errorMessageBuffer[1024];
+    Py_INCREF(Py_None);
+    return Py_None;
+}
 
-            sprintf(errorMessageBuffer, "draw_line(x0: int, y0: int, x1: int, y1: int, color: tuple[int, int, int, int]): Provided \"color\" has length %i, but expected 4.", PySequence_Fast_GET_SIZE(color));
+/*
+Parses "color" sequence of 4 ints into "out", clamping channels to 0-255 range.
+On failure sets python exception with "signature" and returns false.
+*/
+static bool parseColor(const char *signature, PyObject *color, unsigned char *out)
+{
+    char errorMessageBuffer[1024];
+    PyObject *sequence = PySequence_Fast(color, "");
 
-            PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
-            return NULL;
-        }
-    }
-    else
+    if(sequence == NULL)
     {
         PyTypeObject *type = (PyTypeObject*)PyObject_Type(color);
-        char errorMessageBuffer[1024];
 
-        sprintf(errorMessageBuffer, "Canvas.draw_line(x0: int, y0: int, x1: int, y1: int, color: tuple[int, int, int, int]): Expected \"tuple\", but got \"%s\".", type->tp_name);
+        sprintf(errorMessageBuffer, "%s: Expected \"tuple\" in \"color\", but got \"%s\".", signature, type->tp_name);
 
         PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
+        return false;
     }
 
-    r = clamp(r, 0, 255);
-    g = clamp(g, 0, 255);
-    b = clamp(b, 0, 255);
-    a = clamp(a, 0, 255);
-
-    // If you remove these rows you can get minor bug: sometimes first and last point may not be rendered
-    if(x0 >= 0 && x0 < self->width && y0 >= 0 && y0 < self->height)
+    if(PySequence_Fast_GET_SIZE(sequence) != 4)
     {
-        setPixel(self->data, x0, y0, self->width, r, g, b, a);
+        sprintf(errorMessageBuffer, "%s: Provided \"color\" has length %zi, but expected 4.", signature, PySequence_Fast_GET_SIZE(sequence));
+
+        Py_DECREF(sequence);
+
+        PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
+        return false;
     }
 
-    if(x1 >= 0 && x1 < self->width && y1 >= 0 && y1 < self->height)
+    for(int i = 0; i < 4; i++)
     {
-        setPixel(self->data, x1, y1, self->width, r, g, b, a);
-    }
+        PyObject *channel = PySequence_Fast_GET_ITEM(sequence, i);
 
-    // Use Bresenham's algorithm
+        if(!PyLong_Check(channel))
+        {
+            PyTypeObject *type = (PyTypeObject*)PyObject_Type(channel);
 
-    int xStart = min(x0, x1);
-    int xEnd = max(x0, x1);
+            sprintf(errorMessageBuffer, "%s: Expected type \"int\" in \"color\", but got \"%s\".", signature, type->tp_name);
 
-    for(int x = xStart; x < xEnd; x++)
-    {
-        int y = roundf(float(y1 - y0) * float(x - x0) / float(x1 - x0) + float(y0));
+            Py_DECREF(sequence);
+
+            PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
+            return false;
+        }
+
+        long value = PyLong_AsLong(channel);
 
-        if(x < 0 || x >= self->width || y < 0 || y > self->height)
+        // Channel doesn't fit into long
+        if(value == -1 && PyErr_Occurred())
         {
-            continue;
+            Py_DECREF(sequence);
+            return false;
         }
 
-        setPixel(self->data, x, y, self->width, r, g, b, a);
+        // Clamped as long, large values don't fit into int
+        out[i] = (unsigned char)(value < 0 ? 0 : value > 255 ? 255 : value);
     }
 
-    int yStart = min(y0, y1);
-    int yEnd = max(y0, y1);
+    Py_DECREF(sequence);
 
-    for(int y = yStart; y < yEnd; y++)
-    {
-        int x = roundf(float(x1 - x0) * float(y - y0) / float(y1 - y0) + float(x0));
+    return true;
+}
 
-        if(x < 0 || x >= self->width || y < 0 || y > self->height)
-        {
-            continue;
-        }
+/*
+Draws line from (x0, y0) to (x1, y1) with "color" and marks it dirty.
+If "skipStart" is set, first pixel isn't drawn ( f.e. it's the end of previous segment of polyline ).
+Returns bounds of changed pixels ( empty if line lies out of canvas ).
+*/
+static rect_t drawLine(canvasobject *self, int x0, int y0, int x1, int y1, const unsigned char *color, int lineWidth, bool antialiased, bool skipStart)
+{
+    prepareCanvasWrite(self);
 
-        setPixel(self->data, x, y, self->width, r, g, b, a);
-    }
+    // Tiles of pixels are marked by rasterizer, as bounds of long diagonal line cover a lot of untouched tiles
+    rect_t changed = rasterizeLine(self->buffer, x0, y0, x1, y1, color, lineWidth, antialiased, skipStart);
 
-    Py_INCREF(Py_None);
-    return Py_None;
+    markCanvasRedraw(self, changed);
+
+    return changed;
 }
 
-PyObject *canvas_fill(canvasobject *self, PyObject *args)
+PyObject *canvas_drawLine(canvasobject *self, PyObject *args)
 {
-    int x, y;
-    int r = 0, g = 0, b = 0, a = 0;
-    PyObject* color;
+    int x0 = 0, y0 = 0, x1 = 0, y1 = 0;
+    PyObject *color;
+    int lineWidth = 1;
+    int antialiased = 0;
 
-    if(!PyArg_ParseTuple(args, "iiO", &x, &y, &color))
+    if(!PyArg_ParseTuple(args, "iiiiO|ip", &x0, &y0, &x1, &y1, &color, &lineWidth, &antialiased))
     {
-        PyErr_SetString(PyExc_TypeError, "Canvas.fill(x: int, y: int, color: tuple[int, int, int, int]): Expected two ints and one tuple.");
+        PyErr_SetString(PyExc_TypeError, "Canvas.draw_line(x0: int, y0: int, x1: int, y1: int, color: tuple[int, int, int, int], width: int = 1, antialiased: bool = False): Expected four ints, one tuple, optional int and bool.");
         return NULL;
     }
 
-    if(PyTuple_Check(color))
+    unsigned char lineColor[4];
+
+    if(!parseColor("Canvas.draw_line(x0: int, y0: int, x1: int, y1: int, color: tuple[int, int, int, int], width: int = 1, antialiased: bool = False)", color, lineColor))
     {
-        if(PyTuple_GET_SIZE(color) == 4)
-        {
-            PyObject *rObject = PyTuple_GetItem(color, 0);
-            PyObject *gObject = PyTuple_GetItem(color, 1);
-            PyObject *bObject = PyTuple_GetItem(color, 2);
-            PyObject *aObject = PyTuple_GetItem(color, 3);
+        return NULL;
+    }
 
-            if(PyLong_Check(rObject))
-            {
-                r = PyLong_AsLong(rObject);
-            }
-            else
-            {
-                PyTypeObject *type = (PyTypeObject*)PyObject_Type(rObject);
-                char errorMessageBuffer[1024];
+    rect_t changed = drawLine(self, x0, y0, x1, y1, lineColor, lineWidth, antialiased, false);
 
-                sprintf(errorMessageBuffer, "Canvas.fill(x: int, y: int, color: tuple[int, int, int, int]): Expected type \"int\", but got \"%s\".", type->tp_name);
+    if(isRectEmpty(changed))
+    {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
 
-                PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
-            }
+    return Py_BuildValue("iiii", changed.x0, changed.y0, changed.x1 - changed.x0, changed.y1 - changed.y0);
+}
 
-            if(PyLong_Check(gObject))
-            {
-                g = PyLong_AsLong(gObject);
-            }
-            else
-            {
-                PyTypeObject *type = (PyTypeObject*)PyObject_Type(gObject);
-                char errorMessageBuffer[1024];
+/*
+Parses "points" sequence of pairs of ints into "out".
+On failure sets python exception with "signature" and returns false.
+*/
+static bool parsePoints(const char *signature, PyObject *pointsList, std::vector<vec2_t> &out)
+{
+    char errorMessageBuffer[1024];
 
-                sprintf(errorMessageBuffer, "Canvas.fill(x: int, y: int, color: tuple[int, int, int, int]): Expected type \"int\", but got \"%s\".", type->tp_name);
+    sprintf(errorMessageBuffer, "%s: Expected sequence in \"points\".", signature);
 
-                PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
-            }
+    PyObject *points = PySequence_Fast(pointsList, errorMessageBuffer);
 
-            if(PyLong_Check(bObject))
-            {
-                b = PyLong_AsLong(bObject);
-            }
-            else
-            {
-                PyTypeObject *type = (PyTypeObject*)PyObject_Type(bObject);
-                char errorMessageBuffer[1024];
+    if(points == NULL)
+    {
+        return false;
+    }
 
-                sprintf(errorMessageBuffer, "Canvas.fill(x: int, y: int, color: tuple[int, int, int, int]): Expected type \"int\", but got \"%s\".", type->tp_name);
+    for(Py_ssize_t i = 0; i < PySequence_Fast_GET_SIZE(points); i++)
+    {
+        PyObject *point = PySequence_Fast(PySequence_Fast_GET_ITEM(points, i), "");
+        long x = -1, y = -1;
 
-                PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
-            }
+        if(point != NULL && PySequence_Fast_GET_SIZE(point) == 2)
+        {
+            x = PyLong_AsLong(PySequence_Fast_GET_ITEM(point, 0));
+            y = PyLong_AsLong(PySequence_Fast_GET_ITEM(point, 1));
+        }
 
-            if(PyLong_Check(aObject))
-            {
-                a = PyLong_AsLong(aObject);
-            }
-            else
-            {
-                PyTypeObject *type = (PyTypeObject*)PyObject_Type(aObject);
-                char errorMessageBuffer[1024];
+        bool valid = point != NULL && PySequence_Fast_GET_SIZE(point) == 2 && !PyErr_Occurred();
 
-                sprintf(errorMessageBuffer, "Canvas.fill(x: int, y: int, color: tuple[int, int, int, int]): Expected type \"int\", but got \"%s\".", type->tp_name);
+        Py_XDECREF(point);
 
-                PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
-            }
-        }
-        else
+        if(!valid)
         {
-            char errorMessageBuffer[1024];
+            sprintf(errorMessageBuffer, "%s: Point at index %zi isn't a pair of ints.", signature, i);
 
-            sprintf(errorMessageBuffer, "Canvas.fill(x: int, y: int, color: tuple[int, int, int, int]): Provided \"color\" has length %i, but expected 4.", PySequence_Fast_GET_SIZE(color));
+            Py_DECREF(points);
 
+            PyErr_Clear();
             PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
-            return NULL;
+            return false;
         }
+
+        out.push_back({(int)x, (int)y});
     }
-    else
+
+    Py_DECREF(points);
+
+    return true;
+}
+
+PyObject *canvas_drawPolyline(canvasobject *self, PyObject *args)
+{
+    const char *signature = "Canvas.draw_polyline(points: sequence[tuple[int, int]], color: tuple[int, int, int, int], width: int = 1, antialiased: bool = False)";
+    PyObject *pointsList;
+    PyObject *color;
+    unsigned char lineColor[4];
+    int lineWidth = 1;
+    int antialiased = 0;
+
+    if(!PyArg_ParseTuple(args, "OO|ip", &pointsList, &color, &lineWidth, &antialiased))
     {
-        PyTypeObject *type = (PyTypeObject*)PyObject_Type(color);
-        char errorMessageBuffer[1024];
+        PyErr_SetString(PyExc_TypeError, "Canvas.draw_polyline(points: sequence[tuple[int, int]], color: tuple[int, int, int, int], width: int = 1, antialiased: bool = False): Expected sequence of points, one tuple, optional int and bool.");
+        return NULL;
+    }
+
+    if(!parseColor(signature, color, lineColor))
+    {
+        return NULL;
+    }
 
-        sprintf(errorMessageBuffer, "Canvas.fill(x: int, y: int, color: tuple[int, int, int, int]): Expected \"tuple\", but got \"%s\".", type->tp_name);
+    // Parse all points before drawing, so canvas doesn't change if some point is invalid
+    std::vector<vec2_t> vertices;
 
-        PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
+    if(!parsePoints(signature, pointsList, vertices))
+    {
         return NULL;
     }
 
-    r = clamp(r, 0, 255);
-    g = clamp(g, 0, 255);
-    b = clamp(b, 0, 255);
-    a = clamp(a, 0, 255);
+    rect_t changed = emptyRect();
 
-    unsigned int startColor[4] = {0, 0, 0, 0};
+    // Single point is drawn as line of zero length
+    if(vertices.size() == 1)
+    {
+        changed = drawLine(self, vertices[0].x, vertices[0].y, vertices[0].x, vertices[0].y, lineColor, lineWidth, antialiased, false);
+    }
 
-    getPixel(self->data, x, y, self->width, &startColor[0], &startColor[1], &startColor[2], &startColor[3]);
+    for(size_t i = 1; i < vertices.size(); i++)
+    {
+        // Joint pixels are drawn once, so anti-aliased joints aren't blended twice
+        changed = uniteRects(changed, drawLine(self, vertices[i - 1].x, vertices[i - 1].y, vertices[i].x, vertices[i].y, lineColor, lineWidth, antialiased, i > 1));
+    }
 
-    // Check that we don't try to fill area with the same color as area
-    // Without that check we could go in infinite loop
-    if(startColor[0] == r && startColor[1] == g && startColor[2] == b && startColor[3] == a)
+    if(isRectEmpty(changed))
     {
         Py_INCREF(Py_None);
         return Py_None;
     }
 
-    std::vector<vec2_t> pixels;
-
-    pixels.push_back({x, y});
+    return Py_BuildValue("iiii", changed.x0, changed.y0, changed.x1 - changed.x0, changed.y1 - changed.y0);
+}
 
-    setPixel(self->data, x, y, self->width, r, g, b, a);
+PyObject *canvas_drawStamps(canvasobject *self, PyObject *args)
+{
+    const char *signature = "Canvas.draw_stamps(points: sequence[tuple[int, int]], color: tuple[int, int, int, int], size: int, shape: str = \"round\", opacity: int = 255, hardness: int = 255)";
+    PyObject *pointsList;
+    PyObject *color;
+    unsigned char stampColor[4];
+    int size = 1;
+    const char *shapeName = "round";
+    int opacity = 255;
+    int hardness = 255;
 
-    while(pixels.size() > 0)
+    if(!PyArg_ParseTuple(args, "OOi|sii", &pointsList, &color, &size, &shapeName, &opacity, &hardness))
     {
-        vec2_t pixel = pixels.back();
-        pixels.pop_back();
+        PyErr_SetString(PyExc_TypeError, "Canvas.draw_stamps(points: sequence[tuple[int, int]], color: tuple[int, int, int, int], size: int, shape: str = \"round\", opacity: int = 255, hardness: int = 255): Expected sequence of points, one tuple, one int, optional str and two ints.");
+        return NULL;
+    }
 
-        if(pixel.x - 1 >= 0)
+    StampShape shape;
+
+    if(strcmp(shapeName, "round") == 0)
+    {
+        shape = StampShape::ROUND;
+    }
+    else if(strcmp(shapeName, "square") == 0)
+    {
+        shape = StampShape::SQUARE;
+    }
+    else
+    {
+        char errorMessageBuffer[1024];
+
+        sprintf(errorMessageBuffer, "%s: \"shape\" must be \"round\" or \"square\", but got \"%.100s\".", signature, shapeName);
+
+        PyErr_SetString(PyExc_ValueError, errorMessageBuffer);
+        return NULL;
+    }
+
+    if(size < 1 || size > MAX_STAMP_SIZE)
+    {
+        char errorMessageBuffer[1024];
+
+        sprintf(errorMessageBuffer, "%s: \"size\" must be in range from 1 to %i, but got %i.", signature, MAX_STAMP_SIZE, size);
+
+        PyErr_SetString(PyExc_ValueError, errorMessageBuffer);
+        return NULL;
+    }
+
+    if(!parseColor(signature, color, stampColor))
+    {
+        return NULL;
+    }
+
+    // Parse all points before drawing, so canvas doesn't change if some point is invalid
+    std::vector<vec2_t> centers;
+
+    if(!parsePoints(signature, pointsList, centers))
+    {
+        return NULL;
+    }
+
+    opacity = clamp(opacity, 0, 255);
+    hardness = clamp(hardness, 0, 255);
+
+    const stamp_t *stamp = getStamp(size, shape, hardness);
+    rect_t changed = emptyRect();
+
+    prepareCanvasWrite(self);
+
+    for(const vec2_t &center : centers)
+    {
+        changed = uniteRects(changed, drawStamp(self->buffer, stamp, center.x, center.y, stampColor, opacity));
+    }
+
+    // Stamps mark their tiles themselves
+    markCanvasRedraw(self, changed);
+
+    if(isRectEmpty(changed))
+    {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
+    return Py_BuildValue("iiii", changed.x0, changed.y0, changed.x1 - changed.x0, changed.y1 - changed.y0);
+}
+
+// Returns true if every channel of pixel differs from "color" by at most "tolerance"
+static inline bool isColorSimilar(const unsigned char *pixel, const unsigned char *color, int tolerance)
+{
+    return abs(pixel[0] - color[0]) <= tolerance && abs(pixel[1] - color[1]) <= tolerance &&
+           abs(pixel[2] - color[2]) <= tolerance && abs(pixel[3] - color[3]) <= tolerance;
+}
+
+/*
+Set of visited pixels, that keeps TILE_SIZE x TILE_SIZE bits only for tiles with visited pixels,
+so its memory depends on filled area instead of canvas size
+*/
+struct visitedpixels_t {
+    int tilesPerRow = 0;
+    // Row bits of every tile, empty until pixel of tile is visited
+    std::vector<std::vector<unsigned long long>> tiles;
+};
+
+static_assert(TILE_SIZE <= 64, "Row of tile must fit into visitedpixels_t bits");
+
+static void initVisitedPixels(visitedpixels_t &visited, int width, int height)
+{
+    visited.tilesPerRow = (width + TILE_SIZE - 1) / TILE_SIZE;
+    visited.tiles.resize(visited.tilesPerRow * ((height + TILE_SIZE - 1) / TILE_SIZE));
+}
+
+static inline bool isPixelVisited(const visitedpixels_t &visited, int x, int y)
+{
+    const std::vector<unsigned long long> &tile = visited.tiles[(y / TILE_SIZE) * visited.tilesPerRow + x / TILE_SIZE];
+
+    return tile.size() > 0 && (tile[y % TILE_SIZE] >> (x % TILE_SIZE)) & 1;
+}
+
+static inline void setPixelVisited(visitedpixels_t &visited, int x, int y)
+{
+    std::vector<unsigned long long> &tile = visited.tiles[(y / TILE_SIZE) * visited.tilesPerRow + x / TILE_SIZE];
+
+    if(tile.size() == 0)
+    {
+        tile.resize(TILE_SIZE, 0);
+    }
+
+    tile[y % TILE_SIZE] |= 1ull << (x % TILE_SIZE);
+}
+
+/*
+Span flood fill: fills the whole horizontal run of similar pixels at once and remembers only one seed
+for every run in the neighbour rows, so memory usage depends on area shape instead of its size.
+Returns bounds of filled area.
+*/
+static rect_t floodFill(canvasobject *self, int x, int y, const unsigned char *color, int tolerance, bool diagonal)
+{
+    int width = self->width;
+    int height = self->height;
+    unsigned char startColor[4];
+
+    memcpy(startColor, self->data + ((size_t)y * width + x) * 4, 4);
+
+    // Filling area with its own color changes nothing
+    if(tolerance == 0 && memcmp(startColor, color, 4) == 0)
+    {
+        return emptyRect();
+    }
+
+    // Filled pixels are visited ones, unless fill color is similar to start color ( f.e. when tolerance is used ),
+    // then they're tracked separately
+    bool trackVisited = isColorSimilar(color, startColor, tolerance);
+    visitedpixels_t visited;
+
+    if(trackVisited)
+    {
+        initVisitedPixels(visited, width, height);
+    }
+
+    // Returns true if pixel of row at "ny" must be filled
+    auto isFillable = [&](const unsigned char *row, int nx, int ny)
+    {
+        return (!trackVisited || !isPixelVisited(visited, nx, ny)) && isColorSimilar(row + nx * 4, startColor, tolerance);
+    };
+
+    std::vector<vec2_t> seeds;
+    rect_t filled = emptyRect();
+
+    seeds.push_back({x, y});
+
+    while(seeds.size() > 0)
+    {
+        vec2_t seed = seeds.back();
+        seeds.pop_back();
+
+        unsigned char *row = self->data + (size_t)seed.y * width * 4;
+
+        if(!isFillable(row, seed.x, seed.y))
+        {
+            continue;
+        }
+
+        // Find the whole run containing seed
+        int x0 = seed.x;
+        int x1 = seed.x;
+
+        while(x0 > 0 && isFillable(row, x0 - 1, seed.y))
+        {
+            x0--;
+        }
+
+        while(x1 + 1 < width && isFillable(row, x1 + 1, seed.y))
+        {
+            x1++;
+        }
+
+        for(int i = x0; i <= x1; i++)
         {
-            if(comparePixelColor(self->data, pixel.x - 1, pixel.y, self->width, startColor[0], startColor[1], startColor[2], startColor[3]))
+            memcpy(row + i * 4, color, 4);
+
+            if(trackVisited)
             {
-                pixels.push_back({pixel.x - 1, pixel.y});
-                setPixel(self->data, pixel.x - 1, pixel.y, self->width, r, g, b, a);
+                setPixelVisited(visited, i, seed.y);
             }
         }
 
-        if(pixel.x + 1 < self->width)
+        filled = uniteRects(filled, {x0, seed.y, x1 + 1, seed.y + 1});
+        markSharedBufferTiles(self->buffer, {x0, seed.y, x1 + 1, seed.y + 1});
+
+        // Diagonal neighbours of run ends are checked too for 8-connectivity
+        int scanStart = diagonal ? max(x0 - 1, 0) : x0;
+        int scanEnd = diagonal ? min(x1 + 1, width - 1) : x1;
+
+        for(int ny = seed.y - 1; ny <= seed.y + 1; ny += 2)
         {
-            if(comparePixelColor(self->data, pixel.x + 1, pixel.y, self->width, startColor[0], startColor[1], startColor[2], startColor[3]))
+            if(ny < 0 || ny >= height)
+            {
+                continue;
+            }
+
+            unsigned char *neighbourRow = self->data + (size_t)ny * width * 4;
+            bool inRun = false;
+
+            // Push one seed per run of fillable pixels
+            for(int i = scanStart; i <= scanEnd; i++)
             {
-                pixels.push_back({pixel.x + 1, pixel.y});
-                setPixel(self->data, pixel.x + 1, pixel.y, self->width, r, g, b, a);
+                bool fillable = isFillable(neighbourRow, i, ny);
+
+                if(fillable && !inRun)
+                {
+                    seeds.push_back({i, ny});
+                }
+
+                inRun = fillable;
             }
         }
+    }
+
+    return filled;
+}
 
-        if(pixel.y - 1 >= 0)
+// Replaces every pixel similar to pixel (x, y) with "color". Returns bounds of changed pixels
+static rect_t fillSimilar(canvasobject *self, int x, int y, const unsigned char *color, int tolerance)
+{
+    int width = self->width;
+    int height = self->height;
+    unsigned char startColor[4];
+    rect_t filled = emptyRect();
+
+    memcpy(startColor, self->data + ((size_t)y * width + x) * 4, 4);
+
+    // Empty tiles contain only transparent pixels, so they can be skipped if transparent isn't filled
+    const unsigned char transparent[4] = {0, 0, 0, 0};
+    bool fillEmptyTiles = isColorSimilar(transparent, startColor, tolerance) && memcmp(transparent, color, 4) != 0;
+    sharedbuffer_t *buffer = self->buffer;
+
+    for(int py = 0; py < height; py++)
+    {
+        unsigned char *row = self->data + (size_t)py * width * 4;
+        int tileY = py / TILE_SIZE;
+        // Changed pixels of row
+        int x0 = width;
+        int x1 = -1;
+
+        for(int tileX = 0; tileX < (int)buffer->tilesX; tileX++)
         {
-            if(comparePixelColor(self->data, pixel.x, pixel.y - 1, self->width, startColor[0], startColor[1], startColor[2], startColor[3]))
+            if(!fillEmptyTiles && !isSharedBufferTileUsed(buffer, tileX, tileY))
+            {
+                continue;
+            }
+
+            // Changed pixels of tile row
+            int tileX0 = width;
+            int tileX1 = -1;
+
+            for(int px = tileX * TILE_SIZE; px < min((tileX + 1) * TILE_SIZE, width); px++)
+            {
+                if(isColorSimilar(row + px * 4, startColor, tolerance) && memcmp(row + px * 4, color, 4) != 0)
+                {
+                    memcpy(row + px * 4, color, 4);
+                    tileX0 = min(tileX0, px);
+                    tileX1 = px;
+                }
+            }
+
+            if(tileX1 >= 0)
             {
-                pixels.push_back({pixel.x, pixel.y - 1});
-                setPixel(self->data, pixel.x, pixel.y - 1, self->width, r, g, b, a);
+                markSharedBufferTiles(buffer, {tileX0, py, tileX1 + 1, py + 1});
+                x0 = min(x0, tileX0);
+                x1 = tileX1;
             }
         }
 
-        if(pixel.y + 1 < self->height)
+        if(x1 >= 0)
+        {
+            filled = uniteRects(filled, {x0, py, x1 + 1, py + 1});
+        }
+    }
+
+    return filled;
+}
+
+PyObject *canvas_fill(canvasobject *self, PyObject *args)
+{
+    int x, y;
+    int r = 0, g = 0, b = 0, a = 0;
+    int tolerance = 0;
+    int connectivity = 4;
+    int globalFill = false;
+    PyObject* color;
+
+    if(!PyArg_ParseTuple(args, "iiO|iip", &x, &y, &color, &tolerance, &connectivity, &globalFill))
+    {
+        PyErr_SetString(PyExc_TypeError, "Canvas.fill(x: int, y: int, color: tuple[int, int, int, int], tolerance: int = 0, connectivity: int = 4, global_fill: bool = False): Expected two ints, one tuple, two ints and one boolean.");
+        return NULL;
+    }
+
+    if(connectivity != 4 && connectivity != 8)
+    {
+        PyErr_SetString(PyExc_ValueError, "Canvas.fill(x: int, y: int, color: tuple[int, int, int, int], tolerance: int = 0, connectivity: int = 4, global_fill: bool = False): \"connectivity\" must be 4 or 8.");
+        return NULL;
+    }
+
+    if(PyTuple_Check(color))
+    {
+        if(PyTuple_GET_SIZE(color) == 4)
         {
-            if(comparePixelColor(self->data, pixel.x, pixel.y + 1, self->width, startColor[0], startColor[1], startColor[2], startColor[3]))
+            PyObject *rObject = PyTuple_GetItem(color, 0);
+            PyObject *gObject = PyTuple_GetItem(color, 1);
+            PyObject *bObject = PyTuple_GetItem(color, 2);
+            PyObject *aObject = PyTuple_GetItem(color, 3);
+
+            if(PyLong_Check(rObject))
+            {
+                r = PyLong_AsLong(rObject);
+            }
+            else
+            {
+                PyTypeObject *type = (PyTypeObject*)PyObject_Type(rObject);
+                char errorMessageBuffer[1024];
+
+                sprintf(errorMessageBuffer, "Canvas.fill(x: int, y: int, color: tuple[int, int, int, int], tolerance: int = 0, connectivity: int = 4, global_fill: bool = False): Expected type \"int\", but got \"%s\".", type->tp_name);
+
+                PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
+            }
+
+            if(PyLong_Check(gObject))
+            {
+                g = PyLong_AsLong(gObject);
+            }
+            else
+            {
+                PyTypeObject *type = (PyTypeObject*)PyObject_Type(gObject);
+                char errorMessageBuffer[1024];
+
+                sprintf(errorMessageBuffer, "Canvas.fill(x: int, y: int, color: tuple[int, int, int, int], tolerance: int = 0, connectivity: int = 4, global_fill: bool = False): Expected type \"int\", but got \"%s\".", type->tp_name);
+
+                PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
+            }
+
+            if(PyLong_Check(bObject))
+            {
+                b = PyLong_AsLong(bObject);
+            }
+            else
+            {
+                PyTypeObject *type = (PyTypeObject*)PyObject_Type(bObject);
+                char errorMessageBuffer[1024];
+
+                sprintf(errorMessageBuffer, "Canvas.fill(x: int, y: int, color: tuple[int, int, int, int], tolerance: int = 0, connectivity: int = 4, global_fill: bool = False): Expected type \"int\", but got \"%s\".", type->tp_name);
+
+                PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
+            }
+
+            if(PyLong_Check(aObject))
+            {
+                a = PyLong_AsLong(aObject);
+            }
+            else
             {
-                pixels.push_back({pixel.x, pixel.y + 1});
-                setPixel(self->data, pixel.x, pixel.y + 1, self->width, r, g, b, a);
+                PyTypeObject *type = (PyTypeObject*)PyObject_Type(aObject);
+                char errorMessageBuffer[1024];
+
+                sprintf(errorMessageBuffer, "Canvas.fill(x: int, y: int, color: tuple[int, int, int, int], tolerance: int = 0, connectivity: int = 4, global_fill: bool = False): Expected type \"int\", but got \"%s\".", type->tp_name);
+
+                PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
             }
         }
+        else
+        {
+            char errorMessageBuffer[1024];
+
+            sprintf(errorMessageBuffer, "Canvas.fill(x: int, y: int, color: tuple[int, int, int, int], tolerance: int = 0, connectivity: int = 4, global_fill: bool = False): Provided \"color\" has length %i, but expected 4.", PySequence_Fast_GET_SIZE(color));
+
+            PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
+            return NULL;
+        }
+    }
+    else
+    {
+        PyTypeObject *type = (PyTypeObject*)PyObject_Type(color);
+        char errorMessageBuffer[1024];
+
+        sprintf(errorMessageBuffer, "Canvas.fill(x: int, y: int, color: tuple[int, int, int, int], tolerance: int = 0, connectivity: int = 4, global_fill: bool = False): Expected \"tuple\", but got \"%s\".", type->tp_name);
+
+        PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
+        return NULL;
     }
 
-    pixels.clear();
+    r = clamp(r, 0, 255);
+    g = clamp(g, 0, 255);
+    b = clamp(b, 0, 255);
+    a = clamp(a, 0, 255);
+
+    // Nothing to fill outside of canvas
+    if(x < 0 || y < 0 || x >= self->width || y >= self->height)
+    {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
 
-    Py_INCREF(Py_None);
-    return Py_None;
+    prepareCanvasWrite(self);
+
+    unsigned char fillColor[4] = {(unsigned char)r, (unsigned char)g, (unsigned char)b, (unsigned char)a};
+    rect_t filled;
+
+    if(globalFill)
+    {
+        filled = fillSimilar(self, x, y, fillColor, clamp(tolerance, 0, 255));
+    }
+    else
+    {
+        filled = floodFill(self, x, y, fillColor, clamp(tolerance, 0, 255), connectivity == 8);
+    }
+
+    if(isRectEmpty(filled))
+    {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
+    // Tiles are marked by fill functions, as bounds of global fill may cover a lot of untouched tiles
+    markCanvasRedraw(self, filled);
+
+    return Py_BuildValue("iiii", filled.x0, filled.y0, filled.x1 - filled.x0, filled.y1 - filled.y0);
 }
 
 PyObject *canvas_clear(canvasobject *self, PyObject *args)
 {
-    for(unsigned int i = 0; i < self->width * self->height * 4; i++)
+    if(self->exports == 0)
+    {
+        // Don't copy shared data just to overwrite it
+        setCanvasBuffer(self, createSharedBuffer(self->width, self->height));
+    }
+    else
     {
-        self->data[i] = 0;
+        // Tiles are kept, as exported data may be changed without us knowing
+        memset(self->data, 0, self->width * self->height * 4);
     }
 
+    markCanvasRedraw(self, {0, 0, (int)self->width, (int)self->height});
+
     Py_INCREF(Py_None);
     return Py_None;
 }
 
 PyObject *canvas_clone(canvasobject *self, PyObject *args)
 {
-    // Create new Canvas instance
-    PyObject *argsList = Py_BuildValue("ii", self->width, self->height);
-    PyObject *canvasObject = PyObject_CallObject((PyObject*)&canvas_type, argsList);
+    // Create new Canvas instance without allocating its data
+    canvasobject *canvas = (canvasobject*)canvas_new(&canvas_type, NULL, NULL);
 
-    Py_DECREF(argsList);
+    if(canvas == NULL)
+    {
+        return NULL;
+    }
 
-    // Copy content
-    canvasobject *canvas = (canvasobject*)canvasObject;
+    canvas->width = self->width;
+    canvas->height = self->height;
 
-    for(unsigned int i = 0; i < self->width * self->height * 4; i++)
+    if(self->exports == 0)
+    {
+        // Share data until one of canvases is changed, so cloning is cheap
+        setCanvasBuffer(canvas, retainSharedBuffer(self->buffer));
+    }
+    else
     {
-        canvas->data[i] = self->data[i];
+        // Data may be changed without the GIL ( f.e. through memoryview ), so it can't be shared
+        setCanvasBuffer(canvas, copySharedBuffer(self->buffer));
     }
 
-    return canvasObject;
+    markCanvasRedraw(canvas, {0, 0, (int)canvas->width, (int)canvas->height});
+
+    return (PyObject*)canvas;
+}
+
+/*
+Converts "data" in "mode" into canvas pixels. "palette" is None or bytes-like object or sequence of ints with RGB colors.
+On failure sets python exception with "signature" and returns false.
+*/
+static bool loadCanvasBytes(canvasobject *self, const char *signature, Py_buffer *data, const char *mode, PyObject *palette)
+{
+    char errorMessageBuffer[1024];
+    int bytesPerPixel = getModeBytesPerPixel(mode);
+
+    if(bytesPerPixel == 0)
+    {
+        sprintf(errorMessageBuffer, "%s: Unsupported mode \"%.32s\", expected one of \"RGBA\", \"RGB\", \"L\", \"LA\" or \"P\".", signature, mode);
+
+        PyErr_SetString(PyExc_ValueError, errorMessageBuffer);
+        return false;
+    }
+
+    if(data->len != (Py_ssize_t)self->width * self->height * bytesPerPixel)
+    {
+        sprintf(errorMessageBuffer, "%s: \"data\" has length %zi, but expected %zi for %ux%u canvas in \"%s\" mode.", signature, data->len, (Py_ssize_t)self->width * self->height * bytesPerPixel, self->width, self->height, mode);
+
+        PyErr_SetString(PyExc_ValueError, errorMessageBuffer);
+        return false;
+    }
+
+    std::vector<unsigned char> paletteColors;
+
+    if(strcmp(mode, "P") == 0)
+    {
+        if(palette == NULL || palette == Py_None)
+        {
+            sprintf(errorMessageBuffer, "%s: \"palette\" is required in \"P\" mode.", signature);
+
+            PyErr_SetString(PyExc_ValueError, errorMessageBuffer);
+            return false;
+        }
+
+        if(PyObject_CheckBuffer(palette))
+        {
+            Py_buffer paletteBuffer;
+
+            if(PyObject_GetBuffer(palette, &paletteBuffer, PyBUF_SIMPLE) < 0)
+            {
+                return false;
+            }
+
+            paletteColors.assign((unsigned char*)paletteBuffer.buf, (unsigned char*)paletteBuffer.buf + paletteBuffer.len);
+            PyBuffer_Release(&paletteBuffer);
+        }
+        else
+        {
+            // f.e. list returned by PIL's Image.getpalette()
+            PyObject *sequence = PySequence_Fast(palette, "Expected bytes-like object or sequence of ints in \"palette\".");
+
+            if(sequence == NULL)
+            {
+                return false;
+            }
+
+            for(Py_ssize_t i = 0; i < PySequence_Fast_GET_SIZE(sequence); i++)
+            {
+                long value = PyLong_AsLong(PySequence_Fast_GET_ITEM(sequence, i));
+
+                if(value == -1 && PyErr_Occurred())
+                {
+                    Py_DECREF(sequence);
+                    return false;
+                }
+
+                paletteColors.push_back(clamp(value, 0, 255));
+            }
+
+            Py_DECREF(sequence);
+        }
+    }
+
+    prepareCanvasWrite(self);
+    convertToRGBA((unsigned char*)data->buf, mode, self->width * self->height, paletteColors.data(), paletteColors.size() / 3, self->data);
+
+    // Imported images often have large transparent areas
+    updateSharedBufferTiles(self->buffer);
+    markCanvasRedraw(self, {0, 0, (int)self->width, (int)self->height});
+
+    return true;
+}
+
+PyObject *canvas_loadBytes(canvasobject *self, PyObject *args)
+{
+    const char *signature = "Canvas.load_bytes(data: bytes, mode: str = \"RGBA\", palette: bytes | list[int] | None = None)";
+    Py_buffer data;
+    const char *mode = "RGBA";
+    PyObject *palette = NULL;
+
+    if(!PyArg_ParseTuple(args, "y*|sO", &data, &mode, &palette))
+    {
+        PyErr_SetString(PyExc_TypeError, "Canvas.load_bytes(data: bytes, mode: str = \"RGBA\", palette: bytes | list[int] | None = None): Expected bytes-like object, str and palette.");
+        return NULL;
+    }
+
+    bool loaded = loadCanvasBytes(self, signature, &data, mode, palette);
+
+    PyBuffer_Release(&data);
+
+    if(!loaded)
+    {
+        return NULL;
+    }
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+PyObject *canvas_fromBytes(PyTypeObject *type, PyObject *args)
+{
+    const char *signature = "Canvas.from_bytes(width: int, height: int, data: bytes, mode: str = \"RGBA\", palette: bytes | list[int] | None = None)";
+    int width, height;
+    Py_buffer data;
+    const char *mode = "RGBA";
+    PyObject *palette = NULL;
+
+    if(!PyArg_ParseTuple(args, "iiy*|sO", &width, &height, &data, &mode, &palette))
+    {
+        PyErr_SetString(PyExc_TypeError, "Canvas.from_bytes(width: int, height: int, data: bytes, mode: str = \"RGBA\", palette: bytes | list[int] | None = None): Expected two ints, bytes-like object, str and palette.");
+        return NULL;
+    }
+
+    if(width < 0 || height < 0)
+    {
+        PyBuffer_Release(&data);
+
+        PyErr_SetString(PyExc_ValueError, "Canvas.from_bytes(width: int, height: int, data: bytes, mode: str = \"RGBA\", palette: bytes | list[int] | None = None): Canvas size can't be negative.");
+        return NULL;
+    }
+
+    // Create instance of called class, so subclasses get their own instances
+    PyObject *canvas = PyObject_CallFunction((PyObject*)type, "ii", width, height);
+
+    if(canvas == NULL)
+    {
+        PyBuffer_Release(&data);
+        return NULL;
+    }
+
+    bool loaded = loadCanvasBytes((canvasobject*)canvas, signature, &data, mode, palette);
+
+    PyBuffer_Release(&data);
+
+    if(!loaded)
+    {
+        Py_DECREF(canvas);
+        return NULL;
+    }
+
+    return canvas;
+}
+
+// Checks that region lies inside canvas, otherwise raises ValueError
+static bool checkRegion(canvasobject *self, const char *signature, int x, int y, int width, int height)
+{
+    if(width < 0 || height < 0 || x < 0 || y < 0 || x + width > (int)self->width || y + height > (int)self->height)
+    {
+        char errorMessageBuffer[1024];
+
+        sprintf(errorMessageBuffer, "%s: Region (%i, %i, %i, %i) doesn't lie inside %ux%u canvas.", signature, x, y, width, height, self->width, self->height);
+
+        PyErr_SetString(PyExc_ValueError, errorMessageBuffer);
+        return false;
+    }
+
+    return true;
+}
+
+PyObject *canvas_readRegion(canvasobject *self, PyObject *args)
+{
+    int x, y, width, height;
+
+    if(!PyArg_ParseTuple(args, "iiii", &x, &y, &width, &height))
+    {
+        PyErr_SetString(PyExc_TypeError, "Canvas.read_region(x: int, y: int, width: int, height: int): Expected four ints.");
+        return NULL;
+    }
+
+    if(!checkRegion(self, "Canvas.read_region(x: int, y: int, width: int, height: int)", x, y, width, height))
+    {
+        return NULL;
+    }
+
+    PyObject *region = PyBytes_FromStringAndSize(NULL, (Py_ssize_t)width * height * 4);
+
+    if(region == NULL)
+    {
+        return NULL;
+    }
+
+    unsigned char *out = (unsigned char*)PyBytes_AS_STRING(region);
+
+    for(int row = 0; row < height; row++)
+    {
+        memcpy(out + (size_t)row * width * 4, self->data + ((size_t)(y + row) * self->width + x) * 4, (size_t)width * 4);
+    }
+
+    return region;
+}
+
+PyObject *canvas_writeRegion(canvasobject *self, PyObject *args)
+{
+    const char *signature = "Canvas.write_region(x: int, y: int, width: int, height: int, data: bytes)";
+    int x, y, width, height;
+    Py_buffer data;
+
+    if(!PyArg_ParseTuple(args, "iiiiy*", &x, &y, &width, &height, &data))
+    {
+        PyErr_SetString(PyExc_TypeError, "Canvas.write_region(x: int, y: int, width: int, height: int, data: bytes): Expected four ints and bytes-like object.");
+        return NULL;
+    }
+
+    if(!checkRegion(self, signature, x, y, width, height))
+    {
+        PyBuffer_Release(&data);
+        return NULL;
+    }
+
+    if(data.len != (Py_ssize_t)width * height * 4)
+    {
+        char errorMessageBuffer[1024];
+
+        sprintf(errorMessageBuffer, "%s: \"data\" has length %zi, but expected %zi.", signature, data.len, (Py_ssize_t)width * height * 4);
+
+        PyBuffer_Release(&data);
+
+        PyErr_SetString(PyExc_ValueError, errorMessageBuffer);
+        return NULL;
+    }
+
+    prepareCanvasWrite(self);
+
+    const unsigned char *region = (const unsigned char*)data.buf;
+
+    for(int row = 0; row < height; row++)
+    {
+        memcpy(self->data + ((size_t)(y + row) * self->width + x) * 4, region + (size_t)row * width * 4, (size_t)width * 4);
+    }
+
+    PyBuffer_Release(&data);
+
+    markCanvasDirty(self, {x, y, x + width, y + height});
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+/*
+Parses "other" canvas argument of comparing methods, that must have the same size as "self".
+Returns NULL and sets exception on error.
+*/
+static canvasobject *parseOtherCanvas(canvasobject *self, const char *signature, PyObject *args)
+{
+    PyObject *other;
+    char errorMessageBuffer[1024];
+
+    if(!PyArg_ParseTuple(args, "O", &other))
+    {
+        sprintf(errorMessageBuffer, "%s: Expected canvas.", signature);
+
+        PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
+        return NULL;
+    }
+
+    if(!PyCanvas_Check(other))
+    {
+        PyTypeObject *type = (PyTypeObject*)PyObject_Type(other);
+
+        sprintf(errorMessageBuffer, "%s: Expected \"Canvas\", but got \"%s\".", signature, type->tp_name);
+
+        PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
+        return NULL;
+    }
+
+    canvasobject *otherCanvas = (canvasobject*)other;
+
+    if(otherCanvas->width != self->width || otherCanvas->height != self->height)
+    {
+        sprintf(errorMessageBuffer, "%s: \"other\" has size %ux%u, but expected %ux%u.", signature, otherCanvas->width, otherCanvas->height, self->width, self->height);
+
+        PyErr_SetString(PyExc_ValueError, errorMessageBuffer);
+        return NULL;
+    }
+
+    return otherCanvas;
+}
+
+PyObject *canvas_getDifferenceRect(canvasobject *self, PyObject *args)
+{
+    canvasobject *otherCanvas = parseOtherCanvas(self, "Canvas.get_difference_rect(other: Canvas)", args);
+
+    if(otherCanvas == NULL)
+    {
+        return NULL;
+    }
+
+    // Canvases share data, so they're equal
+    if(otherCanvas->buffer == self->buffer)
+    {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
+    int width = self->width;
+    int height = self->height;
+    rect_t difference = emptyRect();
+
+    for(int y = 0; y < height; y++)
+    {
+        const unsigned int *row = (const unsigned int*)(self->data + y * width * 4);
+        const unsigned int *otherRow = (const unsigned int*)(otherCanvas->data + y * width * 4);
+
+        // Most rows are usually unchanged, so compare them at once first
+        if(memcmp(row, otherRow, width * 4) == 0)
+        {
+            continue;
+        }
+
+        int x0 = 0;
+        int x1 = width;
+
+        while(row[x0] == otherRow[x0])
+        {
+            x0++;
+        }
+
+        while(row[x1 - 1] == otherRow[x1 - 1])
+        {
+            x1--;
+        }
+
+        difference = uniteRects(difference, {x0, y, x1, y + 1});
+    }
+
+    if(isRectEmpty(difference))
+    {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
+    return Py_BuildValue("iiii", difference.x0, difference.y0, difference.x1 - difference.x0, difference.y1 - difference.y0);
+}
+
+PyObject *canvas_getDifferentTiles(canvasobject *self, PyObject *args)
+{
+    canvasobject *otherCanvas = parseOtherCanvas(self, "Canvas.get_different_tiles(other: Canvas)", args);
+
+    if(otherCanvas == NULL)
+    {
+        return NULL;
+    }
+
+    PyObject *tiles = PyList_New(0);
+
+    if(tiles == NULL)
+    {
+        return NULL;
+    }
+
+    // Canvases share data, so they're equal
+    if(otherCanvas->buffer == self->buffer)
+    {
+        return tiles;
+    }
+
+    sharedbuffer_t *buffer = self->buffer;
+    sharedbuffer_t *otherBuffer = otherCanvas->buffer;
+
+    for(unsigned int tileY = 0; tileY < buffer->tilesY; tileY++)
+    {
+        for(unsigned int tileX = 0; tileX < buffer->tilesX; tileX++)
+        {
+            // Pixels of unused tiles are (0, 0, 0, 0) in both canvases
+            if(!isSharedBufferTileUsed(buffer, tileX, tileY) && !isSharedBufferTileUsed(otherBuffer, tileX, tileY))
+            {
+                continue;
+            }
+
+            int x = tileX * TILE_SIZE;
+            int y = tileY * TILE_SIZE;
+            int width = x + TILE_SIZE < (int)self->width ? TILE_SIZE : self->width - x;
+            int height = y + TILE_SIZE < (int)self->height ? TILE_SIZE : self->height - y;
+            bool different = false;
+
+            for(int row = y; row < y + height && !different; row++)
+            {
+                size_t offset = ((size_t)row * self->width + x) * 4;
+
+                different = memcmp(self->data + offset, otherCanvas->data + offset, width * 4) != 0;
+            }
+
+            if(!different)
+            {
+                continue;
+            }
+
+            PyObject *tile = Py_BuildValue("iiii", x, y, width, height);
+
+            if(tile == NULL || PyList_Append(tiles, tile) < 0)
+            {
+                Py_XDECREF(tile);
+                Py_DECREF(tiles);
+                return NULL;
+            }
+
+            Py_DECREF(tile);
+        }
+    }
+
+    return tiles;
+}
+
+PyObject *canvas_getContentRect(canvasobject *self, PyObject *args)
+{
+    rect_t rect = getSharedBufferContentRect(self->buffer);
+
+    if(isRectEmpty(rect))
+    {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
+    return Py_BuildValue("iiii", rect.x0, rect.y0, rect.x1 - rect.x0, rect.y1 - rect.y0);
+}
+
+PyObject *canvas_getUsedTiles(canvasobject *self, PyObject *args)
+{
+    sharedbuffer_t *buffer = self->buffer;
+    PyObject *tiles = PyList_New(0);
+
+    if(tiles == NULL)
+    {
+        return NULL;
+    }
+
+    for(unsigned int tileY = 0; tileY < buffer->tilesY; tileY++)
+    {
+        for(unsigned int tileX = 0; tileX < buffer->tilesX; tileX++)
+        {
+            if(!isSharedBufferTileUsed(buffer, tileX, tileY))
+            {
+                continue;
+            }
+
+            // Tiles on right and bottom edges are clipped by canvas bounds
+            int x = tileX * TILE_SIZE;
+            int y = tileY * TILE_SIZE;
+            int width = x + TILE_SIZE < (int)self->width ? TILE_SIZE : self->width - x;
+            int height = y + TILE_SIZE < (int)self->height ? TILE_SIZE : self->height - y;
+
+            PyObject *tile = Py_BuildValue("iiii", x, y, width, height);
+
+            if(tile == NULL || PyList_Append(tiles, tile) < 0)
+            {
+                Py_XDECREF(tile);
+                Py_DECREF(tiles);
+                return NULL;
+            }
+
+            Py_DECREF(tile);
+        }
+    }
+
+    return tiles;
+}
+
+PyObject *canvas_getDirtyRect(canvasobject *self, PyObject *args)
+{
+    rect_t rect = self->dirtyRect;
+
+    if(isRectEmpty(rect))
+    {
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
+    return Py_BuildValue("iiii", rect.x0, rect.y0, rect.x1 - rect.x0, rect.y1 - rect.y0);
+}
+
+PyObject *canvas_markDirty(canvasobject *self, PyObject *args)
+{
+    int x, y, width, height;
+
+    if(!PyArg_ParseTuple(args, "iiii", &x, &y, &width, &height))
+    {
+        PyErr_SetString(PyExc_TypeError, "Canvas.mark_dirty(x: int, y: int, width: int, height: int): Expected four ints.");
+        return NULL;
+    }
+
+    markCanvasDirty(self, {x, y, x + width, y + height});
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+PyObject *canvas_resetDirtyRect(canvasobject *self, PyObject *args)
+{
+    self->dirtyRect = emptyRect();
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+/*
+Exports canvas data as buffer of unsigned bytes with shape ( height, width, 4 ), or as flat buffer if consumer
+doesn't ask for shape. Writable export locks data in place: canvas can't be resized while it exists,
+and whole canvas is marked dirty when it's released. Read-only export holds its own reference to data
+like a clone, so canvas stays untouched and copies data on its next change.
+*/
+int canvas_getBuffer(canvasobject *self, Py_buffer *view, int flags)
+{
+    if(view == NULL)
+    {
+        PyErr_SetString(PyExc_BufferError, "Canvas: NULL view in getbuffer.");
+        return -1;
+    }
+
+    bool writable = (flags & PyBUF_WRITABLE) == PyBUF_WRITABLE;
+
+    if(writable)
+    {
+        // Consumer may write to buffer, so it must not change clones
+        prepareCanvasWrite(self);
+        // Consumer may write to any tile at any moment, so they can't be skipped while buffer is exported
+        markSharedBufferTiles(self->buffer, {0, 0, (int)self->width, (int)self->height});
+    }
+
+    if(writable || self->exports > 0)
+    {
+        // Locked data is changed in place, so read-only export of locked data ( f.e. while other
+        // writable export exists ) shares the lock instead of own reference
+        view->internal = NULL;
+        self->exports++;
+    }
+    else
+    {
+        // Consumer keeps buffer alive, so its data stays valid when canvas gets other buffer
+        view->internal = retainSharedBuffer(self->buffer);
+    }
+
+    self->bufferShape[0] = self->height;
+    self->bufferShape[1] = self->width;
+    self->bufferShape[2] = 4;
+
+    self->bufferStrides[0] = self->width * 4;
+    self->bufferStrides[1] = 4;
+    self->bufferStrides[2] = 1;
+
+    view->obj = (PyObject*)self;
+    view->buf = self->data;
+    view->len = self->width * self->height * 4;
+    view->readonly = writable ? 0 : 1;
+    view->itemsize = 1;
+    view->format = (flags & PyBUF_FORMAT) ? (char*)"B" : NULL;
+    view->ndim = (flags & PyBUF_ND) ? 3 : 1;
+    view->shape = (flags & PyBUF_ND) ? self->bufferShape : NULL;
+    view->strides = (flags & PyBUF_STRIDES) == PyBUF_STRIDES ? self->bufferStrides : NULL;
+    view->suboffsets = NULL;
+
+    Py_INCREF(self);
+
+    return 0;
+}
+
+void canvas_releaseBuffer(canvasobject *self, Py_buffer *view)
+{
+    if(view->internal != NULL)
+    {
+        // Read-only export didn't lock canvas, nothing could be changed through it
+        releaseSharedBuffer((sharedbuffer_t*)view->internal);
+        return;
+    }
+
+    self->exports--;
+
+    // We don't know what was changed through buffer, so consider whole canvas changed and find used tiles again.
+    // Other exports may still write to any tile, so tiles are kept used until the last one is released
+    if(self->exports == 0)
+    {
+        updateSharedBufferTiles(self->buffer);
+    }
+
+    markCanvasRedraw(self, {0, 0, (int)self->width, (int)self->height});
+}
+
+PyObject *canvas_getArrayInterface(canvasobject *self, void *closure)
+{
+    // Data is provided as read-only memoryview, so data stays alive while array that uses it exists
+    PyObject *data = PyMemoryView_FromObject((PyObject*)self);
+
+    if(data == NULL)
+    {
+        return NULL;
+    }
+
+    PyObject *arrayInterface = Py_BuildValue("{s:(III),s:s,s:N,s:i}",
+        "shape", self->height, self->width, 4,
+        "typestr", "|u1",
+        "data", data,
+        "version", 3);
+
+    return arrayInterface;
+}
+
+void lockCanvas(canvasobject *self)
+{
+    Py_INCREF(self);
+    self->renderLocks++;
+}
+
+void unlockCanvas(canvasobject *self)
+{
+    self->renderLocks--;
+    Py_DECREF(self);
+}
+
+PyObject *canvas_getBufferId(canvasobject *self, void *closure)
+{
+    return PyLong_FromVoidPtr(self->buffer);
+}
+
+void setCanvasBuffer(canvasobject *self, sharedbuffer_t *buffer)
+{
+    releaseSharedBuffer(self->buffer);
+
+    self->buffer = buffer;
+    self->data = buffer->data;
+}
+
+void prepareCanvasWrite(canvasobject *self)
+{
+    if(self->buffer->references > 1)
+    {
+        setCanvasBuffer(self, copySharedBuffer(self->buffer));
+    }
+}
+
+void markCanvasDirty(canvasobject *self, rect_t rect)
+{
+    // Pixels of region may be not transparent anymore
+    markSharedBufferTiles(self->buffer, rect);
+    markCanvasRedraw(self, rect);
+}
+
+void markCanvasRedraw(canvasobject *self, rect_t rect)
+{
+    rect = intersectRects(rect, {0, 0, (int)self->width, (int)self->height});
+
+    self->dirtyRect = uniteRects(self->dirtyRect, rect);
+    self->generation++;
 }
 
 }
@@ -3,6 +3,8 @@
 
 #include <Python.h>
 #include <structmember.h>
+#include "rect.h"
+#include "sharedbuffer.h"
 #define PyCanvas_Check(o) PyObject_TypeCheck(o, &canvas_type)
 
 extern "C"
@@ -12,9 +14,25 @@ extern "C"
     typedef struct
     {
         PyObject_HEAD
+        // Pixels storage, that may be shared with clones until one of them is changed ( copy-on-write ).
+        // "data" always points to its content
+        sharedbuffer_t *buffer;
         unsigned char *data;
         unsigned int width;
         unsigned int height;
+        // Region changed since last reset_dirty_rect() call
+        rect_t dirtyRect;
+        // Incremented on every change of canvas content, so equal generations mean unchanged content
+        unsigned long long generation;
+        // Number of writable exports of canvas data ( f.e. writable memoryview ). Data may be changed through them
+        // at any moment, so it can't be reallocated or shared with clones while it's greater than zero.
+        int exports;
+        // Number of users of canvas data, that don't hold the GIL ( f.e. rendering threads ).
+        // They keep references to buffers they use, but canvas still can't be resized or reinitialized meanwhile.
+        int renderLocks;
+        // Shape and strides of exported buffer, see canvas_getBuffer
+        Py_ssize_t bufferShape[3];
+        Py_ssize_t bufferStrides[3];
     } canvasobject;
 
     extern PyObject *canvas_new(PyTypeObject *type, PyObject *args, PyObject *kwds);
@@ -25,10 +43,47 @@ extern "C"
     extern PyObject *canvas_getPixel(canvasobject *self, PyObject *args);
     extern PyObject *canvas_resize(canvasobject *self, PyObject *args);
     extern PyObject *canvas_copyContent(canvasobject *self, PyObject *args);
+    extern PyObject *canvas_copyRegion(canvasobject *self, PyObject *args);
     extern PyObject *canvas_drawLine(canvasobject *self, PyObject *args);
+    extern PyObject *canvas_drawPolyline(canvasobject *self, PyObject *args);
+    extern PyObject *canvas_drawStamps(canvasobject *self, PyObject *args);
     extern PyObject *canvas_fill(canvasobject *self, PyObject *args);
     extern PyObject *canvas_clear(canvasobject *self, PyObject *args);
     extern PyObject *canvas_clone(canvasobject *self, PyObject *args);
+    extern PyObject *canvas_loadBytes(canvasobject *self, PyObject *args);
+    extern PyObject *canvas_fromBytes(PyTypeObject *type, PyObject *args);
+    extern PyObject *canvas_readRegion(canvasobject *self, PyObject *args);
+    extern PyObject *canvas_writeRegion(canvasobject *self, PyObject *args);
+    extern PyObject *canvas_getDifferenceRect(canvasobject *self, PyObject *args);
+    extern PyObject *canvas_getDifferentTiles(canvasobject *self, PyObject *args);
+    extern PyObject *canvas_getContentRect(canvasobject *self, PyObject *args);
+    extern PyObject *canvas_getUsedTiles(canvasobject *self, PyObject *args);
+    extern PyObject *canvas_getDirtyRect(canvasobject *self, PyObject *args);
+    extern PyObject *canvas_markDirty(canvasobject *self, PyObject *args);
+    extern PyObject *canvas_resetDirtyRect(canvasobject *self, PyObject *args);
+
+    extern int canvas_getBuffer(canvasobject *self, Py_buffer *view, int flags);
+    extern void canvas_releaseBuffer(canvasobject *self, Py_buffer *view);
+    extern PyObject *canvas_getArrayInterface(canvasobject *self, void *closure);
+    extern PyObject *canvas_getBufferId(canvasobject *self, void *closure);
+
+    // Replaces canvas storage with "buffer", taking its reference
+    extern void setCanvasBuffer(canvasobject *self, sharedbuffer_t *buffer);
+
+    // Copies canvas data if it's shared with other canvases. Must be called before changing canvas data
+    extern void prepareCanvasWrite(canvasobject *self);
+
+    // Marks region as changed, clipping it to canvas bounds. Tiles of region are marked used
+    extern void markCanvasDirty(canvasobject *self, rect_t rect);
+
+    // Marks region as changed like markCanvasDirty, but doesn't mark tiles. Used when caller
+    // marks tiles itself ( f.e. per pixel ) or when canvas gets other buffer
+    extern void markCanvasRedraw(canvasobject *self, rect_t rect);
+
+    // Keeps canvas alive and its size unchanged while it's used without holding the GIL.
+    // Caller must keep reference to buffer it uses, as canvas may switch to other buffer meanwhile ( copy-on-write )
+    extern void lockCanvas(canvasobject *self);
+    extern void unlockCanvas(canvasobject *self);
 }
 
 #endif // CANVAS_H
@@ -8,6 +8,14 @@ extern "C"
 {
 
 extern PyObject* renderCanvases(PyObject *self, PyObject *args);
+extern PyObject* renderCanvasesRect(PyObject *self, PyObject *args);
+extern PyObject* renderCanvasesInto(PyObject *self, PyObject *args);
+extern PyObject* flattenCanvases(PyObject *self, PyObject *args);
+extern PyObject* setRenderThreads(PyObject *self, PyObject *args);
+extern PyObject* getRenderThreads(PyObject *self, PyObject *args);
+extern PyObject* setBlendKernel(PyObject *self, PyObject *args);
+extern PyObject* getBlendKernel(PyObject *self, PyObject *args);
+extern PyObject* getSupportedBlendKernelsList(PyObject *self, PyObject *args);
 
 }
 
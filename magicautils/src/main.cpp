@@ -1,6 +1,8 @@
 #define PY_SSIZE_T_CLEAN
 #define PY_NO_LINK_LIB
 #include "magicautils.h"
+#include "threadpool.h"
+#include "blendkernels.h"
 
 extern "C"
 {
@@ -12,6 +14,14 @@ extern "C"
 
     static struct PyMethodDef magicautils_methods[] = {
         {"render_canvases", (PyCFunction)renderCanvases,        METH_VARARGS,   PyDoc_STR("magicautils.render_canvases(width: int, height: int, canvases: sequence[Canvas]): Render canvases into bytes raw data.")},
+        {"render_canvases_rect", (PyCFunction)renderCanvasesRect, METH_VARARGS, PyDoc_STR("magicautils.render_canvases_rect(width: int, height: int, canvases: sequence[Canvas], alpha_blendings: sequence[int], x: int, y: int, rect_width: int, rect_height: int): Render only given rect of canvases into bytes raw data.")},
+        {"render_canvases_into", (PyCFunction)renderCanvasesInto, METH_VARARGS, PyDoc_STR("magicautils.render_canvases_into(out: buffer, width: int, height: int, canvases: sequence[Canvas], alpha_blendings: sequence[int], x: int = 0, y: int = 0, rect_width: int = -1, rect_height: int = -1): Render rect of canvases ( whole canvas by default ) into writable buffer, without allocating memory.")},
+        {"flatten_canvases", (PyCFunction)flattenCanvases,      METH_VARARGS,   PyDoc_STR("magicautils.flatten_canvases(target: Canvas, canvases: sequence[Canvas], alpha_blendings: sequence[int]): Render canvases into target canvas.")},
+        {"set_render_threads", (PyCFunction)setRenderThreads,   METH_VARARGS,   PyDoc_STR("magicautils.set_render_threads(count: int): Sets number of threads used for rendering. If count <= 0, number of CPU cores is used.")},
+        {"get_render_threads", (PyCFunction)getRenderThreads,   METH_NOARGS,    PyDoc_STR("magicautils.get_render_threads(): Returns number of threads used for rendering.")},
+        {"set_blend_kernel",   (PyCFunction)setBlendKernel,     METH_VARARGS,   PyDoc_STR("magicautils.set_blend_kernel(name: str): Sets kernel used for blending canvases ( one of magicautils.get_blend_kernels() ).")},
+        {"get_blend_kernel",   (PyCFunction)getBlendKernel,     METH_NOARGS,    PyDoc_STR("magicautils.get_blend_kernel(): Returns name of kernel used for blending canvases.")},
+        {"get_blend_kernels",  (PyCFunction)getSupportedBlendKernelsList, METH_NOARGS, PyDoc_STR("magicautils.get_blend_kernels(): Returns names of blend kernels supported by CPU, from the slowest to the fastest.")},
         {NULL, NULL, 0, NULL}
     };
 
@@ -34,28 +44,58 @@ extern "C"
     static PyMethodDef canvas_methods[] = {
         {"set_pixel",       (PyCFunction)canvas_setPixel,       METH_VARARGS,   PyDoc_STR("Canvas.set_pixel(x: int, y: int, color: tuple[int, int, int, int]): Sets pixel color.")},
         {"get_pixel",       (PyCFunction)canvas_getPixel,       METH_VARARGS,   PyDoc_STR("Canvas.get_pixel(x: int, y: int): Gets pixel color.")},
-        {"resize",          (PyCFunction)canvas_resize,         METH_VARARGS,   PyDoc_STR("Canvas.resize(width: int, height: int, resize_canvas_contents: bool = False, smooth_resize: bool = False): Resizes canvas and scales canvas content if required.")},
-        {"copy_content",    (PyCFunction)canvas_copyContent,    METH_VARARGS,   PyDoc_STR("Canvas.copy_content(target: Canvas): Copies canvas data to target.")},
-        {"draw_line",       (PyCFunction)canvas_drawLine,       METH_VARARGS,   PyDoc_STR("Canvas.draw_line(x0: int, y0: int, x1: int, y1: int, color: tuple[int, int, int, int]): Draws line from (x0, y0) to (x1, y1) with provided color ( color replaces with provided, without any alpha blending ).")},
-        {"fill",            (PyCFunction)canvas_fill,           METH_VARARGS,   PyDoc_STR("Canvas.fill(x: int, y: int, color: tuple[int, int, int, int]): Flood fills starting from point (x, y) with provided color.")},
+        {"resize",          (PyCFunction)canvas_resize,         METH_VARARGS,   PyDoc_STR("Canvas.resize(width: int, height: int, resize_canvas_contents: bool = False, resampling: str = \"nearest\"): Resizes canvas and scales canvas content if required. Content is scaled with \"nearest\" ( nearest neighbour ), \"bilinear\" or \"box\" ( area averaging ) resampling.")},
+        {"copy_content",    (PyCFunction)canvas_copyContent,    METH_VARARGS,   PyDoc_STR("Canvas.copy_content(target: Canvas): Copies canvas data to target. Data is shared until one of canvases is changed.")},
+        {"copy_region",     (PyCFunction)canvas_copyRegion,     METH_VARARGS,   PyDoc_STR("Canvas.copy_region(target: Canvas, x: int, y: int, width: int, height: int): Copies pixels of region to the same region of target. Part of region outside of canvases is ignored.")},
+        {"draw_line",       (PyCFunction)canvas_drawLine,       METH_VARARGS,   PyDoc_STR("Canvas.draw_line(x0: int, y0: int, x1: int, y1: int, color: tuple[int, int, int, int], width: int = 1, antialiased: bool = False): Draws line from (x0, y0) to (x1, y1) with provided color and width in pixels ( color replaces with provided, without any alpha blending, unless line is anti-aliased, then color is blended over edges by coverage ). Returns (x, y, width, height) of changed region or None if line lies out of canvas.")},
+        {"draw_polyline",   (PyCFunction)canvas_drawPolyline,   METH_VARARGS,   PyDoc_STR("Canvas.draw_polyline(points: sequence[tuple[int, int]], color: tuple[int, int, int, int], width: int = 1, antialiased: bool = False): Draws lines between consecutive points ( or one pixel if there is only one point ) like draw_line. Returns (x, y, width, height) of changed region or None if nothing changed.")},
+        {"draw_stamps",     (PyCFunction)canvas_drawStamps,     METH_VARARGS,   PyDoc_STR("Canvas.draw_stamps(points: sequence[tuple[int, int]], color: tuple[int, int, int, int], size: int, shape: str = \"round\", opacity: int = 255, hardness: int = 255): Blends \"round\" or \"square\" brush stamp of size x size pixels centered at every point over canvas with provided color and opacity. Hardness is part of stamp radius, where color isn't faded. Returns (x, y, width, height) of changed region or None if nothing changed.")},
+        {"fill",            (PyCFunction)canvas_fill,           METH_VARARGS,   PyDoc_STR("Canvas.fill(x: int, y: int, color: tuple[int, int, int, int], tolerance: int = 0, connectivity: int = 4, global_fill: bool = False): Flood fills area of pixels similar to pixel (x, y) ( every channel differs by at most tolerance ) with provided color. Area is connected through pixel sides if connectivity is 4 and through corners too if it's 8. If global_fill is True, all similar pixels of canvas are filled. Returns (x, y, width, height) of filled area or None if nothing changed.")},
         {"clear",           (PyCFunction)canvas_clear,          METH_NOARGS,    PyDoc_STR("Canvas.clear(): Clears canvas image data with color (0, 0, 0, 0).")},
-        {"clone",           (PyCFunction)canvas_clone,          METH_NOARGS,    PyDoc_STR("Canvas.clone(): Creates new instance of canvas and copies data to it.")},
+        {"clone",           (PyCFunction)canvas_clone,          METH_NOARGS,    PyDoc_STR("Canvas.clone(): Creates new instance of canvas, that shares data with this canvas until one of them is changed.")},
+        {"load_bytes",      (PyCFunction)canvas_loadBytes,      METH_VARARGS,   PyDoc_STR("Canvas.load_bytes(data: bytes, mode: str = \"RGBA\", palette: bytes | list[int] | None = None): Replaces canvas pixels with raw data in \"RGBA\", \"RGB\", \"L\", \"LA\" or \"P\" mode. \"P\" mode requires palette of RGB colors.")},
+        {"from_bytes",      (PyCFunction)canvas_fromBytes,      METH_VARARGS | METH_CLASS, PyDoc_STR("Canvas.from_bytes(width: int, height: int, data: bytes, mode: str = \"RGBA\", palette: bytes | list[int] | None = None): Creates canvas from raw data, see Canvas.load_bytes().")},
+        {"read_region",     (PyCFunction)canvas_readRegion,     METH_VARARGS,   PyDoc_STR("Canvas.read_region(x: int, y: int, width: int, height: int): Returns pixels of region as RGBA bytes.")},
+        {"write_region",    (PyCFunction)canvas_writeRegion,    METH_VARARGS,   PyDoc_STR("Canvas.write_region(x: int, y: int, width: int, height: int, data: bytes): Replaces pixels of region with RGBA bytes, f.e. returned by read_region().")},
+        {"get_difference_rect", (PyCFunction)canvas_getDifferenceRect, METH_VARARGS, PyDoc_STR("Canvas.get_difference_rect(other: Canvas): Returns (x, y, width, height) bounds of pixels that differ from other canvas of the same size or None if canvases are equal.")},
+        {"get_different_tiles", (PyCFunction)canvas_getDifferentTiles, METH_VARARGS, PyDoc_STR("Canvas.get_different_tiles(other: Canvas): Returns list of (x, y, width, height) tiles, where pixels differ from other canvas of the same size.")},
+        {"get_content_rect", (PyCFunction)canvas_getContentRect, METH_NOARGS,   PyDoc_STR("Canvas.get_content_rect(): Returns (x, y, width, height) bounds of non-transparent pixels or None if canvas is fully transparent.")},
+        {"get_used_tiles",  (PyCFunction)canvas_getUsedTiles,   METH_NOARGS,    PyDoc_STR("Canvas.get_used_tiles(): Returns list of (x, y, width, height) tiles, that may contain non-transparent pixels. Pixels outside of them are (0, 0, 0, 0).")},
+        {"get_dirty_rect",  (PyCFunction)canvas_getDirtyRect,   METH_NOARGS,    PyDoc_STR("Canvas.get_dirty_rect(): Returns (x, y, width, height) of region changed since last reset_dirty_rect() call or None if nothing changed.")},
+        {"mark_dirty",      (PyCFunction)canvas_markDirty,      METH_VARARGS,   PyDoc_STR("Canvas.mark_dirty(x: int, y: int, width: int, height: int): Marks region as changed.")},
+        {"reset_dirty_rect", (PyCFunction)canvas_resetDirtyRect, METH_NOARGS,   PyDoc_STR("Canvas.reset_dirty_rect(): Marks whole canvas as unchanged.")},
         {NULL, NULL, 0, NULL}
     };
 
     static struct PyMemberDef canvas_members[] = {
+        {"width",   T_UINT, offsetof(canvasobject, width),  READONLY,   PyDoc_STR("Canvas width.")},
+        {"height",  T_UINT, offsetof(canvasobject, height), READONLY,   PyDoc_STR("Canvas height.")},
+        {"generation", T_ULONGLONG, offsetof(canvasobject, generation), READONLY, PyDoc_STR("Canvas.generation: Counter, that is incremented on every change of canvas content.")},
         {NULL}
     };
 
+    static struct PyGetSetDef canvas_getset[] = {
+        {"__array_interface__", (getter)canvas_getArrayInterface, NULL, PyDoc_STR("Canvas.__array_interface__: Array interface for numpy, that describes canvas data as read-only array of unsigned bytes with shape (height, width, 4)."), NULL},
+        {"buffer_id", (getter)canvas_getBufferId, NULL, PyDoc_STR("Canvas.buffer_id: Identifier of canvas data storage. Clones share storage until one of them is changed, so equal identifiers mean equal content."), NULL},
+        {NULL}
+    };
+
+    static PyBufferProcs canvas_as_buffer = {
+        .bf_getbuffer = (getbufferproc)canvas_getBuffer,
+        .bf_releasebuffer = (releasebufferproc)canvas_releaseBuffer,
+    };
+
     extern PyTypeObject canvas_type = {
         .ob_base = PyVarObject_HEAD_INIT(NULL, 0)
         .tp_name = "magicautils.Canvas",
         .tp_basicsize = sizeof(canvasobject),
         .tp_itemsize = 0,
         .tp_dealloc = (destructor)canvas_dealloc,
+        .tp_as_buffer = &canvas_as_buffer,
         .tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,
         .tp_methods = canvas_methods,
         .tp_members = canvas_members,
+        .tp_getset = canvas_getset,
         .tp_init = (initproc)canvas_init,
         .tp_new = canvas_new,
     };
@@ -73,6 +113,12 @@ extern "C"
         if (m == NULL)
             return NULL;
 
+        // Join rendering threads before interpreter finalization
+        Py_AtExit(stopThreadPool);
+
+        // Detect CPU features now, while only one thread can do it
+        getBlendKernels();
+
         Py_INCREF(&canvas_type);
 
         if(PyModule_AddObject(m, "Canvas", (PyObject*)&canvas_type) < 0)
@@ -0,0 +1,79 @@
+#include <string.h>
+#include "pixelformats.h"
+
+int getModeBytesPerPixel(const char *mode)
+{
+    if(strcmp(mode, "RGBA") == 0)
+        return 4;
+
+    if(strcmp(mode, "RGB") == 0)
+        return 3;
+
+    if(strcmp(mode, "LA") == 0)
+        return 2;
+
+    if(strcmp(mode, "L") == 0 || strcmp(mode, "P") == 0)
+        return 1;
+
+    return 0;
+}
+
+void convertToRGBA(const unsigned char *source, const char *mode, int count, const unsigned char *palette, int paletteSize, unsigned char *out)
+{
+    if(strcmp(mode, "RGBA") == 0)
+    {
+        memcpy(out, source, count * 4);
+    }
+    else if(strcmp(mode, "RGB") == 0)
+    {
+        for(int i = 0; i < count; i++)
+        {
+            out[i * 4] = source[i * 3];
+            out[i * 4 + 1] = source[i * 3 + 1];
+            out[i * 4 + 2] = source[i * 3 + 2];
+            out[i * 4 + 3] = 255;
+        }
+    }
+    else if(strcmp(mode, "L") == 0)
+    {
+        for(int i = 0; i < count; i++)
+        {
+            out[i * 4] = source[i];
+            out[i * 4 + 1] = source[i];
+            out[i * 4 + 2] = source[i];
+            out[i * 4 + 3] = 255;
+        }
+    }
+    else if(strcmp(mode, "LA") == 0)
+    {
+        for(int i = 0; i < count; i++)
+        {
+            out[i * 4] = source[i * 2];
+            out[i * 4 + 1] = source[i * 2];
+            out[i * 4 + 2] = source[i * 2];
+            out[i * 4 + 3] = source[i * 2 + 1];
+        }
+    }
+    else if(strcmp(mode, "P") == 0)
+    {
+        // Expand palette to 256 RGBA colors to avoid bounds checks for every pixel
+        unsigned char colors[256 * 4] = {0};
+
+        for(int i = 0; i < 256; i++)
+        {
+            if(i < paletteSize)
+            {
+                colors[i * 4] = palette[i * 3];
+                colors[i * 4 + 1] = palette[i * 3 + 1];
+                colors[i * 4 + 2] = palette[i * 3 + 2];
+            }
+
+            colors[i * 4 + 3] = 255;
+        }
+
+        for(int i = 0; i < count; i++)
+        {
+            memcpy(out + i * 4, colors + source[i] * 4, 4);
+        }
+    }
+}
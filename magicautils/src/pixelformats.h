@@ -0,0 +1,17 @@
+#ifndef PIXELFORMATS_H
+#define PIXELFORMATS_H
+/*
+Conversion of raw pixel data in other formats into RGBA.
+Formats are named like PIL image modes: "RGBA", "RGB", "L" ( grayscale ), "LA" ( grayscale with alpha ) and "P" ( palette ).
+*/
+
+// Returns bytes count per pixel in "mode" or 0 if mode isn't supported
+int getModeBytesPerPixel(const char *mode);
+
+/*
+Converts "count" pixels of "source" in "mode" into RGBA "out".
+"palette" keeps "paletteSize" RGB colors and is used only in "P" mode. Colors out of palette are opaque black.
+*/
+void convertToRGBA(const unsigned char *source, const char *mode, int count, const unsigned char *palette, int paletteSize, unsigned char *out);
+
+#endif // PIXELFORMATS_H
@@ -0,0 +1,217 @@
+#include <stdlib.h>
+#include <string.h>
+#include "rasterizer.h"
+#include "alphablending.h"
+
+#if defined(_MSC_VER) && !defined(__clang__)
+#include <intrin.h>
+#endif
+
+// Floor division, that rounds towards negative infinity for negative numerators too
+static inline long long floorDiv(long long a, long long b)
+{
+    return a >= 0 ? a / b : -((-a + b - 1) / b);
+}
+
+// ( a * b + c ) / d with 128-bit intermediate product, because deltas of line between int coordinates
+// take up to 33 bits and their products don't fit into 64 bits. Quotient itself must fit into 64 bits
+static inline unsigned long long mulAddDiv(unsigned long long a, unsigned long long b, unsigned long long c, unsigned long long d, unsigned long long *remainder = NULL)
+{
+    unsigned long long quotient, rest;
+
+#if defined(_MSC_VER) && !defined(__clang__)
+    unsigned long long high;
+    unsigned long long low = _umul128(a, b, &high);
+
+    low += c;
+    high += low < c ? 1 : 0;
+    quotient = _udiv128(high, low, d, &rest);
+#else
+    unsigned __int128 numerator = (unsigned __int128)a * b + c;
+
+    quotient = (unsigned long long)(numerator / d);
+    rest = (unsigned long long)(numerator % d);
+#endif
+
+    if(remainder)
+    {
+        *remainder = rest;
+    }
+
+    return quotient;
+}
+
+rect_t rasterizeLine(sharedbuffer_t *buffer, int x0, int y0, int x1, int y1, const unsigned char *color, int lineWidth, bool antialiased, bool skipStart)
+{
+    // Work in ( major, minor ) coordinates, where line steps by one pixel along major axis
+    // Deltas are computed in long long, difference of two ints doesn't always fit into int
+    bool steep = llabs((long long)y1 - y0) > llabs((long long)x1 - x0);
+
+    long long major0 = steep ? y0 : x0;
+    long long minor0 = steep ? x0 : y0;
+    long long majorDelta = steep ? llabs((long long)y1 - y0) : llabs((long long)x1 - x0);
+    long long minorDelta = steep ? llabs((long long)x1 - x0) : llabs((long long)y1 - y0);
+    int majorStep = (steep ? y1 >= y0 : x1 >= x0) ? 1 : -1;
+    int minorStep = (steep ? x1 >= x0 : y1 >= y0) ? 1 : -1;
+    long long majorSize = steep ? buffer->height : buffer->width;
+    long long minorSize = steep ? buffer->width : buffer->height;
+    // Distances in bytes between neighbour pixels along each axis
+    long long majorStride = steep ? buffer->width * 4 : 4;
+    long long minorStride = steep ? 4 : buffer->width * 4;
+
+    if(lineWidth < 1)
+    {
+        lineWidth = 1;
+    }
+
+    // How far span sticks out of center line
+    long long margin = lineWidth / 2 + (antialiased ? 1 : 0);
+
+    // Clip steps range once. Minor coordinate at step i is
+    // minor0 + minorStep * floor((2 * i * minorDelta + majorDelta) / (2 * majorDelta)),
+    // so range of steps where it lies inside buffer can be found from this formula.
+    long long first = skipStart ? 1 : 0;
+    long long last = majorDelta;
+
+    // Major coordinate must lie inside buffer
+    if(majorStep > 0)
+    {
+        first = first > -major0 ? first : -major0;
+        last = last < majorSize - 1 - major0 ? last : majorSize - 1 - major0;
+    }
+    else
+    {
+        first = first > major0 - (majorSize - 1) ? first : major0 - (majorSize - 1);
+        last = last < major0 ? last : major0;
+    }
+
+    // Minor offset from start ( in the direction of line ), that keeps span inside buffer
+    long long minOffset = minorStep > 0 ? -margin - minor0 : minor0 - (minorSize - 1 + margin);
+    long long maxOffset = minorStep > 0 ? minorSize - 1 + margin - minor0 : minor0 + margin;
+
+    if(maxOffset < 0)
+    {
+        return emptyRect();
+    }
+
+    if(majorDelta > 0 && minorDelta > 0)
+    {
+        // Offset changes from 0 to minorDelta, so only offsets inside of this range clip steps
+        if(minOffset > minorDelta)
+        {
+            return emptyRect();
+        }
+
+        if(minOffset > 0)
+        {
+            // First step with 2 * i * minorDelta + majorDelta >= 2 * majorDelta * minOffset
+            long long minStep = mulAddDiv(majorDelta, 2 * minOffset - 1, 2 * minorDelta - 1, 2 * minorDelta);
+            first = first > minStep ? first : minStep;
+        }
+
+        if(maxOffset < minorDelta)
+        {
+            // Last step with 2 * i * minorDelta + majorDelta < 2 * majorDelta * ( maxOffset + 1 )
+            long long maxStep = mulAddDiv(majorDelta, 2 * maxOffset + 1, 2 * minorDelta - 1, 2 * minorDelta) - 1;
+            last = last < maxStep ? last : maxStep;
+        }
+    }
+    else if(minOffset > 0)
+    {
+        // Minor coordinate doesn't change and lies outside of buffer
+        return emptyRect();
+    }
+
+    if(first > last)
+    {
+        return emptyRect();
+    }
+
+    long long changedMajor0 = majorSize, changedMajor1 = -1;
+    long long changedMinor0 = minorSize, changedMinor1 = -1;
+
+    // Bresenham's error term: offset = quotient, remainder is compared with 2 * majorDelta
+    long long denominator = 2 * (majorDelta > 0 ? majorDelta : 1);
+    unsigned long long firstRemainder;
+    long long offset = mulAddDiv(2 * first, minorDelta, majorDelta, denominator, &firstRemainder);
+    long long remainder = firstRemainder;
+
+    for(long long i = first; i <= last; i++)
+    {
+        long long major = major0 + majorStep * i;
+        long long spanStart, spanEnd;
+
+        if(antialiased)
+        {
+            // Exact center of line in 1/256 of pixel, where pixel k covers [k * 256, ( k + 1 ) * 256)
+            long long center = minor0 * 256 + 128 + minorStep * (majorDelta > 0 ? (long long)mulAddDiv(i, minorDelta * 256, 0, majorDelta) : 0);
+            long long low = center - lineWidth * 128;
+            long long high = center + lineWidth * 128;
+
+            spanStart = floorDiv(low, 256);
+            spanEnd = floorDiv(high + 255, 256) - 1;
+
+            spanStart = spanStart > 0 ? spanStart : 0;
+            spanEnd = spanEnd < minorSize - 1 ? spanEnd : minorSize - 1;
+
+            for(long long minor = spanStart; minor <= spanEnd; minor++)
+            {
+                long long coverageStart = low > minor * 256 ? low : minor * 256;
+                long long coverageEnd = high < (minor + 1) * 256 ? high : (minor + 1) * 256;
+
+                // Coverage is in 0-256 range
+                blendPixelOver(buffer->data + major * majorStride + minor * minorStride, color, color[3] * (int)(coverageEnd - coverageStart) / 256);
+            }
+        }
+        else
+        {
+            long long center = minor0 + minorStep * offset;
+
+            spanStart = center - (lineWidth - 1) / 2;
+            spanEnd = center + lineWidth / 2;
+
+            spanStart = spanStart > 0 ? spanStart : 0;
+            spanEnd = spanEnd < minorSize - 1 ? spanEnd : minorSize - 1;
+
+            for(long long minor = spanStart; minor <= spanEnd; minor++)
+            {
+                memcpy(buffer->data + major * majorStride + minor * minorStride, color, 4);
+            }
+        }
+
+        if(spanStart <= spanEnd)
+        {
+            // Content bounds are extended once after drawing, here only tiles of span are marked
+            for(long long minor = spanStart - spanStart % TILE_SIZE; minor <= spanEnd; minor += TILE_SIZE)
+            {
+                markSharedBufferTile(buffer, steep ? minor : major, steep ? major : minor);
+            }
+
+            changedMajor0 = changedMajor0 < major ? changedMajor0 : major;
+            changedMajor1 = changedMajor1 > major ? changedMajor1 : major;
+            changedMinor0 = changedMinor0 < spanStart ? changedMinor0 : spanStart;
+            changedMinor1 = changedMinor1 > spanEnd ? changedMinor1 : spanEnd;
+        }
+
+        remainder += 2 * minorDelta;
+
+        if(remainder >= denominator)
+        {
+            remainder -= denominator;
+            offset++;
+        }
+    }
+
+    if(changedMajor1 < 0)
+    {
+        return emptyRect();
+    }
+
+    rect_t changed = steep
+        ? rect_t{(int)changedMinor0, (int)changedMajor0, (int)changedMinor1 + 1, (int)changedMajor1 + 1}
+        : rect_t{(int)changedMajor0, (int)changedMinor0, (int)changedMajor1 + 1, (int)changedMinor1 + 1};
+
+    extendSharedBufferContent(buffer, changed);
+
+    return changed;
+}
@@ -0,0 +1,22 @@
+#ifndef RASTERIZER_H
+#define RASTERIZER_H
+/*
+Integer line rasterizer. Line is stepped pixel by pixel along its major axis ( the longer one ), and at every
+step a span of "lineWidth" pixels across major axis is drawn. Part of line outside of buffer is clipped before
+stepping, so lines far outside of canvas cost nothing.
+
+Solid lines replace pixels with color. Anti-aliased lines cover span edges partially and blend color
+over pixels by coverage.
+*/
+
+#include "rect.h"
+#include "sharedbuffer.h"
+
+/*
+Draws line from (x0, y0) to (x1, y1) into "buffer" and marks changed tiles.
+"skipStart" skips the first pixel ( f.e. for joints of polyline, so they aren't blended twice ).
+Returns bounds of changed pixels ( empty if line lies out of buffer ).
+*/
+rect_t rasterizeLine(sharedbuffer_t *buffer, int x0, int y0, int x1, int y1, const unsigned char *color, int lineWidth, bool antialiased, bool skipStart);
+
+#endif // RASTERIZER_H
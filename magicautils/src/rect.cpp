@@ -0,0 +1,38 @@
+#include "rect.h"
+#include "clamp.h"
+
+rect_t emptyRect()
+{
+    return {0, 0, 0, 0};
+}
+
+bool isRectEmpty(rect_t rect)
+{
+    return rect.x0 >= rect.x1 || rect.y0 >= rect.y1;
+}
+
+rect_t uniteRects(rect_t a, rect_t b)
+{
+    if(isRectEmpty(a))
+        return b;
+
+    if(isRectEmpty(b))
+        return a;
+
+    return {min(a.x0, b.x0), min(a.y0, b.y0), max(a.x1, b.x1), max(a.y1, b.y1)};
+}
+
+rect_t intersectRects(rect_t a, rect_t b)
+{
+    rect_t out = {max(a.x0, b.x0), max(a.y0, b.y0), min(a.x1, b.x1), min(a.y1, b.y1)};
+
+    if(isRectEmpty(out))
+        return emptyRect();
+
+    return out;
+}
+
+rect_t includePoint(rect_t rect, int x, int y)
+{
+    return uniteRects(rect, {x, y, x + 1, y + 1});
+}
@@ -0,0 +1,21 @@
+#ifndef RECT_H
+#define RECT_H
+/*
+Util functions for working with rectangles.
+Rectangle covers pixels x0 <= x < x1, y0 <= y < y1. If x0 >= x1 or y0 >= y1, rectangle is empty.
+*/
+
+struct rect_t {
+    int x0;
+    int y0;
+    int x1;
+    int y1;
+};
+
+rect_t emptyRect();
+bool isRectEmpty(rect_t rect);
+rect_t uniteRects(rect_t a, rect_t b);
+rect_t intersectRects(rect_t a, rect_t b);
+rect_t includePoint(rect_t rect, int x, int y);
+
+#endif // RECT_H
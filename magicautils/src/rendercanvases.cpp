@@ -1,208 +1,637 @@
 #include <iostream>
+#include <string.h>
+#include <vector>
+#include <algorithm>
 #include "magicamethods.h"
 #include "canvas.h"
 #include "pixelutils.h"
 #include "clamp.h"
+#include "rect.h"
 #include "alphablending.h"
-
-extern "C"
-{
-
-PyObject* renderCanvases(PyObject *self, PyObject *args)
+#include "threadpool.h"
+#include "blendkernels.h"
+
+// Minimal count of pixels rendered by one thread. Smaller regions aren't worth splitting
+#define PIXELS_PER_BAND 8192
+
+/*
+Parses "canvases" and "alpha_blendings" sequences of render functions.
+On success fills "canvases" and "alphaBlendingModes" arrays ( must be freed with delete[] ) and returns true.
+On failure sets python exception and returns false.
+*/
+static bool parseCanvases(const char *signature, int width, int height, PyObject *canvasesList, PyObject *alphaBlendingsList, canvasobject ***canvases, int **alphaBlendingModes, long *count)
 {
-    int width = 0, height = 0;
-    int highlight_x = -1, highlight_y = -1;
-    PyObject *canvasesList;
-    PyObject *alphaBlendingsList;
-
-    if(!PyArg_ParseTuple(args, "iiOO|ii", &width, &height, &canvasesList, &alphaBlendingsList, &highlight_x, &highlight_y))
-    {
-        PyErr_SetString(PyExc_TypeError, "magicautils.render_canvases(width: int, height: int, canvases: sequence[Canvas], alpha_blendings: sequence[int], highlight_x: int = -1, highlight_y: int = -1): Expected two ints, one list and two ints.");
-        return NULL;
-    }
+    char errorMessageBuffer[1024];
 
     // Check that alphaBlendingsList is a sequence
     if(!PySequence_Check(alphaBlendingsList))
     {
         PyTypeObject *type = (PyTypeObject*)PyObject_Type(alphaBlendingsList);
-        char errorMessageBuffer[1024];
 
-        sprintf(errorMessageBuffer, "magicautils.render_canvases(width: int, height: int, canvases: sequence[Canvas], alpha_blendings: sequence[int], highlight_x: int = -1, highlight_y: int = -1): Expected \"sequence\" in \"alpha_blendings\", but got \"%s\".", type->tp_name);
+        sprintf(errorMessageBuffer, "%s: Expected \"sequence\" in \"alpha_blendings\", but got \"%s\".", signature, type->tp_name);
 
         PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
-        return NULL;
+        return false;
     }
 
-    if(PySequence_Check(canvasesList))
+    if(!PySequence_Check(canvasesList))
     {
-        long count = PySequence_Fast_GET_SIZE(canvasesList);
+        PyTypeObject *type = (PyTypeObject*)PyObject_Type(canvasesList);
 
-        // Check that alphaBlendingsList and canvasesList have identical size
-        if(PySequence_Fast_GET_SIZE(alphaBlendingsList) != count)
-        {
-            PyErr_SetString(PyExc_ValueError, "magicautils.render_canvases(width: int, height: int, canvases: sequence[Canvas], alpha_blendings: sequence[int], highlight_x: int = -1, highlight_y: int = -1): \"canvases\" and \"alpha_blendings\" have different sizes.");
-            return NULL;
-        }
+        sprintf(errorMessageBuffer, "%s: Expected \"sequence\" in \"canvases\", but got \"%s\".", signature, type->tp_name);
 
-        if(count == 0)
-        {
-            Py_INCREF(Py_None);
-            return Py_None;
-        }
+        PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
+        return false;
+    }
+
+    *count = PySequence_Size(canvasesList);
+
+    // Check that alphaBlendingsList and canvasesList have identical size
+    if(PySequence_Size(alphaBlendingsList) != *count)
+    {
+        sprintf(errorMessageBuffer, "%s: \"canvases\" and \"alpha_blendings\" have different sizes.", signature);
+
+        PyErr_SetString(PyExc_ValueError, errorMessageBuffer);
+        return false;
+    }
+
+    *canvases = new canvasobject*[*count];
+    *alphaBlendingModes = new int[*count];
 
-        canvasobject **canvases = new canvasobject*[count];
-        int *alphaBlendingModes = new int[count];
+    for(long i = 0; i < *count; i++)
+    {
+        // Canvases are still referenced by sequences, so we don't need to keep references here
+        PyObject *canvas = PySequence_GetItem(canvasesList, i);
+        PyObject *alphaBlendingMode = PySequence_GetItem(alphaBlendingsList, i);
+
+        Py_XDECREF(canvas);
+        Py_XDECREF(alphaBlendingMode);
 
-        for(unsigned int i = 0; i < count; i++)
+        if(canvas == NULL || alphaBlendingMode == NULL || !PyLong_Check(alphaBlendingMode) || !PyCanvas_Check(canvas))
         {
-            PyObject* canvas = PySequence_Fast_GET_ITEM(canvasesList, i);
-            PyObject* alphaBlendingMode = PySequence_Fast_GET_ITEM(alphaBlendingsList, i);
+            delete[] *canvases;
+            delete[] *alphaBlendingModes;
 
-            if(!PyLong_Check(alphaBlendingMode))
+            if(canvas == NULL || alphaBlendingMode == NULL)
             {
-                delete[] canvases;
-                delete[] alphaBlendingModes;
+                return false;
+            }
 
+            if(!PyLong_Check(alphaBlendingMode))
+            {
                 PyTypeObject *type = (PyTypeObject*)PyObject_Type(alphaBlendingMode);
-                char errorMessageBuffer[1024];
 
-                sprintf(errorMessageBuffer, "magicautils.render_canvases(width: int, height: int, canvases: sequence[Canvas], alpha_blendings: sequence[int], highlight_x: int = -1, highlight_y: int = -1): Expected \"int\" in \"alpha_blendings\", but got \"%s\".", type->tp_name);
+                sprintf(errorMessageBuffer, "%s: Expected \"int\" in \"alpha_blendings\", but got \"%s\".", signature, type->tp_name);
+            }
+            else
+            {
+                PyTypeObject *type = (PyTypeObject*)PyObject_Type(canvas);
 
-                PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
-                return NULL;
+                sprintf(errorMessageBuffer, "%s: Expected \"Canvas\" in \"canvases\", but got \"%s\".", signature, type->tp_name);
             }
 
-            if(!PyCanvas_Check(canvas))
-            {
-                delete[] canvases;
-                delete[] alphaBlendingModes;
+            PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
+            return false;
+        }
 
-                PyTypeObject *type = (PyTypeObject*)PyObject_Type(canvas);
-                char errorMessageBuffer[1024];
+        (*canvases)[i] = (canvasobject*)canvas;
+        (*alphaBlendingModes)[i] = PyLong_AsLong(alphaBlendingMode);
 
-                sprintf(errorMessageBuffer, "magicautils.render_canvases(width: int, height: int, canvases: sequence[Canvas], alpha_blendings: sequence[int], highlight_x: int = -1, highlight_y: int = -1): Expected \"Canvas\" in \"canvases\", but got \"%s\".", type->tp_name);
+        // Check canvas size to avoid reading out of canvas data bounds
+        if((*canvases)[i]->width != width || (*canvases)[i]->height != height)
+        {
+            sprintf(errorMessageBuffer, "%s: Canvas at index %li has size %ux%u, but expected %ix%i.", signature, i, (*canvases)[i]->width, (*canvases)[i]->height, width, height);
 
-                PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
-                return NULL;
-            }
+            delete[] *canvases;
+            delete[] *alphaBlendingModes;
 
-            canvases[i] = (canvasobject*)canvas;
-            alphaBlendingModes[i] = PyLong_AsLong(alphaBlendingMode);
+            PyErr_SetString(PyExc_ValueError, errorMessageBuffer);
+            return false;
         }
+    }
 
-        unsigned char *out = new unsigned char[width * height * 4];
+    return true;
+}
 
-        // TODO: Think about rendering optimizations ( delta-rendering )
+/*
+Composites pixels of "layers" ( storages of canvases ) inside "region" into "out" using "kernels".
+Output is tightly packed: each row of region takes ( region width * 4 ) bytes.
+Empty tiles of layers and pixels outside of their content bounds are skipped, as blending transparent
+pixels changes nothing in both modes.
+*/
+static void compositeRegion(const blendkernels_t *kernels, sharedbuffer_t **layers, int *alphaBlendingModes, long count, int width, rect_t region, unsigned char *out)
+{
+    int regionWidth = region.x1 - region.x0;
+    std::vector<unsigned short> accumulator(regionWidth * 4);
+    // Parts of layers' content bounds inside region
+    std::vector<rect_t> contents(count);
 
-        for(unsigned int y = 0; y < height; y++)
+    for(long i = 0; i < count; i++)
+    {
+        contents[i] = intersectRects(layers[i]->contentRect, region);
+    }
+
+    for(int y = region.y0; y < region.y1; y++)
+    {
+        unsigned char *outRow = out + (y - region.y0) * regionWidth * 4;
+        bool blended = false;
+        // Form of color in accumulator ( see blendkernels.h )
+        bool premultiplied = true;
+
+        for(long i = 0; i < count; i++)
         {
-            for(unsigned int x = 0; x < width; x++)
+            rect_t content = contents[i];
+
+            if(y < content.y0 || y >= content.y1)
             {
-                float r = 0;
-                float g = 0;
-                float b = 0;
-                float a = 0;
+                continue;
+            }
 
-                for(unsigned int i = 0; i < count; i++)
-                {
-                    canvasobject* canvas = canvases[i];
-                    int alphaBlendingMode = alphaBlendingModes[i];
+            // Accumulator is cleared only for rows that have something to blend.
+            // Empty accumulator is the same in both forms
+            if(!blended)
+            {
+                std::fill(accumulator.begin(), accumulator.end(), 0);
+                blended = true;
+                premultiplied = alphaBlendingModes[i] != AlphaBlendingMode::ADD;
+            }
 
-                    unsigned int pixel[4] = {0, 0, 0, 0};
+            // Blend runs of used tiles at once
+            int tileX = content.x0 / TILE_SIZE;
+            int lastTile = (content.x1 - 1) / TILE_SIZE;
 
-                    getPixel(canvas->data, x, y, width, &pixel[0], &pixel[1], &pixel[2], &pixel[3]);
+            while(tileX <= lastTile)
+            {
+                if(!isSharedBufferTileUsed(layers[i], tileX, y / TILE_SIZE))
+                {
+                    tileX++;
+                    continue;
+                }
 
-                    float pixelColorf[4] = {
-                        float(pixel[0]) / 255.0f,
-                        float(pixel[1]) / 255.0f,
-                        float(pixel[2]) / 255.0f,
-                        float(pixel[3]) / 255.0f
-                    };
+                int runStart = tileX;
 
-                    switch(alphaBlendingMode)
-                    {
-                    case AlphaBlendingMode::ADD:
-                    {
-                        r += pixelColorf[0] * pixelColorf[3];
-                        g += pixelColorf[1] * pixelColorf[3];
-                        b += pixelColorf[2] * pixelColorf[3];
-                        a += pixelColorf[3];
-                        break;
-                    }
-                    case AlphaBlendingMode::OVER:
-                    {
-                        float a_coef = a * (1.0f - pixelColorf[3]);
-                        float out_a = pixelColorf[3] + a_coef;
-
-                        if(out_a == 0.0f)
-                        {
-                            break;
-                        }
-
-                        r = (pixelColorf[0] * pixelColorf[3] + r * a_coef) / out_a;
-                        g = (pixelColorf[1] * pixelColorf[3] + g * a_coef) / out_a;
-                        b = (pixelColorf[2] * pixelColorf[3] + b * a_coef) / out_a;
-                        a = out_a;
-                        break;
-                    }
-                    }
+                while(tileX <= lastTile && isSharedBufferTileUsed(layers[i], tileX, y / TILE_SIZE))
+                {
+                    tileX++;
                 }
 
-                r = clampf(r, 0.0f, 1.0f);
-                g = clampf(g, 0.0f, 1.0f);
-                b = clampf(b, 0.0f, 1.0f);
-                a = clampf(a, 0.0f, 1.0f);
+                int x0 = std::max(runStart * TILE_SIZE, content.x0);
+                int x1 = std::min(tileX * TILE_SIZE, content.x1);
 
-                unsigned char outColor[4] = {
-                    (unsigned char)(r * 255.0f),
-                    (unsigned char)(g * 255.0f),
-                    (unsigned char)(b * 255.0f),
-                    (unsigned char)(a * 255.0f)
-                };
+                const unsigned char *row = layers[i]->data + (y * width + x0) * 4;
+                unsigned short *accumulated = accumulator.data() + (x0 - region.x0) * 4;
 
-                if(x == highlight_x && y == highlight_y)
+                switch(alphaBlendingModes[i])
                 {
-                    if(outColor[0] + outColor[1] + outColor[2] < 110 * 3)
+                case AlphaBlendingMode::ADD:
+                    // Whole row is converted, as previous layers may be blended outside of this run
+                    if(premultiplied)
                     {
-                        outColor[0] = min(outColor[0] + 60, 255);
-                        outColor[1] = min(outColor[1] + 60, 255);
-                        outColor[2] = min(outColor[2] + 60, 255);
+                        unpremultiplyRow(accumulator.data(), regionWidth);
+                        premultiplied = false;
                     }
-                    else
+
+                    kernels->add(accumulated, row, x1 - x0);
+                    break;
+                case AlphaBlendingMode::OVER:
+                    if(!premultiplied)
                     {
-                        outColor[0] = max(outColor[0] - 60, 0);
-                        outColor[1] = max(outColor[1] - 60, 0);
-                        outColor[2] = max(outColor[2] - 60, 0);
+                        premultiplyRow(accumulator.data(), regionWidth);
+                        premultiplied = true;
                     }
 
-                    outColor[3] = min(outColor[3] + 200, 255);
+                    kernels->over(accumulated, row, x1 - x0);
+                    break;
                 }
-
-                setPixel(out, x, y, width, outColor[0], outColor[1], outColor[2], outColor[3]);
             }
         }
 
-        PyObject *buffer = PyBytes_FromStringAndSize((char*)out, width * height * 4);
+        if(blended && premultiplied)
+        {
+            finishRow(accumulator.data(), outRow, regionWidth);
+        }
+        else if(blended)
+        {
+            finishAdditiveRow(accumulator.data(), outRow, regionWidth);
+        }
+        else
+        {
+            memset(outRow, 0, regionWidth * 4);
+        }
+    }
+}
+
+/*
+Renders region like compositeRegion, but splits it into row bands rendered on worker threads.
+The GIL is released while rendering, so it must be held when function is called.
+*/
+static void renderRegion(canvasobject **canvases, int *alphaBlendingModes, long count, int width, rect_t region, unsigned char *out)
+{
+    int regionWidth = region.x1 - region.x0;
+    int rowsPerBand = PIXELS_PER_BAND / regionWidth + 1;
+
+    // Kernels may be changed by other Python thread, so take them once while holding the GIL
+    const blendkernels_t *kernels = getBlendKernels();
+
+    // Canvas may switch to other buffer when it's changed while its data is shared ( copy-on-write ),
+    // so keep references to buffers we read from
+    std::vector<sharedbuffer_t*> buffers(count);
+
+    for(long i = 0; i < count; i++)
+    {
+        lockCanvas(canvases[i]);
+
+        buffers[i] = retainSharedBuffer(canvases[i]->buffer);
+    }
+
+    Py_BEGIN_ALLOW_THREADS
 
-        delete[] out;
+    parallelFor(region.y1 - region.y0, rowsPerBand, [&](int begin, int end) {
+        rect_t band = {region.x0, region.y0 + begin, region.x1, region.y0 + end};
+
+        compositeRegion(kernels, buffers.data(), alphaBlendingModes, count, width, band, out + begin * regionWidth * 4);
+    });
+
+    Py_END_ALLOW_THREADS
+
+    for(long i = 0; i < count; i++)
+    {
+        releaseSharedBuffer(buffers[i]);
+        unlockCanvas(canvases[i]);
+    }
+}
+
+extern "C"
+{
+
+PyObject* renderCanvases(PyObject *self, PyObject *args)
+{
+    const char *signature = "magicautils.render_canvases(width: int, height: int, canvases: sequence[Canvas], alpha_blendings: sequence[int])";
+    int width = 0, height = 0;
+    PyObject *canvasesList;
+    PyObject *alphaBlendingsList;
+
+    if(!PyArg_ParseTuple(args, "iiOO", &width, &height, &canvasesList, &alphaBlendingsList))
+    {
+        PyErr_SetString(PyExc_TypeError, "magicautils.render_canvases(width: int, height: int, canvases: sequence[Canvas], alpha_blendings: sequence[int]): Expected two ints and two lists.");
+        return NULL;
+    }
+
+    canvasobject **canvases;
+    int *alphaBlendingModes;
+    long count;
+
+    if(!parseCanvases(signature, width, height, canvasesList, alphaBlendingsList, &canvases, &alphaBlendingModes, &count))
+    {
+        return NULL;
+    }
+
+    if(count == 0)
+    {
         delete[] canvases;
         delete[] alphaBlendingModes;
 
-        return buffer;
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
+    // Render straight into bytes object to avoid copying
+    PyObject *buffer = PyBytes_FromStringAndSize(NULL, width * height * 4);
+
+    if(buffer != NULL)
+    {
+        renderRegion(canvases, alphaBlendingModes, count, width, {0, 0, width, height}, (unsigned char*)PyBytes_AS_STRING(buffer));
+    }
+
+    delete[] canvases;
+    delete[] alphaBlendingModes;
+
+    return buffer;
+}
+
+PyObject* renderCanvasesRect(PyObject *self, PyObject *args)
+{
+    const char *signature = "magicautils.render_canvases_rect(width: int, height: int, canvases: sequence[Canvas], alpha_blendings: sequence[int], x: int, y: int, rect_width: int, rect_height: int)";
+    int width = 0, height = 0;
+    int x = 0, y = 0, rectWidth = 0, rectHeight = 0;
+    PyObject *canvasesList;
+    PyObject *alphaBlendingsList;
+
+    if(!PyArg_ParseTuple(args, "iiOOiiii", &width, &height, &canvasesList, &alphaBlendingsList, &x, &y, &rectWidth, &rectHeight))
+    {
+        PyErr_SetString(PyExc_TypeError, "magicautils.render_canvases_rect(width: int, height: int, canvases: sequence[Canvas], alpha_blendings: sequence[int], x: int, y: int, rect_width: int, rect_height: int): Expected two ints, two lists and four ints.");
+        return NULL;
+    }
+
+    // Check that rect lies inside canvas
+    if(x < 0 || y < 0 || rectWidth <= 0 || rectHeight <= 0 || x + rectWidth > width || y + rectHeight > height)
+    {
+        PyErr_SetString(PyExc_ValueError, "magicautils.render_canvases_rect(width: int, height: int, canvases: sequence[Canvas], alpha_blendings: sequence[int], x: int, y: int, rect_width: int, rect_height: int): Rect must be non-empty and lie inside canvas.");
+        return NULL;
+    }
+
+    canvasobject **canvases;
+    int *alphaBlendingModes;
+    long count;
+
+    if(!parseCanvases(signature, width, height, canvasesList, alphaBlendingsList, &canvases, &alphaBlendingModes, &count))
+    {
+        return NULL;
+    }
+
+    if(count == 0)
+    {
+        delete[] canvases;
+        delete[] alphaBlendingModes;
+
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
+    PyObject *buffer = PyBytes_FromStringAndSize(NULL, rectWidth * rectHeight * 4);
+
+    if(buffer != NULL)
+    {
+        renderRegion(canvases, alphaBlendingModes, count, width, {x, y, x + rectWidth, y + rectHeight}, (unsigned char*)PyBytes_AS_STRING(buffer));
+    }
+
+    delete[] canvases;
+    delete[] alphaBlendingModes;
+
+    return buffer;
+}
+
+PyObject* renderCanvasesInto(PyObject *self, PyObject *args)
+{
+    const char *signature = "magicautils.render_canvases_into(out: buffer, width: int, height: int, canvases: sequence[Canvas], alpha_blendings: sequence[int], x: int = 0, y: int = 0, rect_width: int = -1, rect_height: int = -1)";
+    Py_buffer out;
+    int width = 0, height = 0;
+    int x = 0, y = 0, rectWidth = -1, rectHeight = -1;
+    PyObject *canvasesList;
+    PyObject *alphaBlendingsList;
+    char errorMessageBuffer[1024];
+
+    if(!PyArg_ParseTuple(args, "w*iiOO|iiii", &out, &width, &height, &canvasesList, &alphaBlendingsList, &x, &y, &rectWidth, &rectHeight))
+    {
+        PyErr_SetString(PyExc_TypeError, "magicautils.render_canvases_into(out: buffer, width: int, height: int, canvases: sequence[Canvas], alpha_blendings: sequence[int], x: int = 0, y: int = 0, rect_width: int = -1, rect_height: int = -1): Expected writable buffer, two ints, two lists and four ints.");
+        return NULL;
+    }
+
+    // By default rect takes the rest of canvas
+    if(rectWidth < 0)
+    {
+        rectWidth = width - x;
+    }
+
+    if(rectHeight < 0)
+    {
+        rectHeight = height - y;
+    }
+
+    if(x < 0 || y < 0 || rectWidth <= 0 || rectHeight <= 0 || x + rectWidth > width || y + rectHeight > height)
+    {
+        PyBuffer_Release(&out);
+
+        sprintf(errorMessageBuffer, "%s: Rect must be non-empty and lie inside canvas.", signature);
+
+        PyErr_SetString(PyExc_ValueError, errorMessageBuffer);
+        return NULL;
+    }
+
+    if(out.len < (Py_ssize_t)rectWidth * rectHeight * 4)
+    {
+        sprintf(errorMessageBuffer, "%s: \"out\" has size %zi, but at least %zi bytes are required.", signature, out.len, (Py_ssize_t)rectWidth * rectHeight * 4);
+
+        PyBuffer_Release(&out);
+
+        PyErr_SetString(PyExc_ValueError, errorMessageBuffer);
+        return NULL;
+    }
+
+    canvasobject **canvases;
+    int *alphaBlendingModes;
+    long count;
+
+    if(!parseCanvases(signature, width, height, canvasesList, alphaBlendingsList, &canvases, &alphaBlendingModes, &count))
+    {
+        PyBuffer_Release(&out);
+        return NULL;
+    }
+
+    unsigned char *outData = (unsigned char*)out.buf;
+
+    for(long i = 0; i < count; i++)
+    {
+        unsigned char *canvasData = canvases[i]->data;
+
+        // We write to "out" while reading canvases, so it can't share memory with them ( f.e. memoryview of canvas )
+        if(outData < canvasData + canvases[i]->width * canvases[i]->height * 4 && canvasData < outData + out.len)
+        {
+            delete[] canvases;
+            delete[] alphaBlendingModes;
+            PyBuffer_Release(&out);
+
+            sprintf(errorMessageBuffer, "%s: \"out\" shares memory with canvas at index %li.", signature, i);
+
+            PyErr_SetString(PyExc_ValueError, errorMessageBuffer);
+            return NULL;
+        }
+    }
+
+    if(count == 0)
+    {
+        // Nothing to blend, so region is transparent
+        memset(outData, 0, rectWidth * rectHeight * 4);
     }
     else
     {
-        PyTypeObject *type = (PyTypeObject*)PyObject_Type(canvasesList);
+        renderRegion(canvases, alphaBlendingModes, count, width, {x, y, x + rectWidth, y + rectHeight}, outData);
+    }
+
+    delete[] canvases;
+    delete[] alphaBlendingModes;
+    PyBuffer_Release(&out);
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+PyObject* flattenCanvases(PyObject *self, PyObject *args)
+{
+    const char *signature = "magicautils.flatten_canvases(target: Canvas, canvases: sequence[Canvas], alpha_blendings: sequence[int])";
+    PyObject *target;
+    PyObject *canvasesList;
+    PyObject *alphaBlendingsList;
+
+    if(!PyArg_ParseTuple(args, "OOO", &target, &canvasesList, &alphaBlendingsList))
+    {
+        PyErr_SetString(PyExc_TypeError, "magicautils.flatten_canvases(target: Canvas, canvases: sequence[Canvas], alpha_blendings: sequence[int]): Expected canvas and two lists.");
+        return NULL;
+    }
+
+    if(!PyCanvas_Check(target))
+    {
+        PyTypeObject *type = (PyTypeObject*)PyObject_Type(target);
         char errorMessageBuffer[1024];
 
-        sprintf(errorMessageBuffer, "magicautils.render_canvases(width: int, height: int, canvases: sequence[Canvas], alpha_blendings: sequence[int], highlight_x: int = -1, highlight_y: int = -1): Expected \"sequence\" in \"canvases\", but got \"%s\".", type->tp_name);
+        sprintf(errorMessageBuffer, "%s: Expected \"Canvas\" in \"target\", but got \"%s\".", signature, type->tp_name);
 
         PyErr_SetString(PyExc_TypeError, errorMessageBuffer);
         return NULL;
     }
 
+    canvasobject *targetCanvas = (canvasobject*)target;
+    canvasobject **canvases;
+    int *alphaBlendingModes;
+    long count;
+
+    if(!parseCanvases(signature, targetCanvas->width, targetCanvas->height, canvasesList, alphaBlendingsList, &canvases, &alphaBlendingModes, &count))
+    {
+        return NULL;
+    }
+
+    for(long i = 0; i < count; i++)
+    {
+        // We write to target while reading canvases, so target can't be one of them
+        if(canvases[i] == targetCanvas)
+        {
+            delete[] canvases;
+            delete[] alphaBlendingModes;
+
+            char errorMessageBuffer[1024];
+
+            sprintf(errorMessageBuffer, "%s: \"target\" can't be one of \"canvases\".", signature);
+
+            PyErr_SetString(PyExc_ValueError, errorMessageBuffer);
+            return NULL;
+        }
+    }
+
+    int width = targetCanvas->width;
+    int height = targetCanvas->height;
+
+    // Target may share data with its clones
+    prepareCanvasWrite(targetCanvas);
+
+    // Target may get other buffer while rendering ( f.e. by copy_content ), so keep the one we write to alive
+    sharedbuffer_t *renderBuffer = retainSharedBuffer(targetCanvas->buffer);
+
+    lockCanvas(targetCanvas);
+    renderRegion(canvases, alphaBlendingModes, count, width, {0, 0, width, height}, renderBuffer->data);
+    unlockCanvas(targetCanvas);
+
+    releaseSharedBuffer(renderBuffer);
+
+    // Pixels are transparent where all canvases are transparent, so only their used tiles are used.
+    // Tiles of exported target must stay used
+    sharedbuffer_t *targetBuffer = targetCanvas->buffer;
+
+    if(targetCanvas->exports == 0)
+    {
+        memset(targetBuffer->tiles, 0, targetBuffer->tilesX * targetBuffer->tilesY);
+        targetBuffer->contentRect = emptyRect();
+        targetBuffer->contentRectExact = false;
+
+        for(long i = 0; i < count; i++)
+        {
+            targetBuffer->contentRect = uniteRects(targetBuffer->contentRect, canvases[i]->buffer->contentRect);
+
+            for(unsigned int tile = 0; tile < targetBuffer->tilesX * targetBuffer->tilesY; tile++)
+            {
+                targetBuffer->tiles[tile] |= canvases[i]->buffer->tiles[tile];
+            }
+        }
+    }
+
+    markCanvasRedraw(targetCanvas, {0, 0, width, height});
+
+    delete[] canvases;
+    delete[] alphaBlendingModes;
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+PyObject* setRenderThreads(PyObject *self, PyObject *args)
+{
+    int count = 0;
+
+    if(!PyArg_ParseTuple(args, "i", &count))
+    {
+        PyErr_SetString(PyExc_TypeError, "magicautils.set_render_threads(count: int): Expected one int.");
+        return NULL;
+    }
+
+    // Workers may be busy with rendering started from other Python threads, so wait for them without the GIL
+    Py_BEGIN_ALLOW_THREADS
+
+    setThreadCount(count);
+
+    Py_END_ALLOW_THREADS
+
     Py_INCREF(Py_None);
     return Py_None;
 }
 
+PyObject* getRenderThreads(PyObject *self, PyObject *args)
+{
+    return PyLong_FromLong(getThreadCount());
+}
+
+PyObject* setBlendKernel(PyObject *self, PyObject *args)
+{
+    const char *name = NULL;
+
+    if(!PyArg_ParseTuple(args, "s", &name))
+    {
+        PyErr_SetString(PyExc_TypeError, "magicautils.set_blend_kernel(name: str): Expected one str.");
+        return NULL;
+    }
+
+    if(!setBlendKernels(name))
+    {
+        char errorMessageBuffer[1024];
+
+        snprintf(errorMessageBuffer, sizeof(errorMessageBuffer), "magicautils.set_blend_kernel(name: str): Blend kernel \"%s\" isn't supported.", name);
+
+        PyErr_SetString(PyExc_ValueError, errorMessageBuffer);
+        return NULL;
+    }
+
+    Py_INCREF(Py_None);
+    return Py_None;
+}
+
+PyObject* getBlendKernel(PyObject *self, PyObject *args)
+{
+    return PyUnicode_FromString(getBlendKernels()->name);
+}
+
+PyObject* getSupportedBlendKernelsList(PyObject *self, PyObject *args)
+{
+    const blendkernels_t **supported = getSupportedBlendKernels();
+    PyObject *list = PyList_New(0);
+
+    if(list == NULL)
+    {
+        return NULL;
+    }
+
+    for(int i = 0; supported[i] != NULL; i++)
+    {
+        PyObject *name = PyUnicode_FromString(supported[i]->name);
+
+        if(name == NULL || PyList_Append(list, name) < 0)
+        {
+            Py_XDECREF(name);
+            Py_DECREF(list);
+            return NULL;
+        }
+
+        Py_DECREF(name);
+    }
+
+    return list;
+}
+
 }
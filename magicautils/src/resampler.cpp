@@ -0,0 +1,239 @@
+#include <math.h>
+#include <string.h>
+#include <algorithm>
+#include <vector>
+#include "resampler.h"
+#include "threadpool.h"
+
+// Weights are fixed point numbers, sum of weights of one output pixel is 1 << WEIGHT_BITS
+#define WEIGHT_BITS 14
+// Minimal count of pixels resampled by one thread
+#define PIXELS_PER_BAND 65536
+
+// Source runs and weights of every output pixel along one axis
+struct axisweights_t {
+    std::vector<int> start;
+    std::vector<int> count;
+    // "stride" weights for every output pixel, only first "count" of them are used
+    std::vector<int> weights;
+    int stride;
+};
+
+static axisweights_t computeWeights(int sourceSize, int size, ResampleFilter filter)
+{
+    axisweights_t axis;
+
+    double scale = double(sourceSize) / double(size);
+    // Filter is widened when image is scaled down, so it covers all source pixels
+    double filterScale = scale > 1.0 ? scale : 1.0;
+    double support = (filter == ResampleFilter::BOX ? 0.5 : 1.0) * filterScale;
+
+    axis.stride = int(ceil(support * 2.0)) + 2;
+    axis.start.resize(size);
+    axis.count.resize(size);
+    axis.weights.assign((size_t)size * axis.stride, 0);
+
+    std::vector<double> weights(axis.stride);
+
+    for(int i = 0; i < size; i++)
+    {
+        // Center of output pixel in source coordinates
+        double center = (i + 0.5) * scale;
+        int start = int(floor(center - support));
+        int end = int(ceil(center + support));
+
+        start = start > 0 ? start : 0;
+        end = end < sourceSize ? end : sourceSize;
+
+        double sum = 0.0;
+
+        for(int j = start; j < end; j++)
+        {
+            double weight;
+
+            if(filter == ResampleFilter::BOX)
+            {
+                // Part of source pixel covered by output pixel
+                double low = j > center - support ? j : center - support;
+                double high = j + 1 < center + support ? j + 1 : center + support;
+
+                weight = high > low ? high - low : 0.0;
+            }
+            else
+            {
+                double distance = fabs(j + 0.5 - center) / filterScale;
+
+                weight = distance < 1.0 ? 1.0 - distance : 0.0;
+            }
+
+            weights[j - start] = weight;
+            sum += weight;
+        }
+
+        // Skip pixels with zero weight on both sides of the run
+        int first = 0;
+        int last = end - start - 1;
+
+        while(first < last && weights[first] == 0.0)
+        {
+            first++;
+        }
+
+        while(last > first && weights[last] == 0.0)
+        {
+            last--;
+        }
+
+        int *out = axis.weights.data() + (size_t)i * axis.stride;
+        int total = 0;
+        int largest = 0;
+
+        for(int j = 0; j <= last - first; j++)
+        {
+            out[j] = sum > 0.0 ? int(weights[first + j] / sum * (1 << WEIGHT_BITS) + 0.5) : (j == 0 ? 1 << WEIGHT_BITS : 0);
+            total += out[j];
+            largest = out[j] > out[largest] ? j : largest;
+        }
+
+        // Rounding error goes to the largest weight, so weights sum to one exactly
+        out[largest] += (1 << WEIGHT_BITS) - total;
+
+        start += first;
+        end = start + last - first + 1;
+
+        axis.start[i] = start;
+        axis.count[i] = end - start;
+    }
+
+    return axis;
+}
+
+static void resampleNearest(const unsigned char *source, int sourceWidth, int sourceHeight, unsigned char *out, int width, int height)
+{
+    float xScaleFactor = float(sourceWidth) / float(width);
+    float yScaleFactor = float(sourceHeight) / float(height);
+
+    std::vector<int> sourceX(width);
+
+    for(int x = 0; x < width; x++)
+    {
+        int scaledX = int(float(x) * xScaleFactor);
+        sourceX[x] = scaledX < sourceWidth - 1 ? scaledX : sourceWidth - 1;
+    }
+
+    parallelFor(height, PIXELS_PER_BAND / width + 1, [&](int begin, int end) {
+        for(int y = begin; y < end; y++)
+        {
+            int scaledY = int(float(y) * yScaleFactor);
+            scaledY = scaledY < sourceHeight - 1 ? scaledY : sourceHeight - 1;
+
+            const unsigned char *sourceRow = source + (size_t)scaledY * sourceWidth * 4;
+            unsigned char *outRow = out + (size_t)y * width * 4;
+
+            for(int x = 0; x < width; x++)
+            {
+                memcpy(outRow + x * 4, sourceRow + sourceX[x] * 4, 4);
+            }
+        }
+    });
+}
+
+void resampleImage(const unsigned char *source, int sourceWidth, int sourceHeight, unsigned char *out, int width, int height, ResampleFilter filter)
+{
+    if(width <= 0 || height <= 0 || sourceWidth <= 0 || sourceHeight <= 0)
+    {
+        return;
+    }
+
+    if(filter == ResampleFilter::NEAREST)
+    {
+        resampleNearest(source, sourceWidth, sourceHeight, out, width, height);
+        return;
+    }
+
+    axisweights_t columns = computeWeights(sourceWidth, width, filter);
+    axisweights_t rows = computeWeights(sourceHeight, height, filter);
+
+    // Source scaled along y axis. Channels are premultiplied by alpha and multiplied by 255
+    // ( alpha too ), so they lie in 0-65025 range and keep precision between passes.
+    // Columns are scaled first, as whole source rows are accumulated with one weight, so the large
+    // image is read sequentially, and the loop is simple enough to be vectorized by compiler
+    std::vector<unsigned short> intermediate((size_t)height * sourceWidth * 4);
+
+    parallelFor(height, PIXELS_PER_BAND / sourceWidth + 1, [&](int begin, int end) {
+        std::vector<unsigned int> accumulator((size_t)sourceWidth * 4);
+
+        for(int y = begin; y < end; y++)
+        {
+            const int *weights = rows.weights.data() + (size_t)y * rows.stride;
+
+            std::fill(accumulator.begin(), accumulator.end(), 0);
+
+            for(int i = 0; i < rows.count[y]; i++)
+            {
+                const unsigned char *pixel = source + (size_t)(rows.start[y] + i) * sourceWidth * 4;
+                unsigned int weight = weights[i];
+                unsigned int *accumulated = accumulator.data();
+
+                for(int x = 0; x < sourceWidth; x++, pixel += 4, accumulated += 4)
+                {
+                    unsigned int alphaWeight = weight * pixel[3];
+
+                    accumulated[0] += alphaWeight * pixel[0];
+                    accumulated[1] += alphaWeight * pixel[1];
+                    accumulated[2] += alphaWeight * pixel[2];
+                    accumulated[3] += alphaWeight * 255;
+                }
+            }
+
+            unsigned short *outRow = intermediate.data() + (size_t)y * sourceWidth * 4;
+
+            for(size_t j = 0; j < accumulator.size(); j++)
+            {
+                outRow[j] = (accumulator[j] + (1 << (WEIGHT_BITS - 1))) >> WEIGHT_BITS;
+            }
+        }
+    });
+
+    parallelFor(height, PIXELS_PER_BAND / (sourceWidth + width) + 1, [&](int begin, int end) {
+        for(int y = begin; y < end; y++)
+        {
+            const unsigned short *row = intermediate.data() + (size_t)y * sourceWidth * 4;
+            unsigned char *outRow = out + (size_t)y * width * 4;
+
+            for(int x = 0; x < width; x++)
+            {
+                const unsigned short *pixel = row + columns.start[x] * 4;
+                const int *weights = columns.weights.data() + (size_t)x * columns.stride;
+                unsigned int accumulated[4] = {0, 0, 0, 0};
+
+                for(int i = 0; i < columns.count[x]; i++, pixel += 4)
+                {
+                    for(int c = 0; c < 4; c++)
+                    {
+                        accumulated[c] += weights[i] * pixel[c];
+                    }
+                }
+
+                unsigned int alpha = (accumulated[3] + (1 << (WEIGHT_BITS - 1))) >> WEIGHT_BITS;
+
+                outRow[x * 4 + 3] = (alpha + 127) / 255;
+
+                for(int c = 0; c < 3; c++)
+                {
+                    if(alpha == 0)
+                    {
+                        outRow[x * 4 + c] = 0;
+                        continue;
+                    }
+
+                    // Undo premultiplication
+                    unsigned int color = (accumulated[c] + (1 << (WEIGHT_BITS - 1))) >> WEIGHT_BITS;
+                    unsigned int value = (color * 255 + alpha / 2) / alpha;
+
+                    outRow[x * 4 + c] = value < 255 ? value : 255;
+                }
+            }
+        }
+    });
+}
@@ -0,0 +1,26 @@
+#ifndef RESAMPLER_H
+#define RESAMPLER_H
+/*
+Image resampling for canvas scaling. Smooth filters are separable: every output pixel is a weighted sum
+of a run of source pixels, first along rows, then along columns, and weights of every output column and row
+are computed once before resampling. Both passes walk images row by row and are split between threads.
+Colors are averaged with premultiplied alpha, so transparent pixels don't darken edges.
+
+Functions don't use Python API, so they can be called without holding the GIL.
+*/
+
+enum ResampleFilter
+{
+    NEAREST,
+    // Tent filter, that is widened when image is scaled down, so every source pixel contributes
+    BILINEAR,
+    // Average of source pixels covered by output pixel
+    BOX
+};
+
+/*
+Scales "source" image of sourceWidth x sourceHeight RGBA pixels to width x height pixels into "out".
+*/
+void resampleImage(const unsigned char *source, int sourceWidth, int sourceHeight, unsigned char *out, int width, int height, ResampleFilter filter);
+
+#endif // RESAMPLER_H
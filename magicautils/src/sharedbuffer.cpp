@@ -0,0 +1,220 @@
+#include <stdlib.h>
+#include <string.h>
+#include <new>
+#include "sharedbuffer.h"
+
+sharedbuffer_t *createSharedBuffer(unsigned int width, unsigned int height)
+{
+    sharedbuffer_t *buffer = new sharedbuffer_t;
+
+    buffer->references = 1;
+    buffer->width = width;
+    buffer->height = height;
+    buffer->tilesX = (width + TILE_SIZE - 1) / TILE_SIZE;
+    buffer->tilesY = (height + TILE_SIZE - 1) / TILE_SIZE;
+    buffer->tiles = new unsigned char[buffer->tilesX * buffer->tilesY]();
+    buffer->contentRect = emptyRect();
+    buffer->contentRectExact = true;
+
+    // calloc gets zeroed pages from system instead of filling them, so untouched pages don't take memory.
+    // One extra byte to get valid pointer for empty buffer
+    buffer->data = (unsigned char*)calloc((size_t)width * height * 4 + 1, 1);
+
+    if(buffer->data == NULL)
+    {
+        delete[] buffer->tiles;
+        delete buffer;
+
+        throw std::bad_alloc();
+    }
+
+    return buffer;
+}
+
+sharedbuffer_t *copySharedBuffer(const sharedbuffer_t *buffer)
+{
+    sharedbuffer_t *copy = createSharedBuffer(buffer->width, buffer->height);
+
+    memcpy(copy->tiles, buffer->tiles, buffer->tilesX * buffer->tilesY);
+    copy->contentRect = buffer->contentRect;
+    copy->contentRectExact = buffer->contentRectExact;
+
+    for(unsigned int tileY = 0; tileY < buffer->tilesY; tileY++)
+    {
+        unsigned int y0 = tileY * TILE_SIZE;
+        unsigned int y1 = y0 + TILE_SIZE < buffer->height ? y0 + TILE_SIZE : buffer->height;
+
+        // Copy runs of used tiles in tiles row at once
+        unsigned int tileX = 0;
+
+        while(tileX < buffer->tilesX)
+        {
+            if(!isSharedBufferTileUsed(buffer, tileX, tileY))
+            {
+                tileX++;
+                continue;
+            }
+
+            unsigned int runStart = tileX;
+
+            while(tileX < buffer->tilesX && isSharedBufferTileUsed(buffer, tileX, tileY))
+            {
+                tileX++;
+            }
+
+            unsigned int x0 = runStart * TILE_SIZE;
+            unsigned int x1 = tileX * TILE_SIZE < buffer->width ? tileX * TILE_SIZE : buffer->width;
+
+            for(unsigned int y = y0; y < y1; y++)
+            {
+                size_t offset = ((size_t)y * buffer->width + x0) * 4;
+
+                memcpy(copy->data + offset, buffer->data + offset, (x1 - x0) * 4);
+            }
+        }
+    }
+
+    return copy;
+}
+
+sharedbuffer_t *retainSharedBuffer(sharedbuffer_t *buffer)
+{
+    buffer->references++;
+
+    return buffer;
+}
+
+void releaseSharedBuffer(sharedbuffer_t *buffer)
+{
+    if(buffer == NULL)
+    {
+        return;
+    }
+
+    buffer->references--;
+
+    if(buffer->references == 0)
+    {
+        free(buffer->data);
+        delete[] buffer->tiles;
+        delete buffer;
+    }
+}
+
+void markSharedBufferTiles(sharedbuffer_t *buffer, rect_t rect)
+{
+    rect = intersectRects(rect, {0, 0, (int)buffer->width, (int)buffer->height});
+
+    if(isRectEmpty(rect))
+    {
+        return;
+    }
+
+    for(int tileY = rect.y0 / TILE_SIZE; tileY <= (rect.y1 - 1) / TILE_SIZE; tileY++)
+    {
+        for(int tileX = rect.x0 / TILE_SIZE; tileX <= (rect.x1 - 1) / TILE_SIZE; tileX++)
+        {
+            buffer->tiles[tileY * buffer->tilesX + tileX] = 1;
+        }
+    }
+
+    buffer->contentRect = uniteRects(buffer->contentRect, rect);
+    buffer->contentRectExact = false;
+}
+
+rect_t getSharedBufferContentRect(sharedbuffer_t *buffer)
+{
+    if(buffer->contentRectExact)
+    {
+        return buffer->contentRect;
+    }
+
+    // Content can only be inside of known bounds, in used tiles
+    rect_t bounds = buffer->contentRect;
+    rect_t content = emptyRect();
+
+    for(int y = bounds.y0; y < bounds.y1; y++)
+    {
+        const unsigned int *row = (const unsigned int*)(buffer->data + (size_t)y * buffer->width * 4);
+        int left = -1;
+        int right = -1;
+
+        // Find first non-transparent pixel from the left side and then from the right side
+        for(int x = bounds.x0; x < bounds.x1 && left < 0; x++)
+        {
+            if(!isSharedBufferTileUsed(buffer, x / TILE_SIZE, y / TILE_SIZE))
+            {
+                x = (x / TILE_SIZE + 1) * TILE_SIZE - 1;
+                continue;
+            }
+
+            if(row[x] != 0)
+            {
+                left = x;
+            }
+        }
+
+        if(left < 0)
+        {
+            continue;
+        }
+
+        for(int x = bounds.x1 - 1; x >= left && right < 0; x--)
+        {
+            if(!isSharedBufferTileUsed(buffer, x / TILE_SIZE, y / TILE_SIZE))
+            {
+                x = (x / TILE_SIZE) * TILE_SIZE;
+                continue;
+            }
+
+            if(row[x] != 0)
+            {
+                right = x;
+            }
+        }
+
+        content = uniteRects(content, {left, y, right + 1, y + 1});
+    }
+
+    buffer->contentRect = content;
+    buffer->contentRectExact = true;
+
+    return content;
+}
+
+void updateSharedBufferTiles(sharedbuffer_t *buffer)
+{
+    memset(buffer->tiles, 0, buffer->tilesX * buffer->tilesY);
+    buffer->contentRect = emptyRect();
+    buffer->contentRectExact = false;
+
+    for(unsigned int y = 0; y < buffer->height; y++)
+    {
+        const unsigned int *row = (const unsigned int*)(buffer->data + (size_t)y * buffer->width * 4);
+        unsigned char *tilesRow = buffer->tiles + (y / TILE_SIZE) * buffer->tilesX;
+
+        for(unsigned int tileX = 0; tileX < buffer->tilesX; tileX++)
+        {
+            // Tile is already known to be used
+            if(tilesRow[tileX])
+            {
+                continue;
+            }
+
+            unsigned int x1 = (tileX + 1) * TILE_SIZE < buffer->width ? (tileX + 1) * TILE_SIZE : buffer->width;
+
+            for(unsigned int x = tileX * TILE_SIZE; x < x1; x++)
+            {
+                if(row[x] != 0)
+                {
+                    tilesRow[tileX] = 1;
+                    // Content bounds are made of whole tiles, getSharedBufferContentRect() finds exact ones
+                    buffer->contentRect = uniteRects(buffer->contentRect, {(int)(tileX * TILE_SIZE), (int)(y - y % TILE_SIZE), (int)x1, (int)(y - y % TILE_SIZE + TILE_SIZE)});
+                    break;
+                }
+            }
+        }
+    }
+
+    buffer->contentRect = intersectRects(buffer->contentRect, {0, 0, (int)buffer->width, (int)buffer->height});
+}
@@ -0,0 +1,77 @@
+#ifndef SHAREDBUFFER_H
+#define SHAREDBUFFER_H
+/*
+Reference counted RGBA pixels storage, that is shared between canvases until one of them changes it ( copy-on-write ).
+Reference count isn't atomic, so buffers must be retained and released only while holding the GIL.
+
+Storage is split into TILE_SIZE x TILE_SIZE tiles, and buffer tracks which of them may contain
+non-transparent pixels, so operations can skip empty tiles ( f.e. compositing of sparse layers ).
+Memory is allocated zeroed by system, so pages of never touched tiles usually aren't backed by memory.
+*/
+
+#include "rect.h"
+
+#define TILE_SIZE 64
+
+struct sharedbuffer_t {
+    int references;
+    unsigned int width;
+    unsigned int height;
+    unsigned int tilesX;
+    unsigned int tilesY;
+    // tilesX * tilesY flags: 0 if all pixels of tile are (0, 0, 0, 0), 1 if tile may contain other pixels
+    unsigned char *tiles;
+    // Bounds of non-transparent pixels. Writers only extend it, so it may be larger than
+    // actual content until getSharedBufferContentRect() shrinks it
+    rect_t contentRect;
+    bool contentRectExact;
+    unsigned char *data;
+};
+
+// Creates transparent buffer for width x height pixels, with one reference
+sharedbuffer_t *createSharedBuffer(unsigned int width, unsigned int height);
+
+// Creates buffer with copy of "buffer" data, with one reference. Only used tiles are copied
+sharedbuffer_t *copySharedBuffer(const sharedbuffer_t *buffer);
+
+sharedbuffer_t *retainSharedBuffer(sharedbuffer_t *buffer);
+
+// Frees buffer when the last reference is released. Accepts NULL
+void releaseSharedBuffer(sharedbuffer_t *buffer);
+
+// Marks tiles that intersect "rect" as used and extends content bounds. Must be called after changing pixels
+void markSharedBufferTiles(sharedbuffer_t *buffer, rect_t rect);
+
+// Returns exact bounds of non-transparent pixels
+rect_t getSharedBufferContentRect(sharedbuffer_t *buffer);
+
+// Finds used tiles by checking their pixels ( f.e. after pixels were changed through exported buffer )
+void updateSharedBufferTiles(sharedbuffer_t *buffer);
+
+// Marks tile containing pixel as used, pixel must lie inside buffer
+inline void markSharedBufferPixel(sharedbuffer_t *buffer, int x, int y)
+{
+    buffer->tiles[(y / TILE_SIZE) * buffer->tilesX + x / TILE_SIZE] = 1;
+    buffer->contentRect = includePoint(buffer->contentRect, x, y);
+    buffer->contentRectExact = false;
+}
+
+// Marks tile containing pixel as used without extending content bounds, so writers of many pixels
+// can extend bounds once with extendSharedBufferContent(). Pixel must lie inside buffer
+inline void markSharedBufferTile(sharedbuffer_t *buffer, int x, int y)
+{
+    buffer->tiles[(y / TILE_SIZE) * buffer->tilesX + x / TILE_SIZE] = 1;
+}
+
+inline void extendSharedBufferContent(sharedbuffer_t *buffer, rect_t rect)
+{
+    buffer->contentRect = uniteRects(buffer->contentRect, rect);
+    buffer->contentRectExact = false;
+}
+
+inline bool isSharedBufferTileUsed(const sharedbuffer_t *buffer, unsigned int tileX, unsigned int tileY)
+{
+    return buffer->tiles[tileY * buffer->tilesX + tileX] != 0;
+}
+
+#endif // SHAREDBUFFER_H
@@ -0,0 +1,144 @@
+#include <math.h>
+#include <stdlib.h>
+#include <map>
+#include "stamp.h"
+#include "alphablending.h"
+
+// Stamps of a few brushes are usually used at once, so cache is cleared when it grows over this count
+#define MAX_CACHED_STAMPS 32
+
+// Cache is used only while holding the GIL, so it doesn't need locking
+static std::map<long long, stamp_t*> stampCache;
+
+static stamp_t *createStamp(int size, StampShape shape, int hardness)
+{
+    stamp_t *stamp = (stamp_t*)malloc(sizeof(stamp_t));
+
+    stamp->size = size;
+    stamp->mask = (unsigned char*)malloc(size * size);
+    stamp->rowStart = (int*)malloc(size * sizeof(int));
+    stamp->rowEnd = (int*)malloc(size * sizeof(int));
+
+    // Distances are measured from center of stamp to centers of pixels
+    float center = (size - 1) * 0.5f;
+    float radius = size * 0.5f;
+    float hardRadius = radius * hardness / 255.0f;
+
+    for(int y = 0; y < size; y++)
+    {
+        stamp->rowStart[y] = size;
+        stamp->rowEnd[y] = 0;
+
+        for(int x = 0; x < size; x++)
+        {
+            float dx = fabsf(x - center);
+            float dy = fabsf(y - center);
+            float distance = shape == StampShape::ROUND ? sqrtf(dx * dx + dy * dy) : fmaxf(dx, dy);
+            unsigned char coverage = 0;
+
+            if(distance <= hardRadius)
+            {
+                coverage = 255;
+            }
+            else if(distance < radius)
+            {
+                coverage = (unsigned char)((radius - distance) / (radius - hardRadius) * 255.0f + 0.5f);
+            }
+
+            stamp->mask[y * size + x] = coverage;
+
+            if(coverage != 0)
+            {
+                stamp->rowStart[y] = stamp->rowStart[y] < x ? stamp->rowStart[y] : x;
+                stamp->rowEnd[y] = x + 1;
+            }
+        }
+    }
+
+    return stamp;
+}
+
+static void freeStamp(stamp_t *stamp)
+{
+    free(stamp->mask);
+    free(stamp->rowStart);
+    free(stamp->rowEnd);
+    free(stamp);
+}
+
+const stamp_t *getStamp(int size, StampShape shape, int hardness)
+{
+    long long key = ((long long)size * 2 + shape) * 256 + hardness;
+    auto found = stampCache.find(key);
+
+    if(found != stampCache.end())
+    {
+        return found->second;
+    }
+
+    if(stampCache.size() >= MAX_CACHED_STAMPS)
+    {
+        for(auto &cached : stampCache)
+        {
+            freeStamp(cached.second);
+        }
+
+        stampCache.clear();
+    }
+
+    stamp_t *stamp = createStamp(size, shape, hardness);
+    stampCache[key] = stamp;
+
+    return stamp;
+}
+
+rect_t drawStamp(sharedbuffer_t *buffer, const stamp_t *stamp, int x, int y, const unsigned char *color, int opacity)
+{
+    int size = stamp->size;
+    int left = x - (size - 1) / 2;
+    int top = y - (size - 1) / 2;
+
+    rect_t clipped = intersectRects({left, top, left + size, top + size}, {0, 0, (int)buffer->width, (int)buffer->height});
+
+    if(isRectEmpty(clipped))
+    {
+        return emptyRect();
+    }
+
+    // Alpha for every coverage, so pixels are blended without extra divisions
+    unsigned char alphas[256];
+    int colorAlpha = color[3] * opacity;
+
+    for(int coverage = 0; coverage < 256; coverage++)
+    {
+        alphas[coverage] = (colorAlpha * coverage + 65025 / 2) / 65025;
+    }
+
+    rect_t changed = emptyRect();
+
+    for(int pixelY = clipped.y0; pixelY < clipped.y1; pixelY++)
+    {
+        int maskY = pixelY - top;
+        int x0 = left + stamp->rowStart[maskY] > clipped.x0 ? left + stamp->rowStart[maskY] : clipped.x0;
+        int x1 = left + stamp->rowEnd[maskY] < clipped.x1 ? left + stamp->rowEnd[maskY] : clipped.x1;
+
+        if(x0 >= x1)
+        {
+            continue;
+        }
+
+        const unsigned char *mask = stamp->mask + maskY * size + (x0 - left);
+        unsigned char *pixel = buffer->data + ((size_t)pixelY * buffer->width + x0) * 4;
+
+        for(int pixelX = x0; pixelX < x1; pixelX++, mask++, pixel += 4)
+        {
+            blendPixelOver(pixel, color, alphas[*mask]);
+        }
+
+        changed = uniteRects(changed, {x0, pixelY, x1, pixelY + 1});
+    }
+
+    markSharedBufferTiles(buffer, changed);
+
+    return changed;
+}
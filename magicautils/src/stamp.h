@@ -0,0 +1,41 @@
+#ifndef STAMP_H
+#define STAMP_H
+/*
+Brush stamps. Stamp is a size x size mask of coverage ( 0-255 ) of round or square brush, that is blended
+over pixels with brush color. Strokes place the same stamp many times, so masks are computed once
+per size, shape and hardness and kept in cache.
+*/
+
+#include "rect.h"
+#include "sharedbuffer.h"
+
+#define MAX_STAMP_SIZE 1024
+
+enum StampShape
+{
+    ROUND,
+    SQUARE
+};
+
+struct stamp_t {
+    int size;
+    // size * size coverages, row by row
+    unsigned char *mask;
+    // Bounds of non-zero coverage for every row, so transparent corners of round stamps are skipped
+    int *rowStart;
+    int *rowEnd;
+};
+
+/*
+Returns cached stamp for "size" ( 1 - MAX_STAMP_SIZE ), "shape" and "hardness" ( 0-255, part of radius,
+where coverage is full, coverage fades to zero outside of it ). Stamp is owned by cache.
+*/
+const stamp_t *getStamp(int size, StampShape shape, int hardness);
+
+/*
+Blends "stamp" with "color" and "opacity" ( 0-255 ) over "buffer", centering it at (x, y), and marks changed tiles.
+Returns bounds of changed pixels ( empty if stamp lies out of buffer ).
+*/
+rect_t drawStamp(sharedbuffer_t *buffer, const stamp_t *stamp, int x, int y, const unsigned char *color, int opacity);
+
+#endif // STAMP_H
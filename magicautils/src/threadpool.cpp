@@ -0,0 +1,195 @@
+#include <thread>
+#include <mutex>
+#include <condition_variable>
+#include <deque>
+#include <vector>
+#include "threadpool.h"
+
+// Set of bands of one parallelFor call
+struct batch_t {
+    std::mutex mutex;
+    std::condition_variable done;
+    int remaining;
+};
+
+struct job_t {
+    batch_t *batch;
+    const std::function<void(int, int)> *task;
+    int begin;
+    int end;
+};
+
+// Guards starting and stopping of workers. Always locked before poolMutex
+static std::mutex lifecycleMutex;
+static std::mutex poolMutex;
+static std::condition_variable poolCondition;
+static std::deque<job_t> jobs;
+static std::vector<std::thread> workers;
+static bool stopping = false;
+// 0 means "use number of CPU cores"
+static int threadCount = 0;
+
+static void runJob(job_t job)
+{
+    (*job.task)(job.begin, job.end);
+
+    std::lock_guard<std::mutex> lock(job.batch->mutex);
+
+    job.batch->remaining--;
+
+    if(job.batch->remaining == 0)
+    {
+        job.batch->done.notify_all();
+    }
+}
+
+static void workerLoop()
+{
+    while(true)
+    {
+        job_t job;
+
+        {
+            std::unique_lock<std::mutex> lock(poolMutex);
+
+            poolCondition.wait(lock, [] { return stopping || !jobs.empty(); });
+
+            if(jobs.empty())
+            {
+                // Pool is stopping and there is no work left
+                return;
+            }
+
+            job = jobs.front();
+            jobs.pop_front();
+        }
+
+        runJob(job);
+    }
+}
+
+int getThreadCount()
+{
+    if(threadCount > 0)
+    {
+        return threadCount;
+    }
+
+    int cores = std::thread::hardware_concurrency();
+
+    return cores > 0 ? cores : 1;
+}
+
+void stopThreadPool()
+{
+    std::lock_guard<std::mutex> lifecycleLock(lifecycleMutex);
+
+    {
+        std::lock_guard<std::mutex> lock(poolMutex);
+        stopping = true;
+    }
+
+    poolCondition.notify_all();
+
+    for(std::thread &worker : workers)
+    {
+        worker.join();
+    }
+
+    workers.clear();
+    stopping = false;
+}
+
+void setThreadCount(int count)
+{
+    stopThreadPool();
+
+    std::lock_guard<std::mutex> lifecycleLock(lifecycleMutex);
+
+    threadCount = count > 0 ? count : 0;
+}
+
+void parallelFor(int count, int minBandSize, const std::function<void(int, int)> &task)
+{
+    if(count <= 0)
+    {
+        return;
+    }
+
+    int threads = getThreadCount();
+
+    if(minBandSize < 1)
+    {
+        minBandSize = 1;
+    }
+
+    // Use few bands per thread, so threads that finished earlier can take the rest of the work
+    int bandSize = (count + threads * 4 - 1) / (threads * 4);
+
+    if(bandSize < minBandSize)
+    {
+        bandSize = minBandSize;
+    }
+
+    int bands = (count + bandSize - 1) / bandSize;
+
+    if(threads == 1 || bands == 1)
+    {
+        task(0, count);
+        return;
+    }
+
+    batch_t batch;
+    batch.remaining = bands;
+
+    {
+        std::lock_guard<std::mutex> lifecycleLock(lifecycleMutex);
+        std::lock_guard<std::mutex> lock(poolMutex);
+
+        // Start workers lazily. Calling thread works too, so we need one thread less
+        while((int)workers.size() < threads - 1)
+        {
+            workers.emplace_back(workerLoop);
+        }
+
+        for(int begin = 0; begin < count; begin += bandSize)
+        {
+            jobs.push_back({&batch, &task, begin, begin + bandSize < count ? begin + bandSize : count});
+        }
+    }
+
+    poolCondition.notify_all();
+
+    // Help workers with jobs of this batch while they are not done
+    while(true)
+    {
+        job_t job;
+        bool found = false;
+
+        {
+            std::lock_guard<std::mutex> lock(poolMutex);
+
+            for(auto it = jobs.begin(); it != jobs.end(); it++)
+            {
+                if(it->batch == &batch)
+                {
+                    job = *it;
+                    jobs.erase(it);
+                    found = true;
+                    break;
+                }
+            }
+        }
+
+        if(!found)
+        {
+            break;
+        }
+
+        runJob(job);
+    }
+
+    std::unique_lock<std::mutex> lock(batch.mutex);
+
+    batch.done.wait(lock, [&batch] { return batch.remaining == 0; });
+}
@@ -0,0 +1,23 @@
+#ifndef THREADPOOL_H
+#define THREADPOOL_H
+/*
+Pool of worker threads for splitting heavy loops ( f.e. canvases rendering ) into parts.
+Functions of the pool don't use Python API, so they can be called without holding the GIL.
+*/
+
+#include <functional>
+
+/*
+Splits range [0, count) into bands of at least "minBandSize" items and calls task(begin, end) for every band
+on worker threads. Calling thread also takes part in the work. Returns when all bands are done.
+*/
+void parallelFor(int count, int minBandSize, const std::function<void(int, int)> &task);
+
+// Sets number of threads used by parallelFor. If count <= 0, number of CPU cores is used.
+void setThreadCount(int count);
+int getThreadCount();
+
+// Stops worker threads. Pool is started again on next parallelFor call.
+void stopThreadPool();
+
+#endif // THREADPOOL_H
@@ -1,19 +1,26 @@
 import sys
+from typing import Union
 
 from PIL import Image
-from PyQt5.QtWidgets import QApplication, QWidget, QMenuBar, QAction, QFileDialog, QListWidgetItem
+from PyQt5.QtWidgets import QApplication, QWidget, QMenuBar, QAction, QActionGroup, QFileDialog, QListWidgetItem, \
+    QProgressDialog, QMessageBox
 from PyQt5 import QtGui
-from PyQt5.QtCore import QPoint, QRect, QPointF, QUrl, Qt
+from PyQt5.QtCore import QPoint, QRect, QPointF, QUrl, Qt, QTimer
 from widgets.canvasview import CanvasView
 from widgets.newfilewindow import NewFileWindow
 from widgets.colorpicker import ColorPicker
 from widgets.resizesettingswindow import ResizeSettingsWindow
 from widgets.brushbutton import BrushButton
-from brushes.brushes import Brush, PenBrush, PickerBrush, StrokeBrush, FillBrush
-from utils.state_manager import StateManager
+from brushes.brushes import Brush, PenBrush, PickerBrush, StrokeBrush, FillBrush, StampBrush
+from utils.state_manager import StateManager, StatePatch
 from utils.keyboard_actions_manager import KeyboardActionsManager
-from utils.canvas_manager import CanvasManager
-from utils.color_converters import convert
+from utils.canvas_manager import CanvasManager, get_state_frames, load_project_frames
+from utils.rect import unite_rects
+from utils.project_file import ProjectFile, PROJECT_EXTENSION
+from utils.image_export import export_image
+from utils.image_import import load_image
+from utils.background_save import SaveThread
+from utils.autosave import Autosave, claim_orphaned_session, recover_session, remove_session_directory
 from ui.mainwindow.mainwindow import Ui_MainWindow
 from constants import blending as AlphaBlendingModes
 from utils.load_icon import load_icon
@@ -29,6 +36,10 @@ class MainWidget(Ui_MainWindow, QWidget):
         super().__init__()
 
         self.state_manager = StateManager()
+        # Journals changes on disk, so document is recovered after crash. Started when window is ready
+        self.autosave = Autosave()
+        # Snapshot of current document, that is restored when next full state change is cancelled
+        self.document_state = None
         self.keyboard_actions_manager = KeyboardActionsManager()
 
         self.keyboard_actions_manager.subscribe("Ctrl+Z", self.pop_state)
@@ -37,6 +48,11 @@ class MainWidget(Ui_MainWindow, QWidget):
 
         # Current editing file
         self.current_file = None
+        # Opened project, that is kept to save only changed layers into it
+        self.project: Union[ProjectFile, None] = None
+        # Save, that runs in background, only one save runs at a time
+        self.save_thread: Union[SaveThread, None] = None
+        self.save_progress_dialog: Union[QProgressDialog, None] = None
 
         # Current drawing size
         self.current_width = 96
@@ -67,12 +83,28 @@ class MainWidget(Ui_MainWindow, QWidget):
             parent=self
         )
 
+        # Cached composition of layers must be rebuilt when layers change
+        self.canvas_manager.subscribe(
+            self.canvas_view.invalidate_composite_cache)
+
         self.current_color = (255, 255, 255, 255)
 
         # To handle mouse move without mouse click
         self.setMouseTracking(True)
         self.canvas_view.setMouseTracking(True)
 
+        # Region of preview canvas changed by last use of brush, that doesn't draw directly
+        self.preview_rect = None
+
+        # Animation playback shows flattened frames, that are prepared when playback starts,
+        # and updates view only in regions where neighbour frames differ
+        self.playback_timer = QTimer(self)
+        self.playback_timer.timeout.connect(self.show_next_playback_frame)
+        self.playback_fps = 12
+        self.playback_frames: list[magicautils.Canvas] = list()
+        self.playback_rects: list = list()
+        self.playback_index = 0
+
         self.mouse_state = {
             "pressed": False,
             "canvas_start_pos": QPoint(0, 0),
@@ -91,12 +123,39 @@ class MainWidget(Ui_MainWindow, QWidget):
         self.stroke_brush = StrokeBrush()
         self.picker_brush = PickerBrush(self.handle_color_picking)
         self.fill_brush = FillBrush()
+        self.stamp_brush = StampBrush()
 
         self.current_brush = self.pen_brush
 
         self.initUI()
         self.save_state()
 
+        self.start_autosave()
+
+    def start_autosave(self):
+        self.autosave.start(self.get_state())
+
+        # Sessions are left in autosave directory by editors, that didn't exit normally,
+        # sessions of other running editors are skipped
+        orphaned_session = claim_orphaned_session()
+
+        if orphaned_session is None:
+            return
+
+        directory, lock = orphaned_session
+        recovered_state = recover_session(directory)
+
+        if recovered_state is not None:
+            answer = QMessageBox.question(self, "Восстановление",
+                                          "Программа была закрыта некорректно. Восстановить несохранённый рисунок?")
+
+            if answer == QMessageBox.StandardButton.Yes:
+                self.set_state(recovered_state)
+                self.save_state()
+
+        # Recovered document is kept by session of this editor now
+        remove_session_directory(directory, lock)
+
     # As QtDesigner does not supports menu bar in QWidget window, we create it here
     def init_menu_bar(self):
         menu = QMenuBar()
@@ -118,6 +177,10 @@ class MainWidget(Ui_MainWindow, QWidget):
         self.save_as_file_action = QAction("Сохранить как...", self)
         self.save_as_file_action.triggered.connect(self.handle_save_as_file)
 
+        # Saves only region with non-transparent pixels ( f.e. small sprite drawn on large canvas )
+        self.auto_trim_action = QAction("Обрезать пустые края при сохранении", self)
+        self.auto_trim_action.setCheckable(True)
+
         self.resize_canvas_action = QAction("Масштабировать", self)
         self.resize_canvas_action.triggered.connect(self.handle_resize_canvas)
 
@@ -125,10 +188,217 @@ class MainWidget(Ui_MainWindow, QWidget):
         file_menu.addAction(self.open_file_action)
         file_menu.addAction(self.save_file_action)
         file_menu.addAction(self.save_as_file_action)
+        file_menu.addAction(self.auto_trim_action)
         file_menu.addAction(self.resize_canvas_action)
 
+        fill_menu = menu.addMenu("Заливка")
+
+        self.global_fill_action = QAction("Заливать все похожие пиксели", self)
+        self.global_fill_action.setCheckable(True)
+        self.global_fill_action.toggled.connect(self.handle_global_fill_toggled)
+
+        self.diagonal_fill_action = QAction("Заливать по диагонали", self)
+        self.diagonal_fill_action.setCheckable(True)
+        self.diagonal_fill_action.toggled.connect(self.handle_diagonal_fill_toggled)
+
+        fill_menu.addAction(self.global_fill_action)
+        fill_menu.addAction(self.diagonal_fill_action)
+
+        self.add_choice_menu(fill_menu, "Допуск", [(str(tolerance), tolerance) for tolerance in (0, 8, 16, 32, 64)],
+                             self.fill_brush.tolerance, self.handle_fill_tolerance_change)
+
+        lines_menu = menu.addMenu("Линии")
+
+        self.antialiasing_action = QAction("Сглаживание", self)
+        self.antialiasing_action.setCheckable(True)
+        self.antialiasing_action.toggled.connect(self.handle_antialiasing_toggled)
+
+        lines_menu.addAction(self.antialiasing_action)
+
+        self.add_choice_menu(lines_menu, "Толщина", [(str(width), width) for width in (1, 2, 3, 4, 6, 8)],
+                             self.pen_brush.width, self.handle_line_width_change)
+
+        stamp_menu = menu.addMenu("Кисть")
+
+        self.add_choice_menu(stamp_menu, "Форма", [("Круглая", "round"), ("Квадратная", "square")],
+                             self.stamp_brush.shape, self.handle_stamp_shape_change)
+        self.add_choice_menu(stamp_menu, "Размер", [(str(size), size) for size in (1, 2, 4, 8, 16, 32, 64, 128)],
+                             self.stamp_brush.size, self.handle_stamp_size_change)
+        # Percents are shown, but brush keeps opacity and hardness in 0-255 range
+        self.add_choice_menu(stamp_menu, "Непрозрачность", [(f"{percent}%", percent * 255 // 100) for percent in (10, 25, 50, 75, 100)],
+                             self.stamp_brush.opacity, self.handle_stamp_opacity_change)
+        self.add_choice_menu(stamp_menu, "Жёсткость", [(f"{percent}%", percent * 255 // 100) for percent in (0, 25, 50, 75, 100)],
+                             self.stamp_brush.hardness, self.handle_stamp_hardness_change)
+
+        frames_menu = menu.addMenu("Кадры")
+
+        self.add_frame_action = QAction("Добавить кадр", self)
+        self.add_frame_action.triggered.connect(lambda: self.add_frame(False))
+
+        self.duplicate_frame_action = QAction("Дублировать кадр", self)
+        self.duplicate_frame_action.triggered.connect(lambda: self.add_frame(True))
+
+        self.remove_frame_action = QAction("Удалить кадр", self)
+        self.remove_frame_action.triggered.connect(self.remove_frame)
+
+        self.previous_frame_action = QAction("Предыдущий кадр", self)
+        self.previous_frame_action.triggered.connect(lambda: self.switch_frame(-1))
+
+        self.next_frame_action = QAction("Следующий кадр", self)
+        self.next_frame_action.triggered.connect(lambda: self.switch_frame(1))
+
+        self.play_action = QAction("Воспроизвести", self)
+        self.play_action.setCheckable(True)
+        self.play_action.toggled.connect(self.handle_play_toggled)
+
+        frames_menu.addAction(self.add_frame_action)
+        frames_menu.addAction(self.duplicate_frame_action)
+        frames_menu.addAction(self.remove_frame_action)
+        frames_menu.addAction(self.previous_frame_action)
+        frames_menu.addAction(self.next_frame_action)
+        frames_menu.addAction(self.play_action)
+
+        self.add_choice_menu(frames_menu, "Частота кадров", [(str(fps), fps) for fps in (6, 8, 12, 24, 30, 60)],
+                             self.playback_fps, self.handle_playback_fps_change)
+
         menu.setStyleSheet("background: #fff;")
 
+    def add_choice_menu(self, parent_menu, title: str, choices: list[tuple[str, object]], current, handler):
+        """
+        Adds submenu with checkable actions, only one of which is checked.
+        :param choices: pairs of action text and value, that is passed to handler when action is triggered
+        """
+
+        choice_menu = parent_menu.addMenu(title)
+        group = QActionGroup(self)
+
+        for text, value in choices:
+            action = QAction(text, self)
+            action.setCheckable(True)
+            action.setChecked(value == current)
+            # Bind value as default argument, otherwise all actions get the last one
+            action.triggered.connect(lambda checked, value=value: handler(value))
+
+            group.addAction(action)
+            choice_menu.addAction(action)
+
+    def handle_global_fill_toggled(self, checked: bool):
+        self.fill_brush.global_fill = checked
+
+    def handle_diagonal_fill_toggled(self, checked: bool):
+        self.fill_brush.connectivity = 8 if checked else 4
+
+    def handle_fill_tolerance_change(self, tolerance: int):
+        self.fill_brush.tolerance = tolerance
+
+    # Pen and stroke share line settings
+    def handle_antialiasing_toggled(self, checked: bool):
+        self.pen_brush.antialiased = checked
+        self.stroke_brush.antialiased = checked
+
+    def handle_line_width_change(self, width: int):
+        self.pen_brush.width = width
+        self.stroke_brush.width = width
+
+    def handle_stamp_shape_change(self, shape: str):
+        self.stamp_brush.shape = shape
+
+    def handle_stamp_size_change(self, size: int):
+        self.stamp_brush.size = size
+
+    def handle_stamp_opacity_change(self, opacity: int):
+        self.stamp_brush.opacity = opacity
+
+    def handle_stamp_hardness_change(self, hardness: int):
+        self.stamp_brush.hardness = hardness
+
+    def add_frame(self, duplicate: bool):
+        self.stop_playback()
+        self.canvas_manager.add_frame(duplicate)
+        self.handle_frame_change()
+        self.save_state()
+
+    def remove_frame(self):
+        # Document always has at least one frame
+        if self.canvas_manager.get_frames_count() == 1:
+            return
+
+        self.stop_playback()
+        self.canvas_manager.remove_frame(self.canvas_manager.get_current_frame_index())
+        self.handle_frame_change()
+        self.save_state()
+
+    def switch_frame(self, direction: int):
+        self.stop_playback()
+
+        # Animation is looped, so the first frame follows the last one
+        index = (self.canvas_manager.get_current_frame_index() + direction) % self.canvas_manager.get_frames_count()
+
+        if index == self.canvas_manager.get_current_frame_index():
+            return
+
+        self.canvas_manager.set_current_frame(index)
+        self.handle_frame_change()
+        # Journal of autosave and patches in history refer to layers of current frame
+        self.save_state()
+
+    def handle_frame_change(self):
+        # Layers of current frame are replaced by pixels of another frame
+        self.canvas = self.canvas_manager.get_current_canvas()
+        self.canvas.copy_content(self.preview_canvas)
+        self.canvas_view.update_view()
+        self.update_window_title()
+
+    def handle_play_toggled(self, checked: bool):
+        if checked:
+            self.start_playback()
+        else:
+            self.stop_playback()
+
+    def handle_playback_fps_change(self, fps: int):
+        self.playback_fps = fps
+
+        if self.playback_timer.isActive():
+            self.playback_timer.start(1000 // fps)
+
+    def start_playback(self):
+        if self.canvas_manager.get_frames_count() < 2:
+            self.play_action.setChecked(False)
+            return
+
+        # Stored frames keep their flattenings, so only changed frames are flattened again
+        self.playback_frames = [self.canvas_manager.get_flattened_frame(index)
+                                for index in range(self.canvas_manager.get_frames_count())]
+        # Region that changes when frame is shown after the previous one
+        self.playback_rects = [frame.get_difference_rect(self.playback_frames[index - 1])
+                               for index, frame in enumerate(self.playback_frames)]
+        self.playback_index = self.canvas_manager.get_current_frame_index()
+
+        self.canvas_view.set_playback_canvas(self.playback_frames[self.playback_index])
+        self.playback_timer.start(1000 // self.playback_fps)
+
+    def show_next_playback_frame(self):
+        self.playback_index = (self.playback_index + 1) % len(self.playback_frames)
+
+        rect = self.playback_rects[self.playback_index]
+
+        # Nothing to upload, if frame is the same as the previous one
+        if rect is None:
+            rect = (0, 0, 0, 0)
+
+        self.canvas_view.set_playback_canvas(self.playback_frames[self.playback_index], rect)
+
+    def stop_playback(self):
+        if not self.playback_timer.isActive():
+            return
+
+        self.playback_timer.stop()
+        self.playback_frames = list()
+        self.playback_rects = list()
+
+        self.play_action.setChecked(False)
+        self.canvas_view.set_playback_canvas(None)
+
     def initUI(self):
         self.setupUi(self)
         self.setWindowTitle("Magica Pixel")
@@ -143,6 +413,7 @@ class MainWidget(Ui_MainWindow, QWidget):
         self.add_brush("assets/icons/stroke.png", self.stroke_brush)
         self.add_brush("assets/icons/picker.png", self.picker_brush)
         self.add_brush("assets/icons/fill.png", self.fill_brush)
+        self.add_brush("assets/icons/stamp.png", self.stamp_brush)
 
         self.currentColorButton.clicked.connect(self.open_color_picker)
 
@@ -261,6 +532,8 @@ class MainWidget(Ui_MainWindow, QWidget):
             self.canvas_view.set_current_previewing_layer(index + direction)
             self.canvas = self.canvas_manager.get_current_canvas()
             self.canvas.copy_content(self.preview_canvas)
+            # Patches refer to layers by index, so order must be saved
+            self.save_state()
 
             # Update view
             self.canvas_view.update_view()
@@ -271,12 +544,14 @@ class MainWidget(Ui_MainWindow, QWidget):
 
         selected_item.setText(self.layerName.text())
         self.canvas_manager.set_canvas_name(item_index, self.layerName.text())
+        self.autosave.append_layers(self.canvases, self.canvas_manager.get_current_canvas_index())
 
         # Do not update list widget as we can loose focus in this case
 
     def handle_alpha_blending_change(self, index):
         current_canvas_index = self.canvas_manager.get_current_canvas_index()
         self.canvas_manager.set_canvas_settings(current_canvas_index, index)
+        self.autosave.append_layers(self.canvases, current_canvas_index)
 
         self.canvas_view.update_view()
 
@@ -318,7 +593,12 @@ class MainWidget(Ui_MainWindow, QWidget):
         resize_settings_window.show()
 
     def save_state(self):
-        self.state_manager.push_state(self.get_state())
+        state = self.get_state()
+
+        self.state_manager.push_state(state, self.document_state)
+        self.document_state = state
+
+        self.autosave.checkpoint(state)
 
     # Restores scaling and shifting in case you scaled/moved too far
     def restore_view(self):
@@ -326,29 +606,57 @@ class MainWidget(Ui_MainWindow, QWidget):
         self.canvas_view.set_shift(QPoint(0, 0))
 
         # Repaint canvas_view, otherwise user won't see changes till mouse move
-        self.canvas_view.repaint()
+        self.canvas_view.request_redraw()
 
     # Return to previous state ( in other words cancel last operation )
     def pop_state(self):
         state = self.state_manager.pop_state()
 
         if state is not None:
-            self.set_state(state)
+            self.apply_change(state)
 
     # Return to next state ( in other words recover cancelled operation )
     def recover_state(self):
         state = self.state_manager.recover_last_state()
 
         if state is not None:
-            self.set_state(state)
+            self.apply_change(state)
+
+    def apply_change(self, change):
+        if isinstance(change, StatePatch):
+            self.apply_patch(change)
+        else:
+            self.set_state(change)
+
+    def apply_patch(self, patch: StatePatch):
+        # Drop snapshot, so layer isn't copied when patch is written to it
+        self.document_state = None
+
+        canvas = self.canvases[patch.canvas_index][0]
+        canvas.write_region(*patch.rect, patch.after)
+
+        if patch.canvas_index == self.canvas_manager.get_current_canvas_index():
+            # View redraws only changed region of preview canvas
+            self.preview_canvas.write_region(*patch.rect, patch.after)
+        else:
+            self.canvas_view.invalidate_composite_cache()
+
+        self.document_state = self.get_state()
+        self.canvas_view.request_redraw()
+
+        self.autosave.append_patch(patch.canvas_index, patch.rect, patch.after, self.document_state)
 
     def get_state(self):
         state = {
             "current_width": self.current_width,
             "current_height": self.current_height,
             "current_file": self.current_file,
+            # Clones share pixels with layers until they're changed, so only changed layers take memory
             "canvases": [(canvas.clone(), name, settings) for canvas, name, settings in self.canvases],
-            "current_canvas": self.canvas_manager.get_current_canvas_index()
+            "current_canvas": self.canvas_manager.get_current_canvas_index(),
+            # Stored frames aren't changed, so they're shared with snapshot
+            "frames": self.canvas_manager.get_frames(),
+            "current_frame": self.canvas_manager.get_current_frame_index()
         }
 
         return state
@@ -358,14 +666,18 @@ class MainWidget(Ui_MainWindow, QWidget):
         self.current_height = state["current_height"]
         self.current_file = state["current_file"]
 
-        self.save_file_action.setDisabled(self.current_file is None)
-        self.update_window_title()
-
+        self.stop_playback()
         self.canvases.clear()
 
+        # Clone layers, so drawing doesn't change saved state ( cheap, as data is copied on first change )
         for canvas, name, settings in state["canvases"]:
             self.canvases.append([canvas.clone(), name, settings])
 
+        self.canvas_manager.set_frames(state.get("frames", [None]), state.get("current_frame", 0))
+
+        self.update_save_actions()
+        self.update_window_title()
+
         self.canvas_manager.set_current_editing_canvas(state["current_canvas"])
 
         # Resize view
@@ -375,6 +687,8 @@ class MainWidget(Ui_MainWindow, QWidget):
         # Copy content
         self.canvas = self.canvas_manager.get_current_canvas()
         self.canvas.copy_content(self.preview_canvas)
+        self.document_state = state
+        self.autosave.checkpoint(state)
 
         # Redraw
         self.update_layers_list()
@@ -398,7 +712,9 @@ class MainWidget(Ui_MainWindow, QWidget):
     # Resizes canvas content to fit width and height
     # and clears canvas content
     def create_new_canvas(self, width: int, height: int):
+        self.stop_playback()
         self.canvases.clear()
+        self.canvas_manager.set_frames([None], 0)
         self.canvases.append([
             magicautils.Canvas(width, height),
             "Main Layer",
@@ -411,11 +727,12 @@ class MainWidget(Ui_MainWindow, QWidget):
         self.canvas = self.canvas_manager.get_current_canvas()
 
         self.preview_canvas.clear()
-        self.canvas_view.repaint()
+        self.canvas_view.request_redraw()
         self.repaint()
 
         self.current_file = None
-        self.save_file_action.setDisabled(True)
+        self.update_save_actions()
+        self.close_project()
 
         self.update_window_title()
         self.update_layers_list()
@@ -427,39 +744,48 @@ class MainWidget(Ui_MainWindow, QWidget):
             return
 
         filename = self.current_file.replace("\\", "/", -1).split("/")[-1]
+        frames_count = self.canvas_manager.get_frames_count()
+
+        if frames_count > 1:
+            filename += f" ( кадр {self.canvas_manager.get_current_frame_index() + 1}/{frames_count} )"
 
         self.setWindowTitle(f"{filename} - Magica Pixel")
 
-    def resize_canvas_and_save_state(self, width: int, height: int, scale_contents: bool, smooth_scale: bool):
-        self.resize_canvas(width, height, scale_contents, smooth_scale)
+    def resize_canvas_and_save_state(self, width: int, height: int, scale_contents: bool, resampling: str):
+        self.resize_canvas(width, height, scale_contents, resampling)
         self.save_state()
 
-    def resize_canvas(self, width: int, height: int, scale_contents: bool = False, smooth_scale: bool = False):
+    def resize_canvas(self, width: int, height: int, scale_contents: bool = False, resampling: str = "nearest"):
+        self.stop_playback()
+
         for canvas, name, settings in self.canvases:
-            canvas.resize(width, height, scale_contents, smooth_scale)
+            canvas.resize(width, height, scale_contents, resampling)
+
+        self.canvas_manager.resize_frames(width, height, scale_contents, resampling)
 
-        self.preview_canvas.resize(width, height, scale_contents, smooth_scale)
+        self.preview_canvas.resize(width, height, scale_contents, resampling)
         self.canvas_view.resize_view(width, height)
         self.current_width = width
         self.current_height = height
 
     def handle_open_file(self):
         filepath: QUrl = QFileDialog.getOpenFileName(
-            self, "Save Image", "./", "Images (*.png *.jpg *.jpeg *.bmp *.ico)")[0]
+            self, "Save Image", "./", "Images and projects (*.mgpx *.png *.jpg *.jpeg *.bmp *.ico)")[0]
 
-        if filepath != '':
+        if filepath.endswith(PROJECT_EXTENSION):
+            self.open_project(filepath)
+        elif filepath != '':
             self.current_file = filepath
-            self.save_file_action.setEnabled(True)
+            self.update_save_actions()
+            self.close_project()
 
             # TODO: Add error handling ( e.g. when file structure is broken )
             im = Image.open(filepath)
 
+            # Image has one frame, so other frames don't need to be resized
+            self.canvas_manager.set_frames([None], 0)
             self.resize_canvas(im.width, im.height)
-            data = im.load()
-
-            for x in range(im.width):
-                for y in range(im.height):
-                    self.canvas.set_pixel(x, y, convert(data[x, y], im.mode))
+            load_image(self.canvas, im)
 
             self.canvases.clear()
 
@@ -469,6 +795,7 @@ class MainWidget(Ui_MainWindow, QWidget):
                 "Main Layer",
                 AlphaBlendingModes.OVER
             ])
+            self.canvas_manager.set_current_editing_canvas(0)
 
             self.canvas.copy_content(self.preview_canvas)
             self.canvas_view.set_current_previewing_layer(0)
@@ -481,34 +808,155 @@ class MainWidget(Ui_MainWindow, QWidget):
             # Update layers list as we changed it above
             self.update_layers_list()
 
+    def open_project(self, filepath: str):
+        # File may be written by save in flight
+        self.wait_for_save()
+
+        project = None
+
+        # Broken file is reported and current document stays open
+        try:
+            project = ProjectFile.open(filepath)
+            frames = load_project_frames(project)
+        except (ValueError, OSError) as error:
+            if project is not None:
+                project.close()
+
+            QMessageBox.warning(self, "Ошибка открытия", str(error))
+            return
+
+        self.close_project()
+        self.project = project
+
+        self.current_file = filepath
+        self.update_save_actions()
+
+        # Old layers and frames are replaced, so they don't need to be resized
+        self.canvases.clear()
+        self.canvas_manager.set_frames([None], 0)
+        self.resize_canvas(project.width, project.height)
+
+        current_frame = min(project.current_frame, len(frames) - 1)
+
+        for canvas, layer in zip(frames[current_frame].to_canvases(), project.layers):
+            self.canvases.append([canvas, layer.name, layer.alpha_blending])
+
+        frames[current_frame] = None
+        self.canvas_manager.set_frames(frames, current_frame)
+
+        self.canvas_manager.set_current_editing_canvas(project.current_layer)
+        self.canvas = self.canvas_manager.get_current_canvas()
+
+        self.canvas.copy_content(self.preview_canvas)
+        self.canvas_view.set_current_previewing_layer(self.canvas_manager.get_current_canvas_index())
+        self.canvas_view.update_view()
+        self.repaint()
+
+        self.save_state()
+
+        self.update_window_title()
+        self.update_layers_list()
+
+    def close_project(self):
+        # Project may be written by save in flight
+        self.wait_for_save()
+
+        if self.project is not None:
+            self.project.close()
+            self.project = None
+
     def handle_save_file(self):
-        canvases = list()
-        alpha_blendings = list()
+        if self.save_thread is not None:
+            return
+
+        path = self.current_file
+        width = self.current_width
+        height = self.current_height
+        # Clones share pixels with layers until they're changed, so snapshot is cheap
+        # and drawing while save is in flight doesn't change saved pixels
+        layers = [[canvas.clone(), name, alpha_blending] for canvas, name, alpha_blending in self.canvases]
+
+        if path.endswith(PROJECT_EXTENSION):
+            # Project is created on first save, later saves write only changed layers into it
+            if self.project is None:
+                self.project = ProjectFile()
+
+            project = self.project
+            current_layer = self.canvas_manager.get_current_canvas_index()
+            # Stored frames aren't changed, so they're saved as they are
+            frames = get_state_frames({"canvases": layers, "frames": self.canvas_manager.get_frames()})
+            current_frame = self.canvas_manager.get_current_frame_index()
+
+            def job(progress, is_cancelled):
+                project.save(path, width, height, layers, current_layer, progress, is_cancelled, frames, current_frame)
+        else:
+            canvases = [canvas for canvas, name, alpha_blending in layers]
+            alpha_blendings = [alpha_blending for canvas, name, alpha_blending in layers]
+
+            rect = (0, 0, width, height)
+
+            if self.auto_trim_action.isChecked():
+                content_rect = None
+
+                for canvas in canvases:
+                    content_rect = unite_rects(content_rect, canvas.get_content_rect())
 
-        for canvas, name, alpha_blending in self.canvases:
-            canvases.append(canvas)
-            alpha_blendings.append(alpha_blending)
+                # Keep whole image if there's nothing drawn
+                if content_rect is not None:
+                    rect = content_rect
 
-        data = magicautils.render_canvases(self.current_width,
-                                           self.current_height, canvases, alpha_blendings)
+            def job(progress, is_cancelled):
+                export_image(path, width, height, canvases, alpha_blendings, rect, progress, is_cancelled)
 
-        im = Image.frombytes(
-            "RGBA", (self.current_width, self.current_height), data, "raw")
+        self.start_save(job, path)
 
-        # When saving in jpeg we must convert data to RBG mode as jpeg does not supports it.
-        # Otherwise the programm will crash
-        if self.current_file.endswith(".jpg") or self.current_file.endswith(".jpeg"):
-            im = im.convert('RGB')
+    def start_save(self, job, path: str):
+        filename = path.replace("\\", "/", -1).split("/")[-1]
 
-        im.save(self.current_file)
+        self.save_thread = SaveThread(job)
+
+        # Dialog doesn't block editor and is shown only if save takes noticeable time
+        self.save_progress_dialog = QProgressDialog(f"Сохранение {filename}...", "Отмена", 0, 100, self)
+        self.save_progress_dialog.setWindowModality(Qt.WindowModality.NonModal)
+        self.save_progress_dialog.setMinimumDuration(500)
+        self.save_progress_dialog.setValue(0)
+        self.save_progress_dialog.canceled.connect(self.save_thread.cancel)
+
+        self.save_thread.progress_changed.connect(self.save_progress_dialog.setValue)
+        self.save_thread.save_failed.connect(self.handle_save_failed)
+        self.save_thread.finished.connect(self.handle_save_finished)
+        self.save_thread.start()
+
+        self.update_save_actions()
+
+    def handle_save_finished(self):
+        self.save_progress_dialog.close()
+        self.save_progress_dialog = None
+        self.save_thread = None
+
+        self.update_save_actions()
+
+    def handle_save_failed(self, message: str):
+        QMessageBox.warning(self, "Ошибка сохранения", message)
+
+    def wait_for_save(self):
+        if self.save_thread is not None:
+            self.save_thread.wait()
+            # Finish now, instead of when queued signal arrives
+            self.save_thread.finished.disconnect(self.handle_save_finished)
+            self.handle_save_finished()
+
+    def update_save_actions(self):
+        self.save_file_action.setDisabled(self.current_file is None or self.save_thread is not None)
+        self.save_as_file_action.setDisabled(self.save_thread is not None)
 
     def handle_save_as_file(self):
         filepath: QUrl = QFileDialog.getSaveFileName(
-            self, "Save Image", "./", "Images (*.png *.jpg *.jpeg *.bmp)")[0]
+            self, "Save Image", "./", "Images (*.png *.jpg *.jpeg *.bmp);;Magica Pixel project (*.mgpx)")[0]
 
         if filepath != '':
             self.current_file = filepath
-            self.save_file_action.setEnabled(True)
+            self.update_save_actions()
 
             self.handle_save_file()
 
@@ -548,6 +996,8 @@ class MainWidget(Ui_MainWindow, QWidget):
         # Sometimes you can open color picker and don't close it, forget about it, and with
         # next try opening you may be perplexed: Why it doesn't open?
         self.color_picker.hide()
+        # Drawing is done on layers of current frame, so they must be visible
+        self.stop_playback()
 
         self.mouse_state["pressed"] = True
         # Write canvas-relative coordinates instead of window-related. If you won't do that,
@@ -556,11 +1006,14 @@ class MainWidget(Ui_MainWindow, QWidget):
         self.mouse_state["canvas_start_pos"] = self.canvas_view.get_canvas_point(
             self.mouse_state["current_pos"])
 
+        # Undo patch of stroke covers only region changed since here
+        self.canvas_view.take_changed_rect()
         self.use_brush()
 
     def mouseReleaseEvent(self, ev: QtGui.QMouseEvent) -> None:
         self.mouse_state["pressed"] = False
 
+        self.current_brush.end_stroke()
         self.draw_to_canvas()
 
     def mouseMoveEvent(self, ev: QtGui.QMouseEvent) -> None:
@@ -568,7 +1021,7 @@ class MainWidget(Ui_MainWindow, QWidget):
         self.mouse_state["current_pos"] = ev.pos()
 
         if self.mouse_state["pressed"]:
-            self.canvas_view.highlight_pixel(QPoint(-1, -1))
+            self.canvas_view.remove_highlight()
             self.use_brush()
         else:
             self.canvas_view.highlight_pixel(ev.pos())
@@ -592,25 +1045,56 @@ class MainWidget(Ui_MainWindow, QWidget):
                 (self.mouse_state["current_pos"] - start_point) * 0.5)
             self.canvas_view.scale_by(0.5)
 
-        self.canvas_view.repaint()
+        self.canvas_view.request_redraw()
         self.repaint()
 
     def use_brush(self):
         if not self.current_brush.is_direct_draw_brush():
             # We need to clear canvas back to previous state
             # In other words, enable preview mode
-            self.canvas.copy_content(self.preview_canvas)
+            # Only region changed by previous preview differs from canvas, so restore just it
+            if self.preview_rect is not None:
+                self.canvas.copy_region(self.preview_canvas, *self.preview_rect)
 
-        self.current_brush.use(
-            self.canvas_view, self.mouse_state, self.current_color)
+            # Restored region is the same as in canvas again, so only new preview is part of stroke
+            self.canvas_view.take_changed_rect()
+
+            self.preview_rect = self.current_brush.use(
+                self.canvas_view, self.mouse_state, self.current_color)
+        else:
+            self.current_brush.use(
+                self.canvas_view, self.mouse_state, self.current_color)
 
     def draw_to_canvas(self):
         self.canvas_view.highlight_pixel(self.mouse_state["current_pos"])
+        # Preview becomes part of canvas
+        self.preview_rect = None
+
+        # Bounds of what stroke has drawn, comparing whole canvases on every stroke is too slow
+        rect = self.canvas_view.take_changed_rect()
+
+        # Brush didn't change anything ( f.e. color was picked )
+        if rect is None:
+            return
+
+        # Save only changed region instead of whole document
+        before = self.canvas.read_region(*rect)
         self.preview_canvas.copy_content(self.canvas)
-        self.save_state()
+
+        patch = StatePatch(self.canvas_manager.get_current_canvas_index(), rect,
+                           before, self.canvas.read_region(*rect))
+
+        self.state_manager.push_patch(patch)
+        self.document_state = self.get_state()
+
+        self.autosave.append_patch(patch.canvas_index, patch.rect, patch.after, self.document_state)
 
     def closeEvent(self, a0: QtGui.QCloseEvent) -> None:
         self.color_picker.close()
+        # Don't leave file half written
+        self.wait_for_save()
+        # Exit is normal, so there's nothing to recover on next start
+        self.autosave.stop()
         return super().closeEvent(a0)
 
 
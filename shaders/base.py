@@ -23,6 +23,9 @@ void main()
 FRAGMENT_SHADER_SOURCE = """
 #version 130
 uniform sampler2D textureSampler;
+uniform vec2 canvasSize;
+// Pixel under cursor in canvas coordinates, ( -1, -1 ) if there is no one
+uniform vec2 highlightedPixel;
 
 varying vec2 uv;
 
@@ -34,6 +37,17 @@ void main()
 {
     vec4 color = texture2D(textureSampler, uv);
 
+    if(floor(uv * canvasSize) == highlightedPixel) {
+        // Lighten dark colors and darken light ones, so highlighted pixel is always visible
+        if(color.r + color.g + color.b < 110.0 * 3.0 / 255.0) {
+            color.rgb = min(color.rgb + vec3(60.0 / 255.0), vec3(1.0));
+        } else {
+            color.rgb = max(color.rgb - vec3(60.0 / 255.0), vec3(0.0));
+        }
+
+        color.a = min(color.a + 200.0 / 255.0, 1.0);
+    }
+
     vec3 backgroundColor = vec3(0.2);
 
     if(int(gl_FragCoord.x / 10.0) % 2 + int(gl_FragCoord.y / 10.0) % 2 == 1) {
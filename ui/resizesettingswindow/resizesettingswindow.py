@@ -33,6 +33,13 @@ class Ui_ResizeSettingsWindow(object):
 "    padding: 5px 10px;\n"
 "    background: #555;\n"
 "    color: white;\n"
+"}\n"
+"\n"
+"QComboBox {\n"
+"    border: none;\n"
+"    border-radius: 5px;\n"
+"    padding: 2px 5px;\n"
+"    background: #555;\n"
 "}")
         self.widthBox = QtWidgets.QSpinBox(ResizeSettingsWindow)
         self.widthBox.setGeometry(QtCore.QRect(70, 14, 71, 21))
@@ -76,9 +83,15 @@ class Ui_ResizeSettingsWindow(object):
         self.scaleCanvasContentCheckbox = QtWidgets.QCheckBox(ResizeSettingsWindow)
         self.scaleCanvasContentCheckbox.setGeometry(QtCore.QRect(10, 70, 211, 21))
         self.scaleCanvasContentCheckbox.setObjectName("scaleCanvasContentCheckbox")
-        self.smoothScalingCheckbox = QtWidgets.QCheckBox(ResizeSettingsWindow)
-        self.smoothScalingCheckbox.setGeometry(QtCore.QRect(10, 92, 211, 21))
-        self.smoothScalingCheckbox.setObjectName("smoothScalingCheckbox")
+        self.label_5 = QtWidgets.QLabel(ResizeSettingsWindow)
+        self.label_5.setGeometry(QtCore.QRect(10, 94, 91, 16))
+        self.label_5.setObjectName("label_5")
+        self.resamplingBox = QtWidgets.QComboBox(ResizeSettingsWindow)
+        self.resamplingBox.setGeometry(QtCore.QRect(100, 92, 141, 22))
+        self.resamplingBox.setObjectName("resamplingBox")
+        self.resamplingBox.addItem("")
+        self.resamplingBox.addItem("")
+        self.resamplingBox.addItem("")
 
         self.retranslateUi(ResizeSettingsWindow)
         QtCore.QMetaObject.connectSlotsByName(ResizeSettingsWindow)
@@ -92,7 +105,10 @@ class Ui_ResizeSettingsWindow(object):
         self.keepAspectRatioCheckbox.setText(_translate("ResizeSettingsWindow", "Сохранять соотношение сторон"))
         self.label_4.setText(_translate("ResizeSettingsWindow", "Высота:"))
         self.scaleCanvasContentCheckbox.setText(_translate("ResizeSettingsWindow", "Масштабировать содержимое холста"))
-        self.smoothScalingCheckbox.setText(_translate("ResizeSettingsWindow", "Сглаженное масштабирование"))
+        self.label_5.setText(_translate("ResizeSettingsWindow", "Сглаживание:"))
+        self.resamplingBox.setItemText(0, _translate("ResizeSettingsWindow", "Нет"))
+        self.resamplingBox.setItemText(1, _translate("ResizeSettingsWindow", "Билинейное"))
+        self.resamplingBox.setItemText(2, _translate("ResizeSettingsWindow", "Усреднение"))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,409 @@
+import json
+import os
+import queue
+import shutil
+import struct
+import threading
+import time
+import zlib
+from typing import Union
+from magicautils import Canvas
+from utils.canvas_manager import get_state_frames, load_project_frames
+from utils.project_file import ProjectFile
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# Autosave keeps current document on disk, so it can be recovered after crash.
+# Session consists of checkpoint ( project file with all layers and frames, see project_file.py ) and journal,
+# where every change made after checkpoint is appended: pixels of changed region of a layer after every stroke
+# or cancelled stroke, and names and settings of layers when they change. Recovery loads checkpoint
+# and replays journal over it. Full changes of document ( f.e. added layer or switched frame ) and large
+# journal are compacted into new checkpoint, so journal always changes layers of current frame.
+#
+# Editor only puts changes into queue ( layers are snapshotted by cheap copy-on-write clones ), while
+# compression and writing are done by worker thread, which writes changes in batches and syncs file
+# once per batch. Checkpoint and journal of each generation are written into new files, and session.json,
+# that names current pair, is replaced atomically, so there's always consistent pair on disk.
+#
+# Every running editor keeps its session in its own directory and holds lock of it, that is released by OS
+# when process exits, even after crash. So session, which lock can be taken, is left by editor that didn't
+# exit normally, while sessions of other running editors are never recovered or removed.
+
+AUTOSAVE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".magicapixel", "autosave")
+SESSION_FILE = "session.json"
+LOCK_FILE = "session.lock"
+SESSION_DIRECTORY_PREFIX = "session-"
+
+# Seconds changes are collected before they're written
+FLUSH_INTERVAL = 1.0
+# Pixels journaled since checkpoint, after which document is compacted into new checkpoint
+COMPACTION_SIZE = 32 * 1024 * 1024
+
+RECORD_PATCH = 1
+RECORD_LAYERS = 2
+# Type, layer index, x, y, width, height, payload length, payload crc32
+RECORD_FORMAT = struct.Struct("<BIiiiiII")
+
+
+def pack_record(record_type: int, layer: int, rect: tuple[int, int, int, int], payload: bytes) -> bytes:
+    return RECORD_FORMAT.pack(record_type, layer, *rect, len(payload), zlib.crc32(payload)) + payload
+
+
+def lock_file(file) -> bool:
+    """
+    Locks opened file without waiting, returns False if it's locked by other process or file.
+    Lock is released when file is closed
+    """
+
+    try:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+
+    return True
+
+
+def remove_session_directory(directory: str, lock):
+    # Locked file can't be removed on Windows
+    lock.close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def claim_orphaned_session(directory: str = AUTOSAVE_DIRECTORY) -> Union[tuple[str, object], None]:
+    """
+    Returns directory of session left by editor, that didn't exit normally, and its locked lock file, that keeps
+    other editors from claiming the same session, or None if there's no such session.
+    Session must be removed by remove_session_directory() after it's recovered
+    """
+
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return None
+
+    for name in names:
+        session_directory = os.path.join(directory, name)
+
+        if not name.startswith(SESSION_DIRECTORY_PREFIX) or not os.path.isdir(session_directory):
+            continue
+
+        try:
+            lock = open(os.path.join(session_directory, LOCK_FILE), "a+b")
+        except OSError:
+            continue
+
+        # Session is still written by running editor
+        if not lock_file(lock):
+            lock.close()
+            continue
+
+        # Editor exited before its first checkpoint was written
+        if read_session(session_directory) is None:
+            remove_session_directory(session_directory, lock)
+            continue
+
+        return session_directory, lock
+
+    return None
+
+
+def read_session(directory: str) -> Union[dict, None]:
+    try:
+        with open(os.path.join(directory, SESSION_FILE), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def recover_session(directory: str) -> Union[dict, None]:
+    """
+    Returns document state ( see MainWidget.get_state() ) of session left in directory
+    or None if there's no session or its checkpoint is broken
+    """
+
+    session = read_session(directory)
+
+    if session is None:
+        return None
+
+    try:
+        project = ProjectFile.open(os.path.join(directory, session["checkpoint"]))
+    except (OSError, ValueError):
+        return None
+
+    try:
+        frames = load_project_frames(project)
+    except ValueError:
+        project.close()
+        return None
+
+    current_frame = min(project.current_frame, len(frames) - 1)
+    canvases = [[canvas, layer.name, layer.alpha_blending]
+                for canvas, layer in zip(frames[current_frame].to_canvases(), project.layers)]
+    frames[current_frame] = None
+    current_canvas = project.current_layer
+
+    # Checkpoint is replaced by the next session, so all cels are loaded before it's closed
+    project.close()
+
+    try:
+        with open(os.path.join(directory, session["journal"]), "rb") as file:
+            journal = file.read()
+    except OSError:
+        journal = b""
+
+    offset = 0
+
+    # Journal may end with partially written batch, replay stops at first broken record
+    while offset + RECORD_FORMAT.size <= len(journal):
+        record_type, layer, x, y, width, height, length, crc = RECORD_FORMAT.unpack_from(journal, offset)
+        payload = journal[offset + RECORD_FORMAT.size:offset + RECORD_FORMAT.size + length]
+
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            break
+
+        offset += RECORD_FORMAT.size + length
+
+        if record_type == RECORD_PATCH:
+            if layer >= len(canvases):
+                break
+
+            canvas: Canvas = canvases[layer][0]
+
+            if x < 0 or y < 0 or width <= 0 or height <= 0 or x + width > canvas.width or y + height > canvas.height:
+                break
+
+            canvas.write_region(x, y, width, height, zlib.decompress(payload))
+        elif record_type == RECORD_LAYERS:
+            layers = json.loads(payload)
+
+            if len(layers) != len(canvases):
+                break
+
+            for canvas_layer, (name, settings) in zip(canvases, layers):
+                canvas_layer[1] = name
+                canvas_layer[2] = settings
+
+            current_canvas = layer
+        else:
+            break
+
+    return {
+        "current_width": project.width,
+        "current_height": project.height,
+        "current_file": session["current_file"],
+        "canvases": [tuple(layer) for layer in canvases],
+        "current_canvas": min(current_canvas, len(canvases) - 1),
+        "frames": frames,
+        "current_frame": current_frame
+    }
+
+
+class Autosave:
+    def __init__(self, directory: str = AUTOSAVE_DIRECTORY):
+        # Directory of this editor's session, time keeps it unique when process id is reused
+        self.directory = os.path.join(directory, f"{SESSION_DIRECTORY_PREFIX}{os.getpid()}-{time.time_ns()}")
+        self.lock = None
+        self.queue: queue.Queue = queue.Queue()
+        self.thread: Union[threading.Thread, None] = None
+        # Pixels journaled since last checkpoint
+        self.journal_size = 0
+
+        # Used only by worker thread
+        self.project = ProjectFile()
+        self.generation = 0
+        self.journal = None
+
+    def start(self, state: dict):
+        """
+        Starts new session with checkpoint of state, replacing session left in directory
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Directory is new, so nobody else holds its lock
+        self.lock = open(os.path.join(self.directory, LOCK_FILE), "a+b")
+        lock_file(self.lock)
+
+        self.thread = threading.Thread(target=self.run, name="Autosave", daemon=True)
+        self.thread.start()
+
+        self.checkpoint(state)
+
+    def stop(self, discard: bool = True):
+        """
+        Writes queued changes and stops worker. Session is removed if "discard" is True ( f.e. on normal exit ),
+        otherwise it's unlocked and may be recovered by another editor
+        """
+
+        if self.thread is None:
+            return
+
+        self.queue.put(("stop", discard))
+        self.thread.join()
+        self.thread = None
+
+        if discard:
+            remove_session_directory(self.directory, self.lock)
+        else:
+            self.lock.close()
+
+        self.lock = None
+
+    def checkpoint(self, state: dict):
+        if self.thread is None:
+            return
+
+        self.journal_size = 0
+        # Clone layers, so later drawing doesn't change checkpoint ( cheap, as data is copied on first change )
+        layers = [[canvas.clone(), name, settings] for canvas, name, settings in state["canvases"]]
+        frames = get_state_frames({**state, "canvases": layers})
+
+        self.queue.put(("checkpoint", state["current_width"], state["current_height"], state["current_file"],
+                        layers, state["current_canvas"], frames, state.get("current_frame", 0)))
+
+    def append_patch(self, layer: int, rect: tuple[int, int, int, int], data: bytes, state: dict):
+        """
+        Journals pixels of changed region of layer.
+        :param state: document state after change, that is checkpointed instead when journal grows too large
+        """
+
+        if self.thread is None:
+            return
+
+        if self.journal_size + len(data) > COMPACTION_SIZE:
+            self.checkpoint(state)
+            return
+
+        self.journal_size += len(data)
+        self.queue.put(("patch", layer, rect, data))
+
+    def append_layers(self, canvases: list, current_layer: int):
+        """
+        Journals names and settings of layers ( f.e. after layer is renamed )
+        """
+
+        if self.thread is None:
+            return
+
+        self.queue.put(("layers", [[name, settings] for canvas, name, settings in canvases], current_layer))
+
+    def run(self):
+        stopped = False
+        discard = True
+
+        while not stopped:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + FLUSH_INTERVAL
+
+            # Collect changes for a while, so journal is synced once for many strokes
+            while batch[-1][0] != "stop":
+                timeout = deadline - time.monotonic()
+
+                if timeout <= 0:
+                    break
+
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            if batch[-1][0] == "stop":
+                stopped = True
+                discard = batch.pop()[1]
+
+            try:
+                self.write_batch(batch)
+            except OSError:
+                # Journal on disk stays consistent without the rest of changes,
+                # so journaling resumes from the next checkpoint
+                if self.journal is not None:
+                    self.journal.close()
+                    self.journal = None
+
+        # Files are removed by stop() after they're closed
+        self.close_session()
+
+    def write_batch(self, batch: list):
+        # Changes before the last checkpoint are already in it
+        checkpoints = [index for index, change in enumerate(batch) if change[0] == "checkpoint"]
+
+        if checkpoints:
+            batch = batch[checkpoints[-1]:]
+            self.write_checkpoint(*batch[0][1:])
+            batch = batch[1:]
+
+        records = list()
+
+        for change in batch:
+            if change[0] == "patch":
+                layer, rect, data = change[1:]
+                records.append(pack_record(RECORD_PATCH, layer, rect, zlib.compress(data, 1)))
+            else:
+                layers, current_layer = change[1:]
+                records.append(pack_record(RECORD_LAYERS, current_layer, (0, 0, 0, 0),
+                                           json.dumps(layers).encode("utf-8")))
+
+        if records and self.journal is not None:
+            self.journal.write(b"".join(records))
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+
+    def write_checkpoint(self, width: int, height: int, current_file: Union[str, None], layers: list,
+                         current_layer: int, frames: list, current_frame: int):
+        # Files of previous generation are kept until new session file replaces it
+        previous_session = read_session(self.directory)
+
+        self.generation += 1
+
+        checkpoint = f"checkpoint-{self.generation}.mgpx"
+        journal = f"journal-{self.generation}.bin"
+
+        # Chunks of layers unchanged since previous checkpoint are copied without compression
+        self.project.save(os.path.join(self.directory, checkpoint), width, height, layers, current_layer,
+                          frames=frames, current_frame=current_frame)
+
+        if self.journal is not None:
+            self.journal.close()
+
+        self.journal = open(os.path.join(self.directory, journal), "wb")
+
+        session = {"generation": self.generation, "checkpoint": checkpoint, "journal": journal, "current_file": current_file}
+        temporary_path = os.path.join(self.directory, SESSION_FILE + ".tmp")
+
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(session, file)
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temporary_path, os.path.join(self.directory, SESSION_FILE))
+
+        # Session on disk doesn't need files of previous generation anymore
+        if previous_session is not None:
+            for name in (previous_session.get("checkpoint"), previous_session.get("journal")):
+                if name is not None and name not in (checkpoint, journal):
+                    self.remove_file(name)
+
+    def close_session(self):
+        self.project.close()
+
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def remove_file(self, name: Union[str, None]):
+        if name is None:
+            return
+
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
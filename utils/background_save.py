@@ -0,0 +1,39 @@
+from typing import Callable
+from PyQt5.QtCore import QThread, pyqtSignal
+from utils.image_export import SaveCancelled
+
+# Runs save on worker thread, so editor doesn't freeze while large images are composited and encoded.
+# Save job gets clones of layers, which share pixels with layers until they're changed, so drawing
+# continues while save is in flight and doesn't affect saved pixels.
+
+
+class SaveThread(QThread):
+    # Percent of done work
+    progress_changed = pyqtSignal(int)
+    # Error message
+    save_failed = pyqtSignal(str)
+
+    def __init__(self, job: Callable[[Callable[[float], None], Callable[[], bool]], None]):
+        """
+        :param job: called on worker thread with progress callback ( 0-1 ) and function,
+            that returns True when save is cancelled
+        """
+
+        super().__init__()
+
+        self.job = job
+        self.cancelled = False
+
+    def run(self):
+        try:
+            self.job(self.report_progress, self.isInterruptionRequested)
+        except SaveCancelled:
+            self.cancelled = True
+        except Exception as error:
+            self.save_failed.emit(str(error))
+
+    def report_progress(self, progress: float):
+        self.progress_changed.emit(int(progress * 100))
+
+    def cancel(self):
+        self.requestInterruption()
@@ -1,8 +1,190 @@
-from typing import Any
-from magicautils import Canvas
+from typing import Any, Callable, Union
+from magicautils import Canvas, flatten_canvases
 
-# Manages with canvas layers for now, but in future it will manage also with
-# canvas frames. In other words, in future I'll add animation support.
+# Manages with canvas layers and animation frames. Every frame has its own pixels of every layer ( cel ),
+# while names and settings of layers are the same in all frames.
+# Only pixels of current frame are kept as canvases ( in "canvases" list, that is edited by editor ), other
+# frames are stored: neighbour frames of pixel-art animation differ in a few pixels, so cels of most frames
+# keep only tiles that differ from cels of keyframe, that is stored whole. Stored frames aren't changed
+# after they're created ( new ones replace them ), so they're shared by history snapshots.
+
+# Max distance from frame to its keyframe
+KEYFRAME_INTERVAL = 8
+
+
+class StoredCel:
+    def __init__(self, base: Canvas, tiles: dict[tuple[int, int, int, int], bytes]):
+        # Cel of keyframe ( or cel itself, if it's stored whole ) and RGBA pixels of tiles, that differ from it
+        self.base = base
+        self.tiles = tiles
+
+    def to_canvas(self) -> Canvas:
+        canvas = self.base.clone()
+
+        for rect, data in self.tiles.items():
+            canvas.write_region(*rect, data)
+
+        return canvas
+
+    def is_loaded(self) -> bool:
+        return True
+
+
+class ProjectStoredCel(StoredCel):
+    """
+    Cel of opened ProjectFile, that is decompressed on first access to its pixels
+    """
+
+    def __init__(self, project, cel, base_cel):
+        # ProjectCel of the cel and of its keyframe ( or None, if it's stored whole )
+        self.project = project
+        self.cel = cel
+        self.base_cel = base_cel
+        self.loaded: Union[tuple[Canvas, dict], None] = None
+
+        # Chunks are read from the mapped file, so project loads the cel before it's closed
+        project.lazy_cels.add(self)
+
+    def __reduce__(self):
+        # Pickled ( f.e. in compressed history ) as usual cel with pixels
+        return (StoredCel, (self.base, self.tiles))
+
+    @property
+    def base(self) -> Canvas:
+        return self.load()[0]
+
+    @property
+    def tiles(self) -> dict[tuple[int, int, int, int], bytes]:
+        return self.load()[1]
+
+    def is_loaded(self) -> bool:
+        return self.loaded is not None
+
+    def load(self, raise_errors: bool = False) -> tuple[Canvas, dict]:
+        """
+        :param raise_errors: raise ValueError if file is damaged. Otherwise damaged cel is left transparent,
+            as it's loaded when its frame is shown and error can't be reported to the user there
+        """
+
+        if self.loaded is None:
+            try:
+                self.loaded = self.project.load_project_cel(self.cel, self.base_cel)
+            except ValueError:
+                if raise_errors:
+                    raise
+
+                self.loaded = (Canvas(self.project.width, self.project.height), dict())
+
+            self.project.lazy_cels.discard(self)
+            self.project = self.cel = self.base_cel = None
+
+        return self.loaded
+
+
+class StoredFrame:
+    def __init__(self, cels: list[StoredCel], is_keyframe: bool):
+        self.cels = cels
+        self.is_keyframe = is_keyframe
+        # Layers flattened into one canvas for playback, with blending modes they were flattened with
+        self.flattened: Union[Canvas, None] = None
+        self.flattened_blendings: Union[list, None] = None
+
+    def __getstate__(self):
+        # Cache is cheaper to rebuild than to keep in compressed history
+        return {**self.__dict__, "flattened": None, "flattened_blendings": None}
+
+    def to_canvases(self) -> list[Canvas]:
+        return [cel.to_canvas() for cel in self.cels]
+
+    def get_flattened(self, alpha_blendings: list) -> Canvas:
+        if self.flattened is None or self.flattened_blendings != alpha_blendings:
+            self.flattened = flatten_frame(self.to_canvases(), alpha_blendings)
+            self.flattened_blendings = list(alpha_blendings)
+
+        return self.flattened
+
+
+def flatten_frame(canvases: list[Canvas], alpha_blendings: list) -> Canvas:
+    flattened = Canvas(canvases[0].width, canvases[0].height)
+    flatten_canvases(flattened, canvases, alpha_blendings)
+
+    return flattened
+
+
+def store_frame(canvases: list[Canvas], keyframe: Union[StoredFrame, None]) -> StoredFrame:
+    """
+    Stores pixels of frame layers as tiles that differ from keyframe or whole, if they differ too much
+    """
+
+    if keyframe is not None and len(keyframe.cels) == len(canvases):
+        cels = list()
+        changed_area = 0
+
+        for canvas, keyframe_cel in zip(canvases, keyframe.cels):
+            tiles = canvas.get_different_tiles(keyframe_cel.base)
+            changed_area += sum(width * height for x, y, width, height in tiles)
+
+            cels.append(StoredCel(keyframe_cel.base, {rect: canvas.read_region(*rect) for rect in tiles}))
+
+        # Frame that is mostly different becomes keyframe itself
+        if changed_area * 2 <= sum(canvas.width * canvas.height for canvas in canvases):
+            return StoredFrame(cels, False)
+
+    # Clones share pixels with canvases until they're changed
+    return StoredFrame([StoredCel(canvas.clone(), dict()) for canvas in canvases], True)
+
+
+def find_keyframe(frames: list[Union[StoredFrame, None]], index: int) -> Union[StoredFrame, None]:
+    for keyframe_index in range(index - 1, max(-1, index - KEYFRAME_INTERVAL), -1):
+        frame = frames[keyframe_index]
+
+        if frame is not None and frame.is_keyframe:
+            return frame
+
+    return None
+
+
+def load_project_frames(project) -> list[StoredFrame]:
+    """
+    Returns frames of ProjectFile, which cels are decompressed on first access ( see ProjectStoredCel ),
+    so opening doesn't depend on number of frames. Cels of current frame are decompressed at once,
+    so damaged file is reported when it's opened. Tiles shared by frames in file are shared by stored frames too,
+    so only tiles that differ from keyframe are decompressed
+    """
+
+    frames = list()
+    keyframe_index = None
+    layers_count = len(project.layers)
+
+    for index, cels in enumerate(project.frames):
+        if keyframe_index is not None and index - keyframe_index < KEYFRAME_INTERVAL:
+            keyframe_cels = project.frames[keyframe_index]
+            changed_area = sum(width * height for cel, keyframe_cel in zip(cels, keyframe_cels)
+                               for x, y, width, height in cel.get_changed_tiles(keyframe_cel))
+
+            if changed_area * 2 <= project.width * project.height * layers_count:
+                frames.append(StoredFrame([ProjectStoredCel(project, cel, keyframe_cel)
+                                           for cel, keyframe_cel in zip(cels, keyframe_cels)], False))
+                continue
+
+        frames.append(StoredFrame([ProjectStoredCel(project, cel, None) for cel in cels], True))
+        keyframe_index = index
+
+    for cel in frames[min(project.current_frame, len(frames) - 1)].cels:
+        cel.load(True)
+
+    return frames
+
+
+def get_state_frames(state: dict) -> list[list]:
+    """
+    Returns cels of every frame of state: canvases for current frame and StoredCel for others
+    """
+
+    frames = state.get("frames", [None])
+
+    return [[canvas for canvas, name, settings in state["canvases"]] if frame is None else frame.cels
+            for frame in frames]
 
 
 class CanvasManager:
@@ -12,6 +194,19 @@ class CanvasManager:
         self.canvases = canvases
         self.names = list()
         self.current_editing_canvas = 0
+        # Callbacks, that are called when layers change in a way that affects rendering
+        # ( f.e. layer is added or its settings change )
+        self.subscribers: list[Callable] = list()
+        # Stored frames, current frame is None as its pixels are in "canvases"
+        self.frames: list[Union[StoredFrame, None]] = [None]
+        self.current_frame = 0
+
+    def subscribe(self, callback: Callable):
+        self.subscribers.append(callback)
+
+    def notify_subscribers(self):
+        for callback in self.subscribers:
+            callback()
 
     def set_current_editing_canvas(self, index: int):
         if index < 0 or index >= len(self.canvases):
@@ -33,25 +228,150 @@ class CanvasManager:
 
     def set_canvas_settings(self, index: int, settings):
         self.canvases[index][2] = settings
+        self.notify_subscribers()
 
     def get_current_canvas_index(self) -> int:
         return self.current_editing_canvas
 
     def add_canvas(self, canvas: Canvas, name: str, settings):
         self.canvases.append([canvas, name, settings])
+        # Layer is empty in other frames
+        self.change_stored_cels(lambda cels: cels + [StoredCel(Canvas(canvas.width, canvas.height), dict())])
+        self.notify_subscribers()
 
     def remove_canvas(self, index: int):
         self.canvases.pop(index)
+        self.change_stored_cels(lambda cels: cels[:index] + cels[index + 1:])
 
         if self.current_editing_canvas >= len(self.canvases):
             self.current_editing_canvas = len(self.canvases) - 1
 
+        self.notify_subscribers()
+
     def move_canvas(self, index: int, destination: int):
         if destination < 0 or destination >= len(self.canvases):
             return
 
         self.canvases.insert(destination, self.canvases.pop(index))
 
+        def move_cel(cels: list[StoredCel]) -> list[StoredCel]:
+            cels = list(cels)
+            cels.insert(destination, cels.pop(index))
+
+            return cels
+
+        self.change_stored_cels(move_cel)
+        self.notify_subscribers()
+
+    def change_stored_cels(self, change: Callable[[list[StoredCel]], list[StoredCel]]):
+        # Stored frames may be shared with history, so they're replaced instead of being changed
+        for index, frame in enumerate(self.frames):
+            if frame is not None:
+                self.frames[index] = StoredFrame(change(frame.cels), frame.is_keyframe)
+
+    def get_frames_count(self) -> int:
+        return len(self.frames)
+
+    def get_current_frame_index(self) -> int:
+        return self.current_frame
+
+    def get_frames(self) -> list[Union[StoredFrame, None]]:
+        """
+        Returns stored frames with None in place of current frame, f.e. for state snapshot
+        """
+
+        return list(self.frames)
+
+    def set_frames(self, frames: list[Union[StoredFrame, None]], current_frame: int):
+        """
+        Replaces frames, pixels of current frame must be put into "canvases" by caller
+        """
+
+        self.frames = list(frames)
+        self.current_frame = current_frame
+
+    def store_current_frame(self):
+        self.frames[self.current_frame] = store_frame([canvas for canvas, name, settings in self.canvases],
+                                                      find_keyframe(self.frames, self.current_frame))
+
+    def activate_frame(self, index: int):
+        # Every frame must be stored at this moment
+        for layer, canvas in zip(self.canvases, self.frames[index].to_canvases()):
+            layer[0] = canvas
+
+        self.frames[index] = None
+        self.current_frame = index
+        self.notify_subscribers()
+
+    def set_current_frame(self, index: int):
+        if index < 0 or index >= len(self.frames) or index == self.current_frame:
+            return
+
+        self.store_current_frame()
+        self.activate_frame(index)
+
+    def add_frame(self, duplicate: bool = False):
+        """
+        Inserts frame after current one and makes it current. New frame is empty or copy of current frame
+        """
+
+        self.store_current_frame()
+
+        if duplicate:
+            frame = self.frames[self.current_frame]
+        else:
+            frame = StoredFrame([StoredCel(Canvas(canvas.width, canvas.height), dict())
+                                 for canvas, name, settings in self.canvases], True)
+
+        self.frames.insert(self.current_frame + 1, frame)
+        self.activate_frame(self.current_frame + 1)
+
+    def remove_frame(self, index: int):
+        # Stored frames refer to pixels of their keyframes, so they stay valid without them
+        if len(self.frames) == 1 or index < 0 or index >= len(self.frames):
+            return
+
+        self.frames.pop(index)
+
+        if index == self.current_frame:
+            self.activate_frame(min(index, len(self.frames) - 1))
+        elif index < self.current_frame:
+            self.current_frame -= 1
+
+    def resize_frames(self, width: int, height: int, resize_canvas_contents: bool, resampling: str):
+        """
+        Resizes stored frames, canvases of current frame must be resized by caller
+        """
+
+        for index, frame in enumerate(self.frames):
+            if frame is None:
+                continue
+
+            base = frame.cels[0].base
+
+            if not resize_canvas_contents and (base.width, base.height) == (width, height):
+                continue
+
+            canvases = frame.to_canvases()
+
+            for canvas in canvases:
+                canvas.resize(width, height, resize_canvas_contents, resampling)
+
+            # Frames are stored in order, so keyframe is already resized
+            self.frames[index] = store_frame(canvases, find_keyframe(self.frames[:index], index))
+
+    def get_flattened_frame(self, index: int) -> Canvas:
+        """
+        Returns layers of frame flattened into one canvas. Flattenings of stored frames are cached
+        """
+
+        alpha_blendings = [settings for canvas, name, settings in self.canvases]
+
+        if self.frames[index] is None:
+            return flatten_frame([canvas for canvas, name, settings in self.canvases], alpha_blendings)
+
+        return self.frames[index].get_flattened(alpha_blendings)
+
     # Returns tuple with lists of canvases, their names and settings.
     # Needed for render_canvases to pass list of canvases and list of their settings.
     def get_canvases(self):
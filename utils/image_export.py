@@ -0,0 +1,100 @@
+import os
+from typing import Callable, Union
+from PIL import Image
+from magicautils import Canvas, render_canvases_into
+from utils.rect import Rect
+
+# Exports layers into image file. Doesn't use Qt, so it can run on worker thread or in other process:
+# layers are composited band by band ( rendering releases the GIL ), so progress is reported and
+# cancellation is checked between bands, and file is written aside and renamed only after it's complete.
+
+# Rows composited at once
+EXPORT_BAND_HEIGHT = 256
+# Part of progress taken by compositing, the rest is taken by encoding
+RENDER_PROGRESS = 0.3
+
+
+class SaveCancelled(Exception):
+    pass
+
+
+def check_cancelled(is_cancelled: Union[Callable[[], bool], None]):
+    if is_cancelled is not None and is_cancelled():
+        raise SaveCancelled()
+
+
+class CancellableWriter:
+    """
+    File wrapper, that stops encoder when save is cancelled
+    """
+
+    def __init__(self, file, is_cancelled: Union[Callable[[], bool], None]):
+        self.file = file
+        self.is_cancelled = is_cancelled
+
+    def write(self, data) -> int:
+        check_cancelled(self.is_cancelled)
+
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def export_image(path: str, width: int, height: int, canvases: list[Canvas], alpha_blendings: list[int],
+                 rect: Rect = None, progress: Union[Callable[[float], None], None] = None,
+                 is_cancelled: Union[Callable[[], bool], None] = None):
+    """
+    Composites canvases and saves them into image file, format is chosen by file extension.
+    :param rect: (x, y, width, height) region to save, whole canvas by default
+    :param progress: called with part of done work ( 0-1 )
+    :param is_cancelled: polled during save, raises SaveCancelled when it returns True
+    """
+
+    x, y, rect_width, rect_height = rect if rect is not None else (0, 0, width, height)
+    extension = os.path.splitext(path)[1].lower()
+    image_format = Image.registered_extensions().get(extension)
+
+    if image_format is None:
+        raise ValueError(f"{path}: Unknown image format.")
+
+    data = bytearray(rect_width * rect_height * 4)
+    view = memoryview(data)
+
+    for band_y in range(0, rect_height, EXPORT_BAND_HEIGHT):
+        check_cancelled(is_cancelled)
+
+        band_height = min(EXPORT_BAND_HEIGHT, rect_height - band_y)
+        offset = band_y * rect_width * 4
+
+        render_canvases_into(view[offset:offset + band_height * rect_width * 4], width, height,
+                             canvases, alpha_blendings, x, y + band_y, rect_width, band_height)
+
+        if progress is not None:
+            progress((band_y + band_height) / rect_height * RENDER_PROGRESS)
+
+    view.release()
+
+    im = Image.frombuffer("RGBA", (rect_width, rect_height), data, "raw", "RGBA", 0, 1)
+
+    # When saving in jpeg we must convert data to RBG mode as jpeg does not supports it.
+    # Otherwise the programm will crash
+    if extension in (".jpg", ".jpeg"):
+        im = im.convert("RGB")
+
+    # Keep old file until new one is written completely
+    temporary_path = path + ".tmp"
+
+    try:
+        with open(temporary_path, "wb") as file:
+            im.save(CancellableWriter(file, is_cancelled), format=image_format)
+
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+        raise
+
+    if progress is not None:
+        progress(1.0)
@@ -0,0 +1,24 @@
+from PIL import Image
+from magicautils import Canvas
+
+# Loads images into canvases. Doesn't use Qt, so it's shared by editor and batch processing.
+
+
+def load_image(canvas: Canvas, im: Image.Image):
+    """
+    Loads image pixels into canvas of the same size
+    """
+
+    if im.mode in ("RGBA", "RGB", "L", "LA") or (im.mode == "P" and "transparency" not in im.info):
+        canvas.load_bytes(im.tobytes(), im.mode, im.getpalette())
+    else:
+        # Let PIL convert modes we don't support natively ( f.e. "CMYK" or "P" with transparency )
+        canvas.load_bytes(im.convert("RGBA").tobytes())
+
+
+def open_image(path: str) -> Canvas:
+    with Image.open(path) as im:
+        canvas = Canvas(im.width, im.height)
+        load_image(canvas, im)
+
+    return canvas
@@ -0,0 +1,509 @@
+import mmap
+import os
+import struct
+import weakref
+import zlib
+from typing import Callable, Union
+from magicautils import Canvas
+from utils.image_export import check_cancelled
+
+# Magica Pixel project file ( *.mgpx ), that keeps layers with their names and blending modes
+# and pixels of every layer in every animation frame ( cel ).
+# File consists of fixed size header, compressed chunks of cel tiles and layer table:
+#
+#   header      magic, format version, offset, length and crc32 of layer table
+#   chunks      zlib compressed RGBA pixels of non-empty tiles of all cels
+#   table       document size, current layer, current frame, name and blending mode of every layer
+#               and for every cel (x, y, width, height, offset, length) of every stored tile
+#
+# Cels of neighbour frames usually differ in a few tiles, so they refer to the same chunks for the rest.
+# Version 1 files have no frames, every layer keeps its tiles next to its name.
+#
+# Opening reads only the header and the table through memory map, pixels of a cel are decompressed
+# when the cel is loaded for the first time ( see ProjectStoredCel in canvas_manager.py ). Saving into the opened file appends chunks of changed
+# tiles and new table to the end of file and then switches header to the new table, so unchanged layers
+# aren't written again and the old table stays valid until the header is written. Chunks that are no
+# longer referenced are dropped by rewriting the whole file when they take more space than live data.
+
+PROJECT_EXTENSION = ".mgpx"
+
+MAGIC = b"MGPX"
+FORMAT_VERSION = 2
+
+HEADER_FORMAT = struct.Struct("<4sHHQQI")
+HEADER_SIZE = 32
+TABLE_HEADER_FORMAT = struct.Struct("<IIIIII")
+LAYER_FORMAT = struct.Struct("<Hi")
+CEL_FORMAT = struct.Struct("<I")
+TILE_FORMAT = struct.Struct("<IIIIQI")
+# Table of version 1 files
+TABLE_HEADER_FORMAT_V1 = struct.Struct("<IIII")
+LAYER_FORMAT_V1 = struct.Struct("<HiI")
+
+# Pixel art compresses well even with the fastest level, and saving stays fast for large canvases
+COMPRESSION_LEVEL = 1
+
+
+class ProjectLayer:
+    def __init__(self, name: str, alpha_blending: int):
+        self.name = name
+        self.alpha_blending = alpha_blending
+
+
+class ProjectCel:
+    def __init__(self, tiles: dict):
+        # Stored chunks by (x, y, width, height) of tile, tiles without chunk are transparent
+        self.tiles: dict[tuple[int, int, int, int], tuple[int, int]] = tiles
+        # Clone of cel, which pixels are stored in the file, or None until cel is loaded whole.
+        # Clone shares pixels with the layer in editor until it's changed, so cels that are
+        # still the same are found by their buffer_id without comparing pixels
+        self.canvas: Union[Canvas, None] = None
+
+    def get_changed_tiles(self, base: "ProjectCel") -> list[tuple[int, int, int, int]]:
+        """
+        Returns tiles, which chunks differ from chunks of "base", without decompressing them
+        """
+
+        return [rect for rect in self.tiles.keys() | base.tiles.keys() if self.tiles.get(rect) != base.tiles.get(rect)]
+
+
+class ProjectFile:
+    def __init__(self):
+        self.path: Union[str, None] = None
+        self.width = 0
+        self.height = 0
+        self.current_layer = 0
+        self.current_frame = 0
+        self.layers: list[ProjectLayer] = list()
+        # Cels of every layer by frame
+        self.frames: list[list[ProjectCel]] = list()
+        # Stored chunks of tiles, that differ from keyframe ( see StoredCel ), by id of their pixels.
+        # Pixels are kept with chunk, so their id isn't reused while they're stored
+        self.delta_chunks: dict[int, tuple[bytes, tuple[int, int]]] = dict()
+        self.file = None
+        self.view: Union[mmap.mmap, None] = None
+        self.table_length = 0
+        # Chunks copied into rewritten file by their old (offset, length), as many cels may refer to one chunk
+        self.copied_chunks: dict[tuple[int, int], tuple[int, int]] = dict()
+        # Cels, that are decompressed on first access. Their chunks are read from the mapped file,
+        # so they're loaded before the file is closed
+        self.lazy_cels: weakref.WeakSet = weakref.WeakSet()
+
+    @classmethod
+    def open(cls, path: str) -> "ProjectFile":
+        """
+        Opens project and reads its layer table, cels are decompressed by load_cel()
+        """
+
+        project = cls()
+        project.path = path
+
+        try:
+            project.map_file()
+            project.read_table()
+        except BaseException:
+            project.close()
+            raise
+
+        return project
+
+    def close(self):
+        self.load_lazy_cels()
+
+        if self.view is not None:
+            self.view.close()
+            self.view = None
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def map_file(self):
+        self.close()
+
+        self.file = open(self.path, "rb")
+        self.view = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read_table(self):
+        if len(self.view) < HEADER_SIZE:
+            raise ValueError(f"{self.path}: File is too short to be a project.")
+
+        magic, version, flags, table_offset, table_length, table_crc = HEADER_FORMAT.unpack_from(self.view, 0)
+
+        if magic != MAGIC:
+            raise ValueError(f"{self.path}: File is not a project.")
+
+        if version > FORMAT_VERSION:
+            raise ValueError(f"{self.path}: Project has version {version}, but only versions up to {FORMAT_VERSION} are supported.")
+
+        table = memoryview(self.view)[table_offset:table_offset + table_length]
+        self.table_length = table_length
+
+        try:
+            if len(table) != table_length or zlib.crc32(table) != table_crc:
+                raise ValueError(f"{self.path}: Layer table is damaged.")
+
+            if version == 1:
+                self.read_table_v1(table)
+            else:
+                self.read_table_v2(table)
+        except (struct.error, UnicodeDecodeError) as error:
+            raise ValueError(f"{self.path}: Layer table is damaged ( {error} ).")
+        finally:
+            table.release()
+
+    def read_table_v1(self, table: memoryview):
+        self.width, self.height, self.current_layer, layers_count = TABLE_HEADER_FORMAT_V1.unpack_from(table, 0)
+        offset = TABLE_HEADER_FORMAT_V1.size
+
+        self.current_frame = 0
+        self.layers = list()
+        self.frames = [list()]
+
+        for i in range(layers_count):
+            name_length, alpha_blending, tiles_count = LAYER_FORMAT_V1.unpack_from(table, offset)
+            offset += LAYER_FORMAT_V1.size
+
+            name = bytes(table[offset:offset + name_length]).decode("utf-8")
+            offset += name_length
+
+            tiles, offset = self.read_tiles(table, offset, tiles_count)
+
+            self.layers.append(ProjectLayer(name, alpha_blending))
+            self.frames[0].append(ProjectCel(tiles))
+
+    def read_table_v2(self, table: memoryview):
+        (self.width, self.height, self.current_layer, layers_count,
+         frames_count, self.current_frame) = TABLE_HEADER_FORMAT.unpack_from(table, 0)
+        offset = TABLE_HEADER_FORMAT.size
+
+        self.layers = list()
+        self.frames = list()
+
+        for i in range(layers_count):
+            name_length, alpha_blending = LAYER_FORMAT.unpack_from(table, offset)
+            offset += LAYER_FORMAT.size
+
+            name = bytes(table[offset:offset + name_length]).decode("utf-8")
+            offset += name_length
+
+            self.layers.append(ProjectLayer(name, alpha_blending))
+
+        for frame_index in range(frames_count):
+            cels = list()
+
+            for i in range(layers_count):
+                tiles_count, = CEL_FORMAT.unpack_from(table, offset)
+                tiles, offset = self.read_tiles(table, offset + CEL_FORMAT.size, tiles_count)
+                cels.append(ProjectCel(tiles))
+
+            self.frames.append(cels)
+
+    def read_tiles(self, table: memoryview, offset: int, tiles_count: int) -> tuple[dict, int]:
+        tiles_length = tiles_count * TILE_FORMAT.size
+        tiles = {
+            (x, y, width, height): (chunk_offset, chunk_length)
+            for x, y, width, height, chunk_offset, chunk_length
+            in TILE_FORMAT.iter_unpack(table[offset:offset + tiles_length])
+        }
+
+        return tiles, offset + tiles_length
+
+    def read_chunk(self, chunk: tuple[int, int]) -> bytes:
+        offset, length = chunk
+
+        try:
+            return zlib.decompress(self.view[offset:offset + length])
+        except zlib.error as error:
+            raise ValueError(f"{self.path}: Chunk at {offset} is damaged ( {error} ).")
+
+    def load_cel(self, frame: int, layer: int, base_frame: Union[int, None] = None) -> tuple[Canvas, dict]:
+        """
+        Returns pixels of layer in frame as canvas and tiles ( see StoredCel ).
+        If "base_frame" is None, canvas has all pixels of the cel and tiles are empty, otherwise canvas has
+        pixels of cel in "base_frame" and only tiles, which chunks differ from it, are decompressed
+        """
+
+        base = None if base_frame is None else self.frames[base_frame][layer]
+
+        return self.load_project_cel(self.frames[frame][layer], base)
+
+    def load_project_cel(self, cel: ProjectCel, base: Union[ProjectCel, None] = None) -> tuple[Canvas, dict]:
+        """
+        The same as load_cel(), but takes cels themselves, so they can be loaded after the table is replaced by save
+        """
+
+        if base is None:
+            if cel.canvas is None:
+                canvas = Canvas(self.width, self.height)
+
+                for rect, chunk in cel.tiles.items():
+                    canvas.write_region(*rect, self.read_chunk(chunk))
+
+                cel.canvas = canvas
+
+            return cel.canvas.clone(), dict()
+
+        base_canvas, base_tiles = self.load_project_cel(base)
+        tiles = dict()
+
+        for rect in cel.get_changed_tiles(base):
+            chunk = cel.tiles.get(rect)
+
+            if chunk is None:
+                # Tile is transparent in this frame
+                tiles[rect] = bytes(rect[2] * rect[3] * 4)
+            else:
+                tiles[rect] = self.read_chunk(chunk)
+                self.delta_chunks[id(tiles[rect])] = (tiles[rect], chunk)
+
+        return base_canvas, tiles
+
+    def load_lazy_cels(self):
+        for cel in list(self.lazy_cels):
+            cel.load()
+
+        self.lazy_cels.clear()
+
+    def get_live_size(self) -> int:
+        chunks = {chunk for cels in self.frames for cel in cels for chunk in cel.tiles.values()}
+
+        return HEADER_SIZE + self.table_length + sum(length for offset, length in chunks)
+
+    def find_saved_cel(self, canvas: Canvas, frame: int, layer: int) -> Union[ProjectCel, None]:
+        # Layer may be moved, so first look for the cel with the same pixels
+        for cels in self.frames:
+            for cel in cels:
+                if cel.canvas is not None and cel.canvas.buffer_id == canvas.buffer_id:
+                    return cel
+
+        # Cel of the same layer in the same or the nearest previous frame, that is loaded whole ( f.e. keyframe
+        # of the frame ), shares most of tiles with the cel
+        for cels in reversed(self.frames[:frame + 1]):
+            if layer < len(cels) and cels[layer].canvas is not None:
+                return cels[layer]
+
+        return None
+
+    def save(self, path: str, width: int, height: int, layers: list, current_layer: int = 0,
+             progress: Union[Callable[[float], None], None] = None,
+             is_cancelled: Union[Callable[[], bool], None] = None, frames: Union[list, None] = None,
+             current_frame: int = 0):
+        """
+        Saves layers into project file.
+        :param layers: list of [canvas, name, alpha_blending] of every layer
+        :param progress: called with part of done work ( 0-1 )
+        :param is_cancelled: polled between cels, raises SaveCancelled when it returns True.
+            Cancelled save leaves project unchanged
+        :param frames: cels of every layer by frame, every cel is canvas or StoredCel.
+            Only canvases of "layers" are saved as one frame by default
+        """
+
+        if frames is None:
+            frames = [[canvas for canvas, name, alpha_blending in layers]]
+
+        # Project is updated in place only when it's saved into the same file
+        # and file doesn't consist mostly of unused chunks
+        incremental = (path == self.path and self.view is not None and self.width == width and self.height == height
+                       and len(self.view) <= 2 * self.get_live_size())
+
+        if incremental:
+            file = open(path, "r+b")
+            file.seek(0, os.SEEK_END)
+        else:
+            # Write new file aside, so failed save doesn't destroy the old one
+            temporary_path = path + ".tmp"
+            file = open(temporary_path, "wb")
+            file.write(bytes(HEADER_SIZE))
+
+        saved_frames = list()
+        delta_chunks = dict()
+        self.copied_chunks = dict()
+
+        try:
+            with file:
+                table_length = self.write_file(file, width, height, layers, current_layer, frames, current_frame,
+                                               saved_frames, delta_chunks, incremental, progress, is_cancelled)
+        except BaseException:
+            # Chunks appended to the opened project aren't referenced by its table, so they're dropped by
+            # the next rewrite
+            if not incremental and os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+            raise
+
+        # Chunks of the old file aren't needed anymore
+        self.close()
+
+        if not incremental:
+            os.replace(temporary_path, path)
+
+        self.path = path
+        self.width = width
+        self.height = height
+        self.current_layer = current_layer
+        self.current_frame = current_frame
+        self.layers = [ProjectLayer(name, alpha_blending) for canvas, name, alpha_blending in layers]
+        self.frames = saved_frames
+        self.delta_chunks = delta_chunks
+        self.table_length = table_length
+
+        self.map_file()
+
+        if progress is not None:
+            progress(1.0)
+
+    def write_file(self, file, width: int, height: int, layers: list, current_layer: int, frames: list,
+                   current_frame: int, saved_frames: list[list[ProjectCel]], delta_chunks: dict,
+                   incremental: bool, progress, is_cancelled) -> int:
+        # Stored chunks of whole cels by their buffer_id, so cels shared by frames are written once
+        written: dict[int, ProjectCel] = dict()
+        cels_count = sum(len(cels) for cels in frames)
+
+        for frame_index, cels in enumerate(frames):
+            saved_cels = list()
+
+            for layer_index, cel in enumerate(cels):
+                check_cancelled(is_cancelled)
+
+                if isinstance(cel, Canvas):
+                    saved_cel = self.write_cel(file, cel, frame_index, layer_index, written, incremental)
+                else:
+                    saved_cel = self.write_cel(file, cel.base, frame_index, layer_index, written, incremental)
+
+                    if cel.tiles:
+                        saved_cel = self.write_delta(file, saved_cel, cel.tiles, delta_chunks, incremental)
+
+                saved_cels.append(saved_cel)
+
+                if progress is not None:
+                    progress((len(saved_frames) * len(cels) + layer_index + 1) / cels_count * 0.9)
+
+            saved_frames.append(saved_cels)
+
+        table = self.pack_table(width, height, current_layer, layers, saved_frames, current_frame)
+        table_offset = file.tell()
+        file.write(table)
+
+        # Header must point to the table only after table is on disk
+        file.flush()
+        os.fsync(file.fileno())
+
+        file.seek(0)
+        file.write(HEADER_FORMAT.pack(MAGIC, FORMAT_VERSION, 0, table_offset, len(table), zlib.crc32(table)))
+        file.flush()
+        os.fsync(file.fileno())
+
+        return len(table)
+
+    def write_cel(self, file, canvas: Canvas, frame: int, layer: int, written: dict, incremental: bool) -> ProjectCel:
+        if canvas.buffer_id not in written:
+            saved_cel = self.find_saved_cel(canvas, frame, layer)
+
+            cel = ProjectCel(self.write_tiles(file, canvas, saved_cel, incremental))
+            cel.canvas = canvas.clone()
+            written[canvas.buffer_id] = cel
+
+        return written[canvas.buffer_id]
+
+    def write_delta(self, file, base: ProjectCel, tiles: dict, delta_chunks: dict, incremental: bool) -> ProjectCel:
+        """
+        Returns cel, that refers to chunks of base except for tiles that differ from it
+        """
+
+        cel = ProjectCel(dict(base.tiles))
+
+        for rect, data in tiles.items():
+            if id(data) in delta_chunks:
+                cel.tiles[rect] = delta_chunks[id(data)][1]
+                continue
+
+            if id(data) in self.delta_chunks:
+                chunk = self.copy_chunk(file, self.delta_chunks[id(data)][1], incremental)
+            elif data.count(0) == len(data):
+                cel.tiles.pop(rect, None)
+                continue
+            else:
+                compressed = zlib.compress(data, COMPRESSION_LEVEL)
+                chunk = (file.tell(), len(compressed))
+                file.write(compressed)
+
+            cel.tiles[rect] = chunk
+            delta_chunks[id(data)] = (data, chunk)
+
+        return cel
+
+    def write_tiles(self, file, canvas: Canvas, saved_cel: Union[ProjectCel, None], incremental: bool) -> dict:
+        """
+        Writes chunks of cel tiles, that aren't stored yet, and returns stored chunks of all its tiles.
+        Chunks of unchanged tiles are reused in place or copied without decompression, if file is rewritten
+        """
+
+        if saved_cel is None or saved_cel.canvas.width != canvas.width or saved_cel.canvas.height != canvas.height:
+            saved_tiles = dict()
+            changed_rect = (0, 0, canvas.width, canvas.height)
+        elif saved_cel.canvas.buffer_id == canvas.buffer_id:
+            saved_tiles = saved_cel.tiles
+            changed_rect = None
+        else:
+            saved_tiles = saved_cel.tiles
+            changed_rect = canvas.get_difference_rect(saved_cel.canvas)
+
+        tiles = dict()
+
+        for tile in canvas.get_used_tiles():
+            x, y, width, height = tile
+
+            changed = changed_rect is not None and (
+                x < changed_rect[0] + changed_rect[2] and changed_rect[0] < x + width and
+                y < changed_rect[1] + changed_rect[3] and changed_rect[1] < y + height
+            )
+
+            if not changed:
+                # Tile has the same pixels as the stored one or is transparent
+                if tile in saved_tiles:
+                    tiles[tile] = self.copy_chunk(file, saved_tiles[tile], incremental)
+
+                continue
+
+            data = canvas.read_region(x, y, width, height)
+
+            # Tile may be marked as used, even if all its pixels were erased
+            if data.count(0) == len(data):
+                continue
+
+            chunk = zlib.compress(data, COMPRESSION_LEVEL)
+
+            tiles[tile] = (file.tell(), len(chunk))
+            file.write(chunk)
+
+        return tiles
+
+    def copy_chunk(self, file, chunk: tuple[int, int], incremental: bool) -> tuple[int, int]:
+        if incremental:
+            return chunk
+
+        if chunk not in self.copied_chunks:
+            offset, length = chunk
+            self.copied_chunks[chunk] = (file.tell(), length)
+
+            file.write(self.view[offset:offset + length])
+
+        return self.copied_chunks[chunk]
+
+    def pack_table(self, width: int, height: int, current_layer: int, layers: list,
+                   frames: list[list[ProjectCel]], current_frame: int) -> bytes:
+        parts = [TABLE_HEADER_FORMAT.pack(width, height, current_layer, len(layers), len(frames), current_frame)]
+
+        for canvas, name, alpha_blending in layers:
+            name = name.encode("utf-8")
+
+            parts.append(LAYER_FORMAT.pack(len(name), alpha_blending))
+            parts.append(name)
+
+        for cels in frames:
+            for cel in cels:
+                parts.append(CEL_FORMAT.pack(len(cel.tiles)))
+                parts.extend(TILE_FORMAT.pack(*tile, *chunk) for tile, chunk in cel.tiles.items())
+
+        return b"".join(parts)
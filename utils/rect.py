@@ -0,0 +1,36 @@
+from typing import Union
+
+# Rects are (x, y, width, height) tuples, the same as magicautils.Canvas.get_dirty_rect() returns.
+# None means empty rect.
+
+Rect = Union[tuple[int, int, int, int], None]
+
+
+def unite_rects(a: Rect, b: Rect) -> Rect:
+    if a is None:
+        return b
+
+    if b is None:
+        return a
+
+    x0 = min(a[0], b[0])
+    y0 = min(a[1], b[1])
+    x1 = max(a[0] + a[2], b[0] + b[2])
+    y1 = max(a[1] + a[3], b[1] + b[3])
+
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def intersect_rects(a: Rect, b: Rect) -> Rect:
+    if a is None or b is None:
+        return None
+
+    x0 = max(a[0], b[0])
+    y0 = max(a[1], b[1])
+    x1 = min(a[0] + a[2], b[0] + b[2])
+    y1 = min(a[1] + a[3], b[1] + b[3])
+
+    if x0 >= x1 or y0 >= y1:
+        return None
+
+    return (x0, y0, x1 - x0, y1 - y0)
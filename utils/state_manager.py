@@ -1,40 +1,305 @@
+import copyreg
+import pickle
+import tempfile
+import zlib
+from typing import Union
+from magicautils import Canvas
+from utils.rect import Rect
+
 # StateManager manages application's state and allows application to cancel last
-# action and recover cancelled action
+# action and recover cancelled action.
+# History consists of changes of two kinds: full snapshots of application's state
+# ( f.e. when layer is added ) and patches, that store only changed region of one layer
+# ( f.e. after drawing ), so drawing doesn't take memory for whole canvas.
+# To keep history inside memory budget, oldest changes are compressed and then moved to
+# temporary file, from where they're read back when they're restored.
+# Snapshots keep stored animation frames too ( see canvas_manager.py ), they aren't changed
+# after they're created, so they're shared by snapshots as they are.
+
+
+class StatePatch:
+    def __init__(self, canvas_index: int, rect: Rect, before: bytes, after: bytes):
+        self.canvas_index = canvas_index
+        self.rect = rect
+        # RGBA pixels of region before and after change, see Canvas.read_region()
+        self.before = before
+        self.after = after
+
+    # Returns patch that cancels this one
+    def reversed(self) -> "StatePatch":
+        return StatePatch(self.canvas_index, self.rect, self.after, self.before)
+
+
+class StateSnapshot:
+    def __init__(self, previous_state: Union[dict, None], state: dict):
+        # Previous state is kept to cancel change even if previous history entry is a patch
+        self.previous_state = previous_state
+        self.state = state
+        # Canvases counted in memory usage of history, see get_canvases()
+        self.canvases: Union[list[Canvas], None] = None
+
+    def __getstate__(self):
+        return {**self.__dict__, "canvases": None}
+
+    def get_canvases(self) -> list[Canvas]:
+        # Cels of opened project are loaded on first access ( see ProjectStoredCel ), they take no memory
+        # before it. List is kept, so snapshot is removed from memory usage with the same canvases it was added with
+        if self.canvases is None:
+            self.canvases = list()
+
+            for state in (self.previous_state, self.state):
+                if state is not None:
+                    self.canvases.extend(canvas for canvas, name, settings in state["canvases"])
+
+                    for frame in state.get("frames", list()):
+                        if frame is not None:
+                            self.canvases.extend(cel.base for cel in frame.cels if cel.is_loaded())
+
+        return self.canvases
+
+
+# Pixels of canvas, that can be pickled
+class RawCanvas:
+    def __init__(self, canvas: Canvas):
+        self.width = canvas.width
+        self.height = canvas.height
+        self.data = canvas.read_region(0, 0, canvas.width, canvas.height)
+
+
+def pickle_canvas(canvas: Canvas):
+    # Canvases of stored frames are pickled with their pixels, canvases shared by frames are pickled once
+    return (Canvas.from_bytes, (canvas.width, canvas.height, canvas.read_region(0, 0, canvas.width, canvas.height)))
+
+
+copyreg.pickle(Canvas, pickle_canvas)
+
+
+class CompressedChange:
+    def __init__(self, data: bytes):
+        self.data = data
+
+
+class SpilledChange:
+    def __init__(self, offset: int, length: int):
+        # Position of compressed change in history file
+        self.offset = offset
+        self.length = length
+
+
+def convert_state_canvases(state: Union[dict, None], convert, converted: dict) -> Union[dict, None]:
+    """
+    Returns copy of state with canvases replaced by convert(canvas).
+    :param converted: already converted canvases by id of their data, so canvases that share data
+        ( f.e. the same layer in previous and current state ) are converted once and stay shared
+    """
+
+    if state is None:
+        return None
+
+    canvases = list()
+
+    for canvas, name, settings in state["canvases"]:
+        key = canvas.buffer_id if isinstance(canvas, Canvas) else id(canvas)
+
+        if key not in converted:
+            converted[key] = convert(canvas)
+
+        canvases.append((converted[key], name, settings))
+
+    return {**state, "canvases": canvases}
+
+
+def compress_change(change: Union[StateSnapshot, StatePatch]) -> bytes:
+    if isinstance(change, StateSnapshot):
+        converted = dict()
+        change = StateSnapshot(
+            convert_state_canvases(change.previous_state, RawCanvas, converted),
+            convert_state_canvases(change.state, RawCanvas, converted))
+
+    # Pixel art consists of large areas of the same color, so even fastest compression level shrinks it a lot
+    return zlib.compress(pickle.dumps(change), 1)
+
+
+def decompress_change(data: bytes) -> Union[StateSnapshot, StatePatch]:
+    change = pickle.loads(zlib.decompress(data))
+
+    if isinstance(change, StateSnapshot):
+        def to_canvas(raw: RawCanvas):
+            return Canvas.from_bytes(raw.width, raw.height, raw.data)
+
+        converted = dict()
+        change = StateSnapshot(
+            convert_state_canvases(change.previous_state, to_canvas, converted),
+            convert_state_canvases(change.state, to_canvas, converted))
+
+    return change
+
 
 class StateManager:
-    def __init__(self):
-        self.states = list()
+    def __init__(self, compression_threshold: int = 64 * 2 ** 20, memory_budget: int = 256 * 2 ** 20):
+        """
+        :param compression_threshold: size of history in memory in bytes, after which oldest changes are compressed
+        :param memory_budget: size of history in memory in bytes, after which oldest changes are moved to disk
+        """
+
+        self.states: list[Union[StateSnapshot, StatePatch, CompressedChange, SpilledChange]] = list()
         self.current_state_index = -1
 
-    def push_state(self, state):
+        self.compression_threshold = compression_threshold
+        self.memory_budget = memory_budget
+
+        # Changes are compressed and spilled from the oldest one, so these are numbers of first
+        # changes that are compressed ( or spilled ) and spilled
+        self.compressed_count = 0
+        self.spilled_count = 0
+
+        # Canvases of snapshots share data, so it's counted once: id of data -> [references, size]
+        self.canvas_buffers: dict[int, list[int]] = dict()
+        self.canvases_memory = 0
+        # Memory taken by patches and compressed changes
+        self.changes_memory = 0
+
+        # Created when first change is spilled, removed by system when it's closed
+        self.history_file = None
+        self.disk_usage = 0
+
+    def set_budget(self, compression_threshold: int, memory_budget: int):
+        self.compression_threshold = compression_threshold
+        self.memory_budget = memory_budget
+
+        self.enforce_budget()
+
+    def get_memory_usage(self) -> int:
+        return self.canvases_memory + self.changes_memory
+
+    def get_disk_usage(self) -> int:
+        return self.disk_usage
+
+    def push_state(self, state: dict, previous_state: Union[dict, None] = None):
+        self.push_change(StateSnapshot(previous_state, state))
+
+    def push_patch(self, patch: StatePatch):
+        self.push_change(patch)
+
+    def push_change(self, change: Union[StateSnapshot, StatePatch]):
         # "Hard" delete all "soft" deleted states
         if self.current_state_index < len(self.states) - 1:
-            self.states = self.states[:self.current_state_index + 1]
+            self.remove_changes(self.current_state_index + 1)
 
-        self.states.append(state)
+        self.states.append(change)
         self.current_state_index += 1
 
-    def pop_state(self):
+        self.count_change(change, 1)
+        self.enforce_budget()
+
+    # Returns state or patch that has to be applied to cancel last change, or None if
+    # there's nothing to cancel. Patch's "after" pixels are the ones to write.
+    def pop_state(self) -> Union[dict, StatePatch, None]:
+        # First state is the starting point, so it can't be cancelled
         if self.current_state_index <= 0:
-            self.current_state_index = -1
             return None
 
         # Do "soft" deletion of state to have ability recover it
+        change = self.load_change(self.current_state_index)
         self.current_state_index -= 1
 
-        return self.states[self.current_state_index]
+        if isinstance(change, StatePatch):
+            return change.reversed()
 
-    def recover_last_state(self):
+        return change.previous_state
+
+    # Returns state or patch that has to be applied to recover cancelled change, or None if
+    # there's nothing to recover
+    def recover_last_state(self) -> Union[dict, StatePatch, None]:
         if self.current_state_index >= len(self.states) - 1:
             return None
 
         # Recover "soft" deleted state
         self.current_state_index += 1
+        change = self.load_change(self.current_state_index)
+
+        if isinstance(change, StatePatch):
+            return change
+
+        return change.state
+
+    def load_change(self, index: int) -> Union[StateSnapshot, StatePatch]:
+        change = self.states[index]
+
+        if isinstance(change, SpilledChange):
+            self.history_file.seek(change.offset)
+            change = CompressedChange(self.history_file.read(change.length))
+
+        if isinstance(change, CompressedChange):
+            change = decompress_change(change.data)
+
+        return change
+
+    def remove_changes(self, start: int):
+        for change in self.states[start:]:
+            self.count_change(change, -1)
+
+        self.states = self.states[:start]
+        self.compressed_count = min(self.compressed_count, start)
+        self.spilled_count = min(self.spilled_count, start)
+
+        # Spilled changes are written in order, so the file can be cut after the last remaining one
+        if self.history_file is not None:
+            if self.spilled_count > 0:
+                last = self.states[self.spilled_count - 1]
+                self.disk_usage = last.offset + last.length
+            else:
+                self.disk_usage = 0
+
+            self.history_file.truncate(self.disk_usage)
+
+    def count_change(self, change, sign: int):
+        """
+        Adds ( sign = 1 ) or removes ( sign = -1 ) memory taken by change from memory usage
+        """
+
+        if isinstance(change, StatePatch):
+            self.changes_memory += sign * (len(change.before) + len(change.after))
+        elif isinstance(change, CompressedChange):
+            self.changes_memory += sign * len(change.data)
+        elif isinstance(change, StateSnapshot):
+            for canvas in change.get_canvases():
+                buffer = self.canvas_buffers.setdefault(
+                    canvas.buffer_id, [0, canvas.width * canvas.height * 4])
+
+                if buffer[0] == 0:
+                    self.canvases_memory += buffer[1]
+
+                buffer[0] += sign
+
+                if buffer[0] == 0:
+                    self.canvases_memory -= buffer[1]
+                    del self.canvas_buffers[canvas.buffer_id]
+
+    def enforce_budget(self):
+        # Oldest changes are the least likely to be restored, so they're compressed and spilled first
+        while self.get_memory_usage() > self.compression_threshold and self.compressed_count < len(self.states):
+            change = self.states[self.compressed_count]
+            compressed = CompressedChange(compress_change(change))
+
+            self.count_change(change, -1)
+            self.count_change(compressed, 1)
+            self.states[self.compressed_count] = compressed
+            self.compressed_count += 1
+
+        while self.get_memory_usage() > self.memory_budget and self.spilled_count < self.compressed_count:
+            self.spill_change(self.spilled_count)
+            self.spilled_count += 1
+
+    def spill_change(self, index: int):
+        change = self.states[index]
+
+        if self.history_file is None:
+            self.history_file = tempfile.TemporaryFile(prefix="magicapixel-history-")
 
-        # If all states are "soft" deleted and we're in starting point now, then automatically move to
-        # second state. If you won't do that, you have to recover last state two times to go to first
-        # state change.
-        if self.current_state_index == 0 and len(self.states) > 1:
-            self.current_state_index = 1
+        self.history_file.seek(self.disk_usage)
+        self.history_file.write(change.data)
 
-        return self.states[self.current_state_index]
+        self.count_change(change, -1)
+        self.states[index] = SpilledChange(self.disk_usage, len(change.data))
+        self.disk_usage += len(change.data)
@@ -6,7 +6,8 @@ from PyQt5.QtGui import QPaintEvent, QPainter, QColor, QImage
 from PyQt5.QtCore import QPoint, QObject, QPointF, QSize, QRect
 import OpenGL.GL as gl
 from shaders.base import VERTEX_SHADER_SOURCE, FRAGMENT_SHADER_SOURCE
-from magicautils import Canvas, render_canvases
+from magicautils import Canvas, render_canvases_into, flatten_canvases
+from utils.rect import Rect, unite_rects, intersect_rects
 import constants.blending as AlphaBlendingModes
 
 
@@ -21,7 +22,32 @@ class CanvasView(QOpenGLWidget):
         self.preview_canvas = preview_canvas
         self.previewing_canvas = 0
         self.canvases = canvases
+        # Pixel under cursor is highlighted by fragment shader, so it doesn't require texture update
         self.highlighted_pixel = QPoint(-1, -1)
+        # Region of preview canvas changed by drawing functions since last take_changed_rect() call,
+        # so changes of stroke are known without comparing canvases
+        self.changed_rect: Rect = None
+        # View texture is updated only in changed regions. Full update is required when something
+        # changes in whole view ( f.e. previewing layer or canvas size )
+        self.full_update_required = True
+        self.texture_width = 0
+        self.texture_height = 0
+        # Canvases are rendered straight into mapped pixel buffer, that is kept between updates
+        self.pixel_buffer = None
+        self.pixel_buffer_size = 0
+        # Mipmaps are used only when view is scaled down, so they're regenerated lazily
+        self.mipmaps_outdated = True
+        # Redraws are requested by every input event, but view is rendered at most once per frame.
+        # Counters show how many requests were merged.
+        self.redraw_requests = 0
+        self.frames_rendered = 0
+        # While drawing only previewing layer changes, so when all layers are displayed we keep
+        # layers below and above it flattened. Cache is rebuilt after invalidate_composite_cache().
+        self.composite_cache_valid = False
+        self.composite_cache: tuple[list[Canvas], list[int]] = (list(), list())
+        self.composite_cache_preview_index = 0
+        # Flattened frame, that is shown instead of layers while animation is played
+        self.playback_canvas: Union[Canvas, None] = None
 
     # OpenGL related functions
 
@@ -74,10 +100,21 @@ class CanvasView(QOpenGLWidget):
 
         gl.glUniform1i(self.sampler_location, 0)
 
-        texture_data = self.render_canvases()
+        self.highlighted_pixel_location = gl.glGetUniformLocation(
+            program, "highlightedPixel")
+
+        gl.glUniform2f(self.highlighted_pixel_location, -1, -1)
+
+        self.pixel_buffer = gl.glGenBuffers(1)
 
         self.view_texture = self.create_texture2D(
-            self.canvas_width, self.canvas_height, texture_data)
+            self.canvas_width, self.canvas_height)
+
+        self.texture_width = self.canvas_width
+        self.texture_height = self.canvas_height
+        self.upload_region(0, 0, self.canvas_width, self.canvas_height)
+        self.full_update_required = False
+        self.reset_dirty_rects()
 
     def create_shader(self, vertex_source: str, fragment_source: str):
         vertex = gl.glCreateShader(gl.GL_VERTEX_SHADER)
@@ -115,13 +152,13 @@ class CanvasView(QOpenGLWidget):
 
         return program
 
-    def create_texture2D(self, width: int, height: int, data: bytes):
+    def create_texture2D(self, width: int, height: int):
         buffer = gl.glGenTextures(1)
 
         gl.glBindTexture(gl.GL_TEXTURE_2D, buffer)
 
         gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA, width,
-                        height, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, data)
+                        height, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, None)
 
         gl.glTexParameteri(
             gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP_TO_EDGE)
@@ -133,18 +170,88 @@ class CanvasView(QOpenGLWidget):
         gl.glTexParameteri(
             gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
 
-        gl.glGenerateMipmap(gl.GL_TEXTURE_2D)
-
         return buffer
 
-    def set_texture_data(self, texture, width: int, height: int, data: bytes):
+    def resize_texture(self, texture, width: int, height: int):
+        # Only storage is reallocated, content is uploaded by upload_region()
         gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
         gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA, width,
-                        height, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, data)
+                        height, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, None)
+
+    def upload_region(self, x: int, y: int, width: int, height: int):
+        """
+        Renders region of canvases into pixel buffer and copies it into view texture
+        """
+
+        if width <= 0 or height <= 0:
+            return
+
+        size = width * height * 4
+
+        gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, self.pixel_buffer)
+
+        if size > self.pixel_buffer_size:
+            gl.glBufferData(gl.GL_PIXEL_UNPACK_BUFFER,
+                            size, None, gl.GL_STREAM_DRAW)
+            self.pixel_buffer_size = size
+
+        # Invalidating buffer lets driver give us new memory instead of waiting for previous upload
+        pointer = gl.glMapBufferRange(gl.GL_PIXEL_UNPACK_BUFFER, 0, size,
+                                      gl.GL_MAP_WRITE_BIT | gl.GL_MAP_INVALIDATE_BUFFER_BIT)
+
+        canvases, alpha_blendings = self.get_rendering_canvases()
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.view_texture)
+
+        if not pointer:
+            # Buffer can't be mapped ( f.e. after context loss ), so region is uploaded from memory
+            gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
+
+            data = bytearray(size)
+            render_canvases_into(data, self.canvas_width, self.canvas_height,
+                                 canvases, alpha_blendings, x, y, width, height)
+
+            gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, x, y, width, height,
+                               gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, bytes(data))
+        else:
+            data = ctypes.cast(pointer, ctypes.POINTER(ctypes.c_ubyte * size)).contents
+
+            try:
+                render_canvases_into(data, self.canvas_width, self.canvas_height,
+                                     canvases, alpha_blendings, x, y, width, height)
+            finally:
+                gl.glUnmapBuffer(gl.GL_PIXEL_UNPACK_BUFFER)
+
+            # Data is read from bound pixel buffer, so pass offset in it instead of pointer
+            gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, x, y, width, height,
+                               gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+
+            gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
+
+        # Exclude outdated mipmaps, so texture stays complete until they're regenerated
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAX_LEVEL, 0)
+        self.mipmaps_outdated = True
+
+    def request_redraw(self):
+        """
+        Schedules view redraw. Changes of canvases are accumulated in their dirty rects and
+        uploaded to texture once in paintGL(), so many requests between frames cost one render.
+        """
 
-        gl.glGenerateMipmap(gl.GL_TEXTURE_2D)
+        self.redraw_requests += 1
+        # Unlike repaint(), update() doesn't paint immediately and merges multiple calls
+        self.update()
+
+    def get_redraw_counters(self) -> tuple[int, int]:
+        """
+        Returns number of redraw requests and number of rendered frames
+        """
+
+        return (self.redraw_requests, self.frames_rendered)
 
     def paintGL(self) -> None:
+        self.update_view_texture()
+        self.frames_rendered += 1
+
         gl.glClearColor(0.1, 0.1, 0.1, 1.0)
         gl.glClear(gl.GL_COLOR_BUFFER_BIT)
 
@@ -154,13 +261,22 @@ class CanvasView(QOpenGLWidget):
         gl.glUniform2f(self.shift_uniform_location,
                        self.shift.x(), self.shift.y())
         gl.glUniform2f(self.screen_size_location, self.width(), self.height())
+        gl.glUniform2f(self.highlighted_pixel_location,
+                       self.highlighted_pixel.x(), self.highlighted_pixel.y())
 
         gl.glActiveTexture(gl.GL_TEXTURE0)
         gl.glBindTexture(gl.GL_TEXTURE_2D, self.view_texture)
+
+        # Mipmaps are sampled only when view is scaled down
+        if self.scale < 1.0 and self.mipmaps_outdated:
+            gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAX_LEVEL, 1000)
+            gl.glGenerateMipmap(gl.GL_TEXTURE_2D)
+            self.mipmaps_outdated = False
+
         gl.glUniform1i(self.sampler_location, 0)
         gl.glDrawArrays(gl.GL_TRIANGLES, 0, 6)
 
-    def render_canvases(self) -> bytes:
+    def get_rendering_canvases(self) -> tuple[list[Canvas], list[int]]:
         # Create new canvases array to change current editing layer canvas
         # to preview canvas to see changes in current editing layer and don't
         # mess up original canvases array
@@ -168,31 +284,121 @@ class CanvasView(QOpenGLWidget):
         canvases = list()
         alpha_blendings = list()
 
-        if self.display_all_layers:
-            for canvas, name, alpha_blending in self.canvases:
-                canvases.append(canvas)
-                alpha_blendings.append(alpha_blending)
+        if self.playback_canvas is not None:
+            # Flattened frame already has all layers blended
+            canvases.append(self.playback_canvas)
+            alpha_blendings.append(AlphaBlendingModes.OVER)
+        elif self.display_all_layers:
+            if not self.composite_cache_valid:
+                self.rebuild_composite_cache()
 
-            canvases[self.previewing_canvas] = self.preview_canvas
+            canvases = list(self.composite_cache[0])
+            alpha_blendings = list(self.composite_cache[1])
+
+            # Blending mode of previewing layer is taken every time in case we've missed cache invalidation
+            alpha_blendings[self.composite_cache_preview_index] = self.canvases[self.previewing_canvas][2]
         else:
             canvases.append(self.preview_canvas)
             # Keep blending mode for WYSIWYG
             alpha_blendings.append(self.canvases[self.previewing_canvas][2])
 
-        texture_data: bytes = render_canvases(
-            self.canvas_width, self.canvas_height,
-            canvases, alpha_blendings,
-            self.highlighted_pixel.x(), self.highlighted_pixel.y())
+        return (canvases, alpha_blendings)
+
+    def flatten_layers(self, layers: list[list[Canvas, str, int]], into: tuple[list[Canvas], list[int]], bottom: bool):
+        """
+        Appends layers to "into" canvases and alpha blendings lists. Layers are flattened
+        into one canvas if it gives the same result as blending them one by one.
+        "bottom" must be True if layers are the lowest ones ( blended into empty image ).
+        """
+
+        if len(layers) == 0:
+            return
+
+        # Flattened lowest layers, blended as OVER onto empty image, give the same accumulated color
+        # as the layers themselves, so they may be flattened with any modes. Flattened canvas is blended
+        # as OVER, so layers above previewing one can be flattened only if all of them are OVER
+        can_flatten = bottom or all(alpha_blending == AlphaBlendingModes.OVER
+                                    for canvas, name, alpha_blending in layers)
+
+        if len(layers) == 1 or not can_flatten:
+            for canvas, name, alpha_blending in layers:
+                into[0].append(canvas)
+                into[1].append(alpha_blending)
+
+            return
+
+        flattened = Canvas(self.canvas_width, self.canvas_height)
+
+        flatten_canvases(flattened,
+                         [canvas for canvas, name, alpha_blending in layers],
+                         [alpha_blending for canvas, name, alpha_blending in layers])
+
+        into[0].append(flattened)
+        into[1].append(AlphaBlendingModes.OVER)
+
+    def rebuild_composite_cache(self):
+        self.composite_cache = (list(), list())
+
+        self.flatten_layers(
+            self.canvases[:self.previewing_canvas], self.composite_cache, True)
+
+        self.composite_cache_preview_index = len(self.composite_cache[0])
+        self.composite_cache[0].append(self.preview_canvas)
+        self.composite_cache[1].append(
+            self.canvases[self.previewing_canvas][2])
+
+        self.flatten_layers(
+            self.canvases[self.previewing_canvas + 1:], self.composite_cache, False)
 
-        return texture_data
+        self.composite_cache_valid = True
+
+    def invalidate_composite_cache(self):
+        """
+        Must be called when any layer except previewing one changes ( f.e. layer is added,
+        removed, moved or its blending mode changes )
+        """
+
+        self.composite_cache_valid = False
+        # Cache is rebuilt from scratch, so whole view must be redrawn
+        self.full_update_required = True
+
+    def get_dirty_rect(self) -> Rect:
+        """
+        Returns region of view that changed since last texture update
+        """
+
+        rect = None
+
+        for canvas in self.get_rendering_canvases()[0]:
+            rect = unite_rects(rect, canvas.get_dirty_rect())
+
+        return intersect_rects(rect, (0, 0, self.canvas_width, self.canvas_height))
+
+    def reset_dirty_rects(self):
+        for canvas in self.get_rendering_canvases()[0]:
+            canvas.reset_dirty_rect()
 
     def update_view_texture(self):
-        texture_data = self.render_canvases()
+        if self.texture_width != self.canvas_width or self.texture_height != self.canvas_height:
+            self.resize_texture(self.view_texture,
+                                self.canvas_width, self.canvas_height)
+
+            self.texture_width = self.canvas_width
+            self.texture_height = self.canvas_height
+            self.full_update_required = True
+
+        if self.full_update_required:
+            self.upload_region(0, 0, self.canvas_width, self.canvas_height)
+            self.full_update_required = False
+        else:
+            rect = self.get_dirty_rect()
+
+            if rect is None:
+                return
 
-        self.set_texture_data(
-            self.view_texture, self.canvas_width, self.canvas_height, texture_data)
+            self.upload_region(*rect)
 
-        del texture_data
+        self.reset_dirty_rects()
 
     # Canvas view related functions
 
@@ -200,11 +406,32 @@ class CanvasView(QOpenGLWidget):
         self.display_all_layers = enabled
         self.update_view()
 
+    def set_playback_canvas(self, canvas: Union[Canvas, None], rect: Rect = None):
+        """
+        Shows flattened frame instead of layers, None returns to layers.
+        :param rect: region where canvas differs from previously shown one ( empty if they're the same ),
+            whole view is updated by default
+        """
+
+        self.playback_canvas = canvas
+
+        if canvas is not None and rect is not None and not self.full_update_required:
+            # Flattened frames are shared by many playback steps, so their dirty rects are set on every step
+            canvas.reset_dirty_rect()
+
+            if rect[2] > 0 and rect[3] > 0:
+                canvas.mark_dirty(*rect)
+        else:
+            self.full_update_required = True
+
+        self.request_redraw()
+
     def set_current_previewing_layer(self, index: int):
         if index < 0 or index >= len(self.canvases):
             return
 
         self.previewing_canvas = index
+        self.invalidate_composite_cache()
 
     def shift_by(self, shift: QPoint):
         self.shift += shift
@@ -221,10 +448,12 @@ class CanvasView(QOpenGLWidget):
     def resize_view(self, width: int, height: int):
         self.canvas_width = width
         self.canvas_height = height
+        self.invalidate_composite_cache()
 
     def update_view(self):
-        self.update_view_texture()
-        self.repaint()
+        # Something changed in whole view ( f.e. layers order ), so we can't update only changed region
+        self.invalidate_composite_cache()
+        self.request_redraw()
 
     def get_canvas_point(self, mouse: QPoint) -> QPoint:
         # To avoid inaccuracy we do all calculations in float
@@ -248,10 +477,15 @@ class CanvasView(QOpenGLWidget):
             return
 
         self.preview_canvas.set_pixel(point.x(), point.y(), tuple(color))
-        self.update_view_texture()
-        self.repaint()
+        self.changed_rect = unite_rects(self.changed_rect, (point.x(), point.y(), 1, 1))
+        self.request_redraw()
+
+    def draw_line(self, p0: QPoint, p1: QPoint, color: tuple[int, int, int, int], canvas: int = 0, transform_to_canvas_relative_coordinates=True,
+                  width: int = 1, antialiased: bool = False) -> Rect:
+        """
+        Returns changed region of canvas.
+        """
 
-    def draw_line(self, p0: QPoint, p1: QPoint, color: tuple[int, int, int, int], canvas: int = 0, transform_to_canvas_relative_coordinates=True):
         start = p0
         end = p1
 
@@ -259,24 +493,83 @@ class CanvasView(QOpenGLWidget):
             start = self.get_canvas_point(p0)
             end = self.get_canvas_point(p1)
 
-        self.preview_canvas.draw_line(
-            start.x(), start.y(), end.x(), end.y(), tuple(color))
+        damage = self.preview_canvas.draw_line(
+            start.x(), start.y(), end.x(), end.y(), tuple(color), width, antialiased)
 
-        self.update_view_texture()
-        self.repaint()
+        self.changed_rect = unite_rects(self.changed_rect, damage)
+        self.request_redraw()
 
-    def fill(self, at: QPoint, color: tuple[int, int, int, int], canvas: int = 0):
+        return damage
+
+    def draw_stroke(self, points: list[QPoint], color: tuple[int, int, int, int], canvas: int = 0, transform_to_canvas_relative_coordinates=True,
+                    width: int = 1, antialiased: bool = False) -> Rect:
+        """
+        Draws polyline through points in one call and updates view once.
+        Returns changed region of canvas.
+        """
+
+        if transform_to_canvas_relative_coordinates:
+            points = [self.get_canvas_point(point) for point in points]
+
+        damage = self.preview_canvas.draw_polyline(
+            [(point.x(), point.y()) for point in points], tuple(color), width, antialiased)
+
+        self.changed_rect = unite_rects(self.changed_rect, damage)
+
+        # Nothing to redraw if stroke lies out of canvas
+        if damage is not None:
+            self.request_redraw()
+
+        return damage
+
+    def draw_stamps(self, points: list[tuple[int, int]], color: tuple[int, int, int, int], size: int, shape: str = "round",
+                    opacity: int = 255, hardness: int = 255) -> Rect:
+        """
+        Blends brush stamps at points in canvas coordinates, see Canvas.draw_stamps().
+        Returns changed region of canvas.
+        """
+
+        damage = self.preview_canvas.draw_stamps(points, tuple(color), size, shape, opacity, hardness)
+        self.changed_rect = unite_rects(self.changed_rect, damage)
+
+        if damage is not None:
+            self.request_redraw()
+
+        return damage
+
+    def fill(self, at: QPoint, color: tuple[int, int, int, int], canvas: int = 0,
+             tolerance: int = 0, connectivity: int = 4, global_fill: bool = False):
         point = self.get_canvas_point(at)
 
         if point.x() < 0 or point.x() >= self.canvas_width or point.y() < 0 or point.y() >= self.canvas_height:
             return
 
-        self.preview_canvas.fill(point.x(), point.y(), tuple(color))
+        damage = self.preview_canvas.fill(point.x(), point.y(), tuple(color),
+                                          tolerance, connectivity, global_fill)
+        self.changed_rect = unite_rects(self.changed_rect, damage)
 
-        self.update_view_texture()
-        self.repaint()
+        self.request_redraw()
+
+    def take_changed_rect(self) -> Rect:
+        """
+        Returns region of preview canvas changed by drawing functions since previous call and starts collecting again
+        """
+
+        rect = self.changed_rect
+        self.changed_rect = None
+
+        return rect
 
     def highlight_pixel(self, at: QPoint):
-        self.highlighted_pixel = self.get_canvas_point(at)
-        self.update_view_texture()
-        self.repaint()
+        self.set_highlighted_pixel(self.get_canvas_point(at))
+
+    def remove_highlight(self):
+        self.set_highlighted_pixel(QPoint(-1, -1))
+
+    def set_highlighted_pixel(self, point: QPoint):
+        # Cursor usually moves inside one pixel, so repaint only if highlighted pixel changes
+        if point == self.highlighted_pixel:
+            return
+
+        self.highlighted_pixel = point
+        self.request_redraw()
@@ -4,6 +4,10 @@ from PyQt5.QtCore import QObject, Qt
 from ui.resizesettingswindow.resizesettingswindow import Ui_ResizeSettingsWindow
 
 
+# Resampling modes of Canvas.resize() in order of resamplingBox items
+RESAMPLING_MODES = ["nearest", "bilinear", "box"]
+
+
 class ResizeSettingsWindow(Ui_ResizeSettingsWindow, QWidget):
     def __init__(self, on_done_callback: Callable, parent: QObject = None) -> None:
         super().__init__(parent)
@@ -54,18 +58,14 @@ class ResizeSettingsWindow(Ui_ResizeSettingsWindow, QWidget):
 
     def handle_done_button_clicked(self):
         scale_contents = False
-        smooth_scale = False
 
         if self.scaleCanvasContentCheckbox.checkState() == Qt.CheckState.Checked:
             scale_contents = True
 
-        if self.smoothScalingCheckbox.checkState() == Qt.CheckState.Checked:
-            smooth_scale = True
-
         self.on_done_callback(
             self.widthBox.value(),
             self.heightBox.value(),
             scale_contents,
-            smooth_scale
+            RESAMPLING_MODES[self.resamplingBox.currentIndex()]
         )
         self.close()